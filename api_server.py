@@ -0,0 +1,243 @@
+"""
+Headless HTTP API over the RAG chatbot graph.
+
+The Streamlit frontends run the graph on a backend thread and hand tokens to
+the script thread through queues, once per browser session. This ASGI app
+runs `chatbot.astream` directly on the server's event loop, so one process
+serves many concurrent conversations and several workers can sit behind a
+load balancer:
+
+    uvicorn api_server:app --host 0.0.0.0 --port 8000 --workers 4
+
+Endpoints:
+
+    POST /threads                          create a thread -> {"thread_id"}
+    GET  /threads?limit=&cursor=           threads, most recently active first
+                                           (limit 1..MAX_PAGE_SIZE, larger is clamped)
+    GET  /threads/{id}/messages?limit=&before=
+                                           latest message window of a thread
+    POST /threads/{id}/messages            {"content": "..."} -> SSE stream of
+                                           `token`, `tool`, `done` and `error` events
+    GET  /threads/{id}/turns               whether a turn runs, messages queued
+    GET  /stats                            limiter and cache metrics of this worker
+    POST /threads/{id}/documents           multipart `file` (PDF) for rag_tool
+
+Each worker opens its own connection pool (API_DB_POOL_SIZE connections) on
+the server's loop; the backend's pool belongs to the backend loop. Its saver
+is a PooledAsyncPostgresSaver: the stock AsyncPostgresSaver holds one lock
+around every query even over a pool, which would serialize the checkpoint
+reads and writes of all users. Checkpoints are always read from the
+database, without the backends' in-process checkpoint cache: the next
+message of a thread may land on another worker. Uploaded documents stay in
+the worker that ingested them (the retriever store is per process), so with
+several workers route a thread to one of them.
+"""
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from sse_starlette.sse import EventSourceResponse
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import langgraph_rag_backend as backend
+from checkpoint_serde import make_checkpoint_serde
+from context_window import ContextSummarizer
+from message_index import MESSAGE_WINDOW_SIZE, AsyncPostgresMessageIndex, MessageIndexCheckpointSaver
+from postgres_checkpoint import PooledAsyncPostgresSaver, open_async_pool
+from rate_limiter import chat_quota, embedding_quota
+from response_cache import AsyncPostgresResponseStore
+from thread_catalog import THREADS_PAGE_SIZE, AsyncPostgresThreadCatalog, CatalogCheckpointSaver, message_text
+from turn_scheduler import TurnScheduler
+
+DEFAULT_POOL_SIZE = 10
+MAX_PAGE_SIZE = 100  # larger `limit` values are clamped to this
+SSE_PING_SECONDS = 15
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    pool = await open_async_pool(
+        backend.DB_URI, max_size=int(os.environ.get("API_DB_POOL_SIZE", DEFAULT_POOL_SIZE))
+    )
+    # tables were created by the backend's own setup on import
+    checkpoint = PooledAsyncPostgresSaver(pool, serde=make_checkpoint_serde())
+    # no CachedCheckpointSaver: another worker may have written the thread since
+    checkpointer = CatalogCheckpointSaver(
+        MessageIndexCheckpointSaver(checkpoint, AsyncPostgresMessageIndex(checkpoint)),
+        AsyncPostgresThreadCatalog(checkpoint),
+    )
+    app.state.checkpointer = checkpointer
+    # chat_node's response cache talks to the database from this loop too
+    backend.response_cache.use_store(AsyncPostgresResponseStore(checkpoint))
+    # same graph as the Streamlit app, bound to this loop's checkpointer
+    app.state.chatbot = backend.graph.compile(checkpointer=checkpointer)
+    summarizer = ContextSummarizer(app.state.chatbot, backend.llm, limiter=backend.llm_limiter)
+    # a message sent while its thread is answering waits for the next turn
+    app.state.turns = TurnScheduler(app.state.chatbot, after_turn=summarizer.arefresh)
+    try:
+        yield
+    finally:
+        await pool.close()
+
+
+def _encode_cursor(cursor: Optional[tuple]) -> Optional[str]:
+    if cursor is None:
+        return None
+    updated_at, thread_id = cursor
+    return f"{updated_at.isoformat()}|{thread_id}"
+
+
+def _decode_cursor(value: Optional[str]) -> Optional[tuple]:
+    if not value:
+        return None
+    updated_at, _, thread_id = value.partition("|")
+    return datetime.fromisoformat(updated_at), thread_id
+
+
+def _thread_json(row: dict) -> dict:
+    return {**row, "updated_at": row["updated_at"].isoformat()}
+
+
+def _int_param(request: Request, name: str, default: Optional[int]) -> Optional[int]:
+    value = request.query_params.get(name)
+    return int(value) if value else default
+
+
+def _limit_param(request: Request, default: int) -> int:
+    """`limit` clamped to MAX_PAGE_SIZE; ValueError below 1."""
+    limit = _int_param(request, "limit", default)
+    if limit < 1:
+        raise ValueError(f"limit must be at least 1, got {limit}")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+async def create_thread(request: Request) -> JSONResponse:
+    thread_id = str(uuid.uuid4())
+    # listed right away, titled by its first message later
+    await request.app.state.checkpointer.catalog.aupsert(thread_id, None, 0)
+    return JSONResponse({"thread_id": thread_id}, status_code=201)
+
+
+async def list_threads(request: Request) -> JSONResponse:
+    try:
+        limit = _limit_param(request, THREADS_PAGE_SIZE)
+        before = _decode_cursor(request.query_params.get("cursor"))
+    except ValueError:
+        return JSONResponse({"error": "invalid limit or cursor"}, status_code=400)
+    page = await request.app.state.checkpointer.catalog.alist_threads_page(limit=limit, before=before)
+    return JSONResponse(
+        {
+            "threads": [_thread_json(row) for row in page.threads],
+            "next_cursor": _encode_cursor(page.next_cursor),
+        }
+    )
+
+
+async def get_messages(request: Request) -> JSONResponse:
+    thread_id = request.path_params["thread_id"]
+    try:
+        limit = _limit_param(request, MESSAGE_WINDOW_SIZE)
+        before = _int_param(request, "before", None)
+    except ValueError:
+        return JSONResponse({"error": "invalid limit or before"}, status_code=400)
+    window = await request.app.state.checkpointer.message_index.amessage_window(
+        thread_id, limit=limit, before=before
+    )
+    return JSONResponse(window._asdict())
+
+
+async def _answer_events(turns: TurnScheduler, thread_id: str, content: str):
+    config = {
+        "configurable": {"thread_id": thread_id},
+        "metadata": {"thread_id": thread_id},
+        "run_name": "chat-turn",
+    }
+    stream = turns.astream(
+        {"messages": [HumanMessage(content=content)]}, config=config, stream_mode="messages"
+    )
+    try:
+        async for message_chunk, _metadata in stream:
+            if isinstance(message_chunk, ToolMessage):
+                yield {"event": "tool", "data": json.dumps({"name": message_chunk.name or "tool"})}
+            elif isinstance(message_chunk, AIMessage):
+                if text := message_text(message_chunk.content):
+                    yield {"event": "token", "data": json.dumps({"text": text})}
+        yield {"event": "done", "data": "{}"}
+    except Exception as exc:
+        yield {"event": "error", "data": json.dumps({"error": str(exc)})}
+    finally:
+        # a client disconnect cancels this generator; the turn stops once nobody listens
+        await stream.aclose()
+
+
+async def send_message(request: Request):
+    thread_id = request.path_params["thread_id"]
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "body must be JSON"}, status_code=400)
+    content = body.get("content") if isinstance(body, dict) else None
+    if not isinstance(content, str) or not content.strip():
+        return JSONResponse({"error": "`content` is required"}, status_code=400)
+    return EventSourceResponse(
+        _answer_events(request.app.state.turns, thread_id, content), ping=SSE_PING_SECONDS
+    )
+
+
+async def get_turns(request: Request) -> JSONResponse:
+    thread_id = request.path_params["thread_id"]
+    turns = request.app.state.turns
+    return JSONResponse({"running": turns.is_running(thread_id), "queued": turns.queue_depth(thread_id)})
+
+
+async def get_stats(request: Request) -> JSONResponse:
+    return JSONResponse(
+        {
+            "turns": request.app.state.turns.stats(),
+            "llm_limiter": backend.llm_limiter.stats(),
+            "response_cache": backend.response_cache.stats(),
+            "semantic_cache": backend.semantic_cache.stats(),
+            "singleflight": backend.flights.stats(),
+            "model_router": backend.router.stats(),
+            "fast_path": backend.fast_path.stats(),
+            "model_resilience": backend.resilience.stats(),
+            "gemini_quota": {"chat": chat_quota.stats(), "embedding": embedding_quota.stats()},
+        }
+    )
+
+
+async def upload_document(request: Request) -> JSONResponse:
+    thread_id = request.path_params["thread_id"]
+    form = await request.form()
+    upload = form.get("file")
+    if upload is None or isinstance(upload, str):
+        return JSONResponse({"error": "multipart field `file` is required"}, status_code=400)
+    file_bytes = await upload.read()
+    try:
+        # PDF parsing and embedding are blocking; keep them off the event loop
+        summary = await run_in_threadpool(backend.ingest_pdf, file_bytes, thread_id, upload.filename)
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=400)
+    return JSONResponse(summary, status_code=201)
+
+
+app = Starlette(
+    routes=[
+        Route("/threads", create_thread, methods=["POST"]),
+        Route("/threads", list_threads, methods=["GET"]),
+        Route("/threads/{thread_id}/messages", get_messages, methods=["GET"]),
+        Route("/threads/{thread_id}/messages", send_message, methods=["POST"]),
+        Route("/threads/{thread_id}/turns", get_turns, methods=["GET"]),
+        Route("/threads/{thread_id}/documents", upload_document, methods=["POST"]),
+        Route("/stats", get_stats, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
@@ -1,8 +1,7 @@
 import streamlit as st
-from langgraph_database_backend import chatbot
+from langgraph_database_backend import chatbot, fetch_message_window, fetch_thread_titles, fetch_threads_page, search_threads
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 import uuid
-import sqlite3
 
 st.markdown(
     """
@@ -15,11 +14,12 @@ st.markdown(
 
 # ----------- Functionalities ----------- #
 def get_thread_id():
-    thread_id = uuid.uuid4()
-    return thread_id
+    # a str, like the ids of catalog pages and search hits
+    return str(uuid.uuid4())
 
 def reset_chat():
     st.session_state['message_history'] = []
+    st.session_state['history_before'] = None
     thread_id = get_thread_id()
     st.session_state['thread_id'] = thread_id
     for message in st.session_state['message_history']:
@@ -31,50 +31,60 @@ def add_thread(thread_id):
     if thread_id not in st.session_state['chat_threads']:
         st.session_state['chat_threads'].append(thread_id)
 
-def get_messages(thread_id):
-    config = {'configurable': {'thread_id': thread_id}}
-    if 'messages' not in chatbot.get_state(config=config).values:
-        return []
-    return chatbot.get_state(config=config).values['messages']
-
 def truncate_label(text, max_len=25):
     return text if len(text) <= max_len else text[:max_len - 3] + "..."
 
-def get_first_message(thread_id):
-    config = {'configurable': {'thread_id': thread_id}}
-    if 'messages' not in chatbot.get_state(config=config).values:
-        return truncate_label(str(thread_id))
-    return truncate_label(chatbot.get_state(config=config).values['messages'][0].content)
-
-def db_connect():
-    conn = sqlite3.connect('chatarena.db', check_same_thread=False)
-    return conn
-
-def fetch_all_threads(conn):
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    try:
-        # Try to fetch all values from the given column
-        cursor.execute("select distinct(thread_id) from checkpoints")
-        results = cursor.fetchall()
-        values = [res['thread_id'] for res in results]
-    except sqlite3.OperationalError as e:
-        # If table does not exist, return empty list
-        if "no such table" in str(e):
-            values = []
-        else:
-            raise  # re-raise other unexpected errors
-    finally:
-        conn.close()
-
-    return values
+def load_more_threads():
+    # next page of older threads from the catalog, titles included
+    page = fetch_threads_page(before=st.session_state['threads_cursor'])
+    older = []
+    for row in page.threads:
+        if row['thread_id'] not in st.session_state['chat_threads']:
+            older.append(row['thread_id'])
+        st.session_state['thread_labels'][row['thread_id']] = truncate_label(row['title'] or row['thread_id'])
+    st.session_state['chat_threads'][:0] = older[::-1]
+    st.session_state['threads_cursor'] = page.next_cursor
+
+def refresh_thread_labels():
+    # threads started in this session get their stored title in one query
+    missing = [tid for tid in st.session_state['chat_threads'] if tid not in st.session_state['thread_labels']]
+    if not missing:
+        return
+    titles = fetch_thread_titles(missing)
+    for tid in missing:
+        if titles.get(tid):
+            st.session_state['thread_labels'][tid] = truncate_label(titles[tid])
+
+def history_from_window(window):
+    # user questions and answers only: no tool results, no empty tool-call turns
+    return [
+        {'role': 'user' if m['role'] == 'human' else 'assistant', 'content': m['content']}
+        for m in window.messages
+        if m['role'] == 'human' or (m['role'] == 'ai' and m['content'])
+    ]
+
+def open_thread(thread_id):
+    # latest window only, read from the message index instead of get_state
+    st.session_state['thread_id'] = thread_id
+    window = fetch_message_window(thread_id)
+    st.session_state['message_history'] = history_from_window(window)
+    st.session_state['history_before'] = window.before
+
+def load_earlier_messages():
+    window = fetch_message_window(st.session_state['thread_id'], before=st.session_state['history_before'])
+    st.session_state['message_history'][:0] = history_from_window(window)
+    st.session_state['history_before'] = window.before
 
 # ----------- Session History ----------- #
 
 if 'message_history' not in st.session_state:
     st.session_state['message_history'] = []
 
+if st.session_state.get('history_before') is not None:
+    if st.button('Load earlier messages', key='history-load-earlier'):
+        load_earlier_messages()
+        st.rerun()
+
 for message in st.session_state['message_history']:
     with st.chat_message(message['role']):
         st.markdown(message['content'])
@@ -82,10 +92,12 @@ for message in st.session_state['message_history']:
 if 'thread_id' not in st.session_state:
     st.session_state['thread_id'] = get_thread_id()
 
-conn = db_connect()
-
+# only the most recent page of threads is loaded up front
 if 'chat_threads' not in st.session_state:
-    st.session_state['chat_threads'] = fetch_all_threads(conn=conn)
+    st.session_state['chat_threads'] = []
+    st.session_state['thread_labels'] = {}
+    st.session_state['threads_cursor'] = None
+    load_more_threads()
 
 add_thread(st.session_state['thread_id'])
 
@@ -94,21 +106,28 @@ st.sidebar.title('ChatArena')
 if st.sidebar.button('New chat'):
     reset_chat()
 
+# search every message through the backend's FTS5 index
+search_query = st.sidebar.text_input('Search chats', key='thread-search')
+if search_query.strip():
+    for hit in search_threads(search_query):
+        if st.sidebar.button(truncate_label(hit['title'] or hit['thread_id']), key=f"search-btn-{hit['thread_id']}"):
+            open_thread(hit['thread_id'])
+        st.sidebar.caption(hit['snippet'])
+
 st.sidebar.header('Coversation History')
 
+refresh_thread_labels()
+
 for i in range(len(st.session_state['chat_threads'])-1, -1, -1):
-    if st.sidebar.button(get_first_message(st.session_state['chat_threads'][i])):
-        thread_id = st.session_state['chat_threads'][i]
-        st.session_state['thread_id'] = thread_id
-        messages = get_messages(thread_id)
-        temp_messages = []
-        for message in messages:
-            if isinstance(message, HumanMessage):
-                role = 'user'
-            else:
-                role = 'assistant'
-            temp_messages.append({'role': role, 'content': message.content})
-        st.session_state['message_history'] = temp_messages
+    tid = st.session_state['chat_threads'][i]
+    label = st.session_state['thread_labels'].get(tid, truncate_label(tid))
+    if st.sidebar.button(label, key=f"thread-btn-{tid}"):
+        open_thread(tid)
+
+if st.session_state['threads_cursor'] is not None:
+    if st.sidebar.button('Load older chats', key='threads-load-more'):
+        load_more_threads()
+        st.rerun()
 
 # ----------- User input ---------- #
 
@@ -10,7 +10,7 @@ from psycopg.rows import dict_row
 from psycopg_pool import ConnectionPool
 from dotenv import load_dotenv
 import os
-import queue
+from stream_bridge import ACTIVE_STREAM_KEY, StreamHandle, cancel_stale_stream, coalesced_text
 
 load_dotenv()
 
@@ -99,11 +99,20 @@ patched = patch_langgraph_postgres_checkpointer(pool)
 
 # ------------------------------------------------------------------
 # import the module (we will also import the chatbot symbol for normal use)
-# reload it to ensure it picks up our patched checkpointer class
+# imported once per process: reloading on every rerun rebuilt the event loop,
+# the connection and the checkpoint cache the prefetcher warms. It is still
+# reloaded below if a DB call fails.
 # ------------------------------------------------------------------
 import langgraph_mcp_backend1 as lgdb
-lgdb = importlib.reload(lgdb)
-from langgraph_mcp_backend1 import chatbot, submit_async_task
+from langgraph_mcp_backend1 import (
+    chatbot,
+    turns,
+    submit_async_task,
+    retrieve_threads_page,
+    search_threads,
+    retrieve_message_window,
+    prefetch_recent_threads,
+)
 
 st.markdown(
     """
@@ -122,6 +131,7 @@ def get_thread_id():
 
 def reset_chat():
     st.session_state['message_history'] = []
+    st.session_state['history_before'] = None
     thread_id = get_thread_id()
     st.session_state['thread_id'] = thread_id
     # initialize a label for the new thread
@@ -145,27 +155,22 @@ def add_thread(thread_id, label: str | None = None):
     if thread_id not in st.session_state['thread_labels']:
         st.session_state['thread_labels'][thread_id] = truncate_label(label or str(thread_id))
 
-# Use the pool to fetch thread ids from the checkpoints table (initial load only)
-def fetch_all_threads():
-    values = []
-    try:
-        with pool.connection() as conn:
-            # updated on 04-12-2025
-            conn.autocommit = True
-            with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute("SELECT DISTINCT(thread_id) FROM checkpoints")
-                results = cur.fetchall()
-                # results may be a list of dicts because of row_factory
-                values = [str(res['thread_id']) for res in results if res.get('thread_id') is not None]
-    except Exception as e:
-        msg = str(e).lower()
-        # If table not present, return empty list silently
-        if "does not exist" in msg or "relation" in msg or "undefined table" in msg:
-            values = []
-        else:
-            # re-raise unexpected errors so you see them in logs
-            raise
-    return values
+def load_more_threads():
+    """
+    Add the next page of older threads from the backend's threads catalog.
+    Pages are newest first and the keyset cursor lives in session_state, so
+    a session starts with one page instead of every thread in the database.
+    """
+    page = retrieve_threads_page(before=st.session_state['threads_cursor'])
+    older = []
+    for row in page.threads:
+        tid = str(row['thread_id'])
+        if tid not in st.session_state['chat_threads']:
+            older.append(tid)
+        st.session_state['thread_labels'].setdefault(tid, truncate_label(row['title'] or tid))
+    # chat_threads is oldest -> newest, older pages go in front
+    st.session_state['chat_threads'][:0] = older[::-1]
+    st.session_state['threads_cursor'] = page.next_cursor
 
 # Helper to try calling chatbot.get_state and recover from a closed DB connection
 def safe_get_state(config):
@@ -222,10 +227,56 @@ def get_first_message(thread_id: str):
         return truncate_label(str(thread_id))
     return truncate_label(state.values['messages'][0].content)
 
+def history_from_window(window):
+    """message_history entries for a window of indexed messages (already plain text)."""
+    # user questions and answers only: no tool results, no empty tool-call turns
+    return [
+        {'role': 'user' if m['role'] == 'human' else 'assistant', 'content': m['content']}
+        for m in window.messages
+        if m['role'] == 'human' or (m['role'] == 'ai' and m['content'])
+    ]
+
+def open_thread(thread_id):
+    """
+    Show the latest window of a thread (sidebar or search result click).
+    Messages come from the backend's message index, so opening a long thread
+    does not deserialize its whole checkpoint.
+    """
+    st.session_state['thread_id'] = thread_id
+    try:
+        window = retrieve_message_window(thread_id)
+    except Exception as e:
+        st.error(f"Failed to load thread messages: {e}")
+        window = None
+
+    st.session_state['message_history'] = history_from_window(window) if window else []
+    st.session_state['history_before'] = window.before if window else None
+
+    # the window starts at the first message: refresh the label from it
+    if window and window.messages and window.before is None:
+        st.session_state['thread_labels'][thread_id] = truncate_label(window.messages[0]['content'])
+    else:
+        st.session_state['thread_labels'].setdefault(thread_id, truncate_label(thread_id))
+
+def load_earlier_messages():
+    window = retrieve_message_window(st.session_state['thread_id'], before=st.session_state['history_before'])
+    st.session_state['message_history'][:0] = history_from_window(window)
+    st.session_state['history_before'] = window.before
+
 # ----------- Session History ----------- #
+# a rerun while an answer was streaming (Stop, thread switch, reload)
+# abandons it: cancel the generation instead of letting it run on
+cancel_stale_stream(st.session_state)
+
 if 'message_history' not in st.session_state:
     st.session_state['message_history'] = []
 
+# only the latest window is rendered; earlier messages load on request
+if st.session_state.get('history_before') is not None:
+    if st.button('Load earlier messages', key='history-load-earlier'):
+        load_earlier_messages()
+        st.rerun()
+
 for message in st.session_state['message_history']:
     with st.chat_message(message['role']):
         st.markdown(message['content'])
@@ -233,13 +284,14 @@ for message in st.session_state['message_history']:
 if 'thread_id' not in st.session_state:
     st.session_state['thread_id'] = get_thread_id()
 
-# On first load populate chat_threads and thread_labels from DB (lightweight)
+# On first load populate chat_threads and thread_labels with the most recent page
 if 'chat_threads' not in st.session_state:
-    initial_threads = fetch_all_threads()
     st.session_state['chat_threads'] = []
     st.session_state['thread_labels'] = {}
-    for tid in initial_threads:
-        add_thread(tid, label=None)
+    st.session_state['threads_cursor'] = None
+    load_more_threads()
+    # warm the most recent threads on the backend loop while the page renders
+    prefetch_recent_threads(caller=st.session_state['thread_id'])
 
 # Ensure the current thread is present
 add_thread(st.session_state['thread_id'])
@@ -249,6 +301,15 @@ st.sidebar.title('ChatArena')
 if st.sidebar.button('New chat'):
     reset_chat()
 
+# Full-text search over every message, served by the backend's message index
+search_query = st.sidebar.text_input('Search chats', key='thread-search')
+if search_query.strip():
+    for hit in search_threads(search_query):
+        hit_id = str(hit['thread_id'])
+        if st.sidebar.button(truncate_label(hit['title'] or hit_id), key=f"search-btn-{hit_id}"):
+            open_thread(hit_id)
+        st.sidebar.caption(hit['snippet'])
+
 st.sidebar.header('Conversation History')
 
 # Render sidebar with labels from session_state only (no DB calls during render)
@@ -257,35 +318,13 @@ for i in range(len(st.session_state['chat_threads']) - 1, -1, -1):
     label = st.session_state.get('thread_labels', {}).get(tid, truncate_label(tid))
     # st.sidebar.button returns True on click; do NOT call DB while rendering other widgets
     if st.sidebar.button(label, key=f"thread-btn-{tid}"):
-        # user clicked the thread: load messages (safe to hit DB now)
-        thread_id = tid
-        st.session_state['thread_id'] = thread_id
+        open_thread(tid)
 
-        # Attempt to load messages via chatbot.get_state (keeps your existing reconnection logic)
-        try:
-            messages = get_messages(thread_id)
-        except Exception as e:
-            st.error(f"Failed to load thread messages: {e}")
-            messages = []
-
-        temp_messages = []
-        for message in messages:
-            if isinstance(message, HumanMessage):
-                role = 'user'
-            else:
-                role = 'assistant'
-            # message.content may not exist for all objects, guard it
-            content = getattr(message, "content", str(message))
-            temp_messages.append({'role': role, 'content': content})
-        st.session_state['message_history'] = temp_messages
-
-        # update the label for this thread now that we loaded messages
-        if temp_messages:
-            first = temp_messages[0]['content']
-            st.session_state['thread_labels'][thread_id] = truncate_label(first)
-        else:
-            # leave existing label or set tid
-            st.session_state['thread_labels'].setdefault(thread_id, truncate_label(thread_id))
+# Older threads are fetched one page at a time, only when asked for
+if st.session_state['threads_cursor'] is not None:
+    if st.sidebar.button('Load older chats', key='threads-load-more'):
+        load_more_threads()
+        st.rerun()
 
 # ----------- User input ---------- #
 user_input = st.chat_input('Type here')
@@ -329,54 +368,39 @@ if user_input:
         # Use a mutable holder so the generator can set/modify it
         status_holder = {"box": None}
 
-        def ai_only_stream():
-            event_queue: queue.Queue = queue.Queue()
-
-            async def run_stream():
-                try:
-                    async for message_chunk, metadata in chatbot.astream(
-                        {"messages": [HumanMessage(content=user_input)]},
-                        config=config,
-                        stream_mode="messages",
-                    ):
-                        event_queue.put((message_chunk, metadata))
-                except Exception as exc:
-                    event_queue.put(("error", exc))
-                finally:
-                    event_queue.put(None)
-
-            submit_async_task(run_stream())
-
-            while True:
-                item = event_queue.get()
-                if item is None:
-                    break
-                message_chunk, metadata = item
-                if message_chunk == "error":
-                    raise metadata
-
-                # Lazily create & update the SAME status container when any tool runs
-                if isinstance(message_chunk, ToolMessage):
-                    tool_name = getattr(message_chunk, "name", "tool")
-                    if status_holder["box"] is None:
-                        status_holder["box"] = st.status(
-                            f"🔧 Using `{tool_name}` …", expanded=True
-                        )
-                    else:
-                        status_holder["box"].update(
-                            label=f"🔧 Using `{tool_name}` …",
-                            state="running",
-                            expanded=True,
-                        )
-
-                # Stream ONLY assistant tokens
-                if isinstance(message_chunk, AIMessage):
-                    # updated 09-12-2025
-                    text = _extract_text(message_chunk.content)
-                    if text:
-                        yield text
-
-        ai_message = st.write_stream(ai_only_stream())
+        def show_tool(tool_name):
+            # Lazily create & update the SAME status container when any tool runs
+            if status_holder["box"] is None:
+                status_holder["box"] = st.status(
+                    f"🔧 Using `{tool_name}` …", expanded=True
+                )
+            else:
+                status_holder["box"].update(
+                    label=f"🔧 Using `{tool_name}` …",
+                    state="running",
+                    expanded=True,
+                )
+
+        # clicking Stop reruns the script; cancel_stale_stream() then stops this answer
+        stop_slot = st.empty()
+        stop_slot.button("⏹ Stop", key="stop-generation")
+        handle = StreamHandle()
+        st.session_state[ACTIVE_STREAM_KEY] = handle
+
+        # Only assistant text and tool names cross the queue; text is
+        # rendered in batches instead of one markdown re-render per token
+        ai_message = st.write_stream(coalesced_text(
+            turns.astream(
+                {"messages": [HumanMessage(content=user_input)]},
+                config=config,
+                stream_mode="messages",
+            ),
+            submit=submit_async_task,
+            on_tool=show_tool,
+            handle=handle,
+        ))
+        stop_slot.empty()
+        st.session_state.pop(ACTIVE_STREAM_KEY, None)
 
         # Finalize only if a tool was actually used
         if status_holder["box"] is not None:
@@ -1,13 +1,20 @@
-import queue
 import uuid
 
 import streamlit as st
-from langgraph_mcp_backend1 import chatbot, retrieve_all_threads, submit_async_task
+from langgraph_mcp_backend1 import (
+    chatbot,
+    prefetch_recent_threads,
+    retrieve_threads_page,
+    submit_async_task,
+    turns,
+)
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from stream_bridge import ACTIVE_STREAM_KEY, StreamHandle, cancel_stale_stream, coalesced_text
 
 # =========================== Utilities ===========================
 def generate_thread_id():
-    return uuid.uuid4()
+    # a str, like the ids of catalog pages
+    return str(uuid.uuid4())
 
 def reset_chat():
     thread_id = generate_thread_id()
@@ -21,6 +28,14 @@ def add_thread(thread_id):
         st.session_state["chat_threads"].append(thread_id)
 
 
+def load_more_threads():
+    # next page of older threads, newest first, from the threads catalog
+    page = retrieve_threads_page(before=st.session_state["threads_cursor"])
+    older = [row["thread_id"] for row in page.threads if row["thread_id"] not in st.session_state["chat_threads"]]
+    st.session_state["chat_threads"][:0] = older[::-1]
+    st.session_state["threads_cursor"] = page.next_cursor
+
+
 def load_conversation(thread_id):
     state = chatbot.get_state(config={"configurable": {"thread_id": thread_id}})
     # Check if messages key exists in state values, return empty list if not
@@ -28,6 +43,10 @@ def load_conversation(thread_id):
 
 
 # ======================= Session Initialization ===================
+# a rerun while an answer was streaming (Stop, thread switch, reload)
+# abandons it: cancel the generation instead of letting it run on
+cancel_stale_stream(st.session_state)
+
 if "message_history" not in st.session_state:
     st.session_state["message_history"] = []
 
@@ -35,7 +54,10 @@ if "thread_id" not in st.session_state:
     st.session_state["thread_id"] = generate_thread_id()
 
 if "chat_threads" not in st.session_state:
-    st.session_state["chat_threads"] = retrieve_all_threads()
+    st.session_state["chat_threads"] = []
+    st.session_state["threads_cursor"] = None
+    load_more_threads()
+    prefetch_recent_threads(caller=st.session_state["thread_id"])
 
 add_thread(st.session_state["thread_id"])
 
@@ -47,7 +69,7 @@ if st.sidebar.button("New Chat"):
 
 st.sidebar.header("My Conversations")
 for thread_id in st.session_state["chat_threads"][::-1]:
-    if st.sidebar.button(str(thread_id)):
+    if st.sidebar.button(thread_id, key=f"thread-btn-{thread_id}"):
         st.session_state["thread_id"] = thread_id
         messages = load_conversation(thread_id)
 
@@ -57,6 +79,11 @@ for thread_id in st.session_state["chat_threads"][::-1]:
             temp_messages.append({"role": role, "content": msg.content})
         st.session_state["message_history"] = temp_messages
 
+if st.session_state["threads_cursor"] is not None:
+    if st.sidebar.button("Load older chats", key="threads-load-more"):
+        load_more_threads()
+        st.rerun()
+
 # ============================ Main UI ============================
 
 # Render history
@@ -83,51 +110,39 @@ if user_input:
         # Use a mutable holder so the generator can set/modify it
         status_holder = {"box": None}
 
-        def ai_only_stream():
-            event_queue: queue.Queue = queue.Queue()
-
-            async def run_stream():
-                try:
-                    async for message_chunk, metadata in chatbot.astream(
-                        {"messages": [HumanMessage(content=user_input)]},
-                        config=CONFIG,
-                        stream_mode="messages",
-                    ):
-                        event_queue.put((message_chunk, metadata))
-                except Exception as exc:
-                    event_queue.put(("error", exc))
-                finally:
-                    event_queue.put(None)
-
-            submit_async_task(run_stream())
-
-            while True:
-                item = event_queue.get()
-                if item is None:
-                    break
-                message_chunk, metadata = item
-                if message_chunk == "error":
-                    raise metadata
-
-                # Lazily create & update the SAME status container when any tool runs
-                if isinstance(message_chunk, ToolMessage):
-                    tool_name = getattr(message_chunk, "name", "tool")
-                    if status_holder["box"] is None:
-                        status_holder["box"] = st.status(
-                            f"🔧 Using `{tool_name}` …", expanded=True
-                        )
-                    else:
-                        status_holder["box"].update(
-                            label=f"🔧 Using `{tool_name}` …",
-                            state="running",
-                            expanded=True,
-                        )
-
-                # Stream ONLY assistant tokens
-                if isinstance(message_chunk, AIMessage):
-                    yield message_chunk.content
-
-        ai_message = st.write_stream(ai_only_stream())
+        def show_tool(tool_name):
+            # Lazily create & update the SAME status container when any tool runs
+            if status_holder["box"] is None:
+                status_holder["box"] = st.status(
+                    f"🔧 Using `{tool_name}` …", expanded=True
+                )
+            else:
+                status_holder["box"].update(
+                    label=f"🔧 Using `{tool_name}` …",
+                    state="running",
+                    expanded=True,
+                )
+
+        # clicking Stop reruns the script; cancel_stale_stream() then stops this answer
+        stop_slot = st.empty()
+        stop_slot.button("⏹ Stop", key="stop-generation")
+        handle = StreamHandle()
+        st.session_state[ACTIVE_STREAM_KEY] = handle
+
+        # Only assistant text and tool names cross the queue; text is
+        # rendered in batches instead of one markdown re-render per token
+        ai_message = st.write_stream(coalesced_text(
+            turns.astream(
+                {"messages": [HumanMessage(content=user_input)]},
+                config=CONFIG,
+                stream_mode="messages",
+            ),
+            submit=submit_async_task,
+            on_tool=show_tool,
+            handle=handle,
+        ))
+        stop_slot.empty()
+        st.session_state.pop(ACTIVE_STREAM_KEY, None)
 
         # Finalize only if a tool was actually used
         if status_holder["box"] is not None:
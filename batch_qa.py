@@ -0,0 +1,225 @@
+"""
+Run a JSONL file of prompts through the RAG chatbot graph, offline.
+
+    python batch_qa.py prompts.jsonl --output answers.jsonl --concurrency 8 \
+        --db postgresql://.../batch_qa --no-cache
+
+Each input line is a JSON object:
+
+    {"id": "q1", "prompt": "What is the notice period?", "group": "lease", "pdf": "docs/lease.pdf"}
+
+Only `prompt` is required; `id` defaults to the line number. Every prompt
+gets a fresh thread, so answers never see each other. A `pdf` is indexed
+once per `group` (or per path without one) and shared with every prompt of
+that group, as if it had been uploaded to each thread.
+
+Prompts run on the backend's event loop, at most --concurrency at a time,
+and each result is appended to --output as soon as it finishes:
+
+    {"id", "prompt", "status": "ok" | "error", "answer", "tools",
+     "cache": "exact" | "semantic" | null, "thread_id", "latency_ms", "error"}
+
+Batch threads never appear in the threads catalog, so they stay out of the
+frontends' sidebars. Their checkpoints are still written to the backend's
+database; --db points the run at another one (it overrides DB_URL).
+--no-cache answers every prompt with a model call: the exact and semantic
+response caches are neither read nor filled.
+
+An interrupted run resumes where it stopped: ids already answered "ok" in
+the output file are skipped, failed ones are tried again (--restart starts
+over with an empty output). Progress, throughput and latency percentiles
+are printed while the run goes on and at the end.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Iterator
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from thread_catalog import message_text
+
+# langgraph_rag_backend, imported by main() once DB_URL is settled: it
+# connects to the database on import
+backend = None
+
+PROGRESS_EVERY = 25  # results between progress lines
+
+
+def read_prompts(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("prompt"):
+                raise ValueError(f"{path}:{number}: missing 'prompt'")
+            item["id"] = str(item.get("id", f"line-{number}"))
+            yield item
+
+
+def answered_ids(path: str) -> set[str]:
+    """Ids already answered successfully in an earlier run's output."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by the interruption
+            if row.get("status") == "ok":
+                done.add(str(row["id"]))
+    return done
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class BatchRun:
+    def __init__(
+        self, output: str, concurrency: int, run_id: str, restart: bool = False, use_cache: bool = True
+    ) -> None:
+        self.output = output
+        self.restart = restart
+        self.use_cache = use_cache
+        self.concurrency = concurrency
+        self.run_id = run_id
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.started = time.perf_counter()
+        # one ingestion per document group, awaited by all its prompts
+        self._documents: dict[str, asyncio.Future] = {}
+        self._out = None
+
+    async def _document_thread(self, item: dict) -> str:
+        group = str(item.get("group") or item["pdf"])
+        if group not in self._documents:
+            self._documents[group] = asyncio.ensure_future(self._ingest(group, item["pdf"]))
+        return await self._documents[group]
+
+    async def _ingest(self, group: str, path: str) -> str:
+        thread_id = f"batch:{self.run_id}:doc:{group}"
+        with open(path, "rb") as f:
+            data = f.read()
+        # ingest_pdf blocks on the backend loop itself, so it runs in a worker thread
+        summary = await asyncio.to_thread(backend.ingest_pdf, data, thread_id, os.path.basename(path), catalog=False)
+        print(f"[batch_qa] indexed {path}: {summary['chunks']} chunks for group {group!r}")
+        return thread_id
+
+    async def answer(self, item: dict) -> dict:
+        thread_id = f"batch:{self.run_id}:{item['id']}"
+        row = {"id": item["id"], "prompt": item["prompt"], "thread_id": thread_id}
+        started = time.perf_counter()
+        try:
+            if item.get("pdf"):
+                await backend.ashare_document(await self._document_thread(item), thread_id, catalog=False)
+            config = {
+                "configurable": {
+                    "thread_id": thread_id,
+                    "user_id": "batch_qa",
+                    "catalog": False,
+                    "cache": self.use_cache,
+                }
+            }
+            state = await backend.chatbot.ainvoke({"messages": [HumanMessage(content=item["prompt"])]}, config=config)
+            messages = state["messages"]
+            final = next((m for m in reversed(messages) if isinstance(m, AIMessage) and not m.tool_calls), None)
+            row.update(
+                status="ok",
+                answer=message_text(final.content) if final is not None else "",
+                tools=[m.name for m in messages if isinstance(m, ToolMessage)],
+                # set on answers replayed from the response or semantic cache
+                cache=final.response_metadata.get("cache") if final is not None else None,
+            )
+        except Exception as exc:
+            row.update(status="error", error=f"{type(exc).__name__}: {exc}")
+        row["latency_ms"] = round(1000 * (time.perf_counter() - started), 1)
+        return row
+
+    def _write(self, row: dict) -> None:
+        self._out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._out.flush()
+        if row["status"] == "ok":
+            self.latencies.append(row["latency_ms"] / 1000)
+        else:
+            self.errors += 1
+            print(f"[batch_qa] {row['id']} failed: {row['error']}")
+        finished = len(self.latencies) + self.errors
+        if finished % PROGRESS_EVERY == 0:
+            print(f"[batch_qa] {self.report()}")
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        finished = len(self.latencies) + self.errors
+        return (
+            f"{finished} done, {self.errors} errors in {elapsed:.1f}s "
+            f"({finished / elapsed if elapsed else 0:.2f} prompts/s) | latency "
+            f"p50 {_percentile(self.latencies, 0.50):.2f}s, p90 {_percentile(self.latencies, 0.90):.2f}s, "
+            f"p99 {_percentile(self.latencies, 0.99):.2f}s"
+        )
+
+    async def run(self, prompts: Iterator[dict]) -> None:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2 * self.concurrency)
+
+        async def worker() -> None:
+            while (item := await queue.get()) is not None:
+                self._write(await self.answer(item))
+
+        self._out = open(self.output, "w" if self.restart else "a", encoding="utf-8")
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+        try:
+            for item in prompts:
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            self._out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of prompts with the RAG chatbot graph.")
+    parser.add_argument("prompts", help="JSONL file with one {'prompt', 'id'?, 'group'?, 'pdf'?} per line")
+    parser.add_argument("--output", default="batch_qa.answers.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=8, help="prompts in flight at once")
+    parser.add_argument("--restart", action="store_true", help="truncate --output and answer every prompt again")
+    parser.add_argument("--db", help="Postgres URI for the batch's checkpoints instead of DB_URL")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or fill the response caches")
+    args = parser.parse_args()
+
+    global backend
+    if args.db:
+        os.environ["DB_URL"] = args.db
+    import langgraph_rag_backend as backend
+
+    done = set() if args.restart else answered_ids(args.output)
+    if done:
+        print(f"[batch_qa] resuming: {len(done)} prompts already answered in {args.output}")
+    prompts = (item for item in read_prompts(args.prompts) if item["id"] not in done)
+
+    batch = BatchRun(
+        args.output, args.concurrency, run_id=uuid.uuid4().hex[:8], restart=args.restart, use_cache=not args.no_cache
+    )
+    # the graph's checkpointer lives on the backend loop, so the batch runs there too
+    future = backend.submit_async_task(batch.run(prompts))
+    try:
+        future.result()
+    except KeyboardInterrupt:
+        future.cancel()
+        print("[batch_qa] interrupted, run again to resume")
+    print(f"[batch_qa] finished: {batch.report()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark checkpoint serialization with and without compression.
+
+Builds chat states shaped like ours (long AI answers, RAG ToolMessage
+contexts, search results) and reports stored bytes and serialize /
+deserialize latency for each codec.
+
+    python bench_checkpoint_serde.py --turns 50 --repeat 200
+"""
+import argparse
+import json
+import random
+import string
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from checkpoint_serde import CompressedSerializer, codec_available
+
+WORDS = [
+    "tiger", "forest", "bengal", "river", "delta", "expense", "report", "price",
+    "market", "document", "chapter", "summary", "analysis", "growth", "the",
+    "and", "of", "in", "with", "for", "is", "was", "a", "to",
+]
+
+
+def _sentence(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def build_messages(turns: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=_sentence(rng, 15)))
+        if i % 3 == 0:
+            context = [_sentence(rng, 180) for _ in range(4)]
+            messages.append(AIMessage(
+                content="",
+                tool_calls=[{"name": "rag_tool", "args": {"query": "q"}, "id": f"call-{i}"}],
+            ))
+            messages.append(ToolMessage(
+                content=json.dumps({"query": "q", "context": context, "source_file": "doc.pdf"}),
+                tool_call_id=f"call-{i}",
+                name="rag_tool",
+            ))
+        messages.append(AIMessage(content=" ".join(_sentence(rng, 25) for _ in range(12))))
+    return messages
+
+
+def bench(name: str, serde, payload, repeat: int) -> dict:
+    typ, data = serde.dumps_typed(payload)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        serde.dumps_typed(payload)
+    dumps_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        serde.loads_typed((typ, data))
+    loads_ms = (time.perf_counter() - start) * 1000 / repeat
+    return {"codec": name, "type": typ, "bytes": len(data), "dumps_ms": dumps_ms, "loads_ms": loads_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--min-bytes", type=int, default=1024)
+    args = parser.parse_args()
+
+    payload = build_messages(args.turns)
+    serdes = [("none", JsonPlusSerializer())]
+    for codec in ("zstd", "lz4"):
+        if codec_available(codec):
+            serdes.append((codec, CompressedSerializer(codec=codec, min_bytes=args.min_bytes)))
+        else:
+            print(f"skipping {codec}: not installed")
+
+    results = [bench(name, serde, payload, args.repeat) for name, serde in serdes]
+    baseline = results[0]["bytes"]
+    print(f"{len(payload)} messages, {args.repeat} iterations")
+    print(f"{'codec':<6} {'type':<14} {'bytes':>10} {'ratio':>7} {'dumps ms':>9} {'loads ms':>9}")
+    for r in results:
+        print(
+            f"{r['codec']:<6} {r['type']:<14} {r['bytes']:>10} "
+            f"{baseline / r['bytes']:>6.2f}x {r['dumps_ms']:>9.3f} {r['loads_ms']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Compressed serializer for the LangGraph checkpointers.
+
+Wraps the default JsonPlusSerializer and compresses payloads above a size
+threshold (long AI answers, RAG tool contexts, search results). The codec is
+appended to the stored type tag, e.g. "msgpack+zstd", so rows written before
+compression was enabled (plain "msgpack") keep loading unchanged.
+"""
+import logging
+import os
+from typing import Any, Optional
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # optional dependency
+    lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CODEC = "zstd"
+DEFAULT_MIN_BYTES = 1024
+DEFAULT_ZSTD_LEVEL = 3
+
+
+def _zstd_compress(data: bytes, level: int) -> bytes:
+    return zstandard.compress(data, level)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    return zstandard.decompress(data)
+
+
+def _lz4_compress(data: bytes, level: int) -> bytes:
+    return lz4_frame.compress(data)
+
+
+def _lz4_decompress(data: bytes) -> bytes:
+    return lz4_frame.decompress(data)
+
+
+_CODECS = {
+    "zstd": (_zstd_compress, _zstd_decompress, lambda: zstandard is not None),
+    "lz4": (_lz4_compress, _lz4_decompress, lambda: lz4_frame is not None),
+}
+
+
+_reported_missing: set[str] = set()
+
+
+def codec_available(codec: str) -> bool:
+    return codec in _CODECS and _CODECS[codec][2]()
+
+
+class CompressedSerializer(SerializerProtocol):
+    """
+    Serializer that compresses large payloads produced by an inner serializer.
+
+    codec=None disables compression on write but still reads compressed rows,
+    so compression can be switched off without losing history.
+    """
+
+    def __init__(
+        self,
+        serde: Optional[SerializerProtocol] = None,
+        codec: Optional[str] = DEFAULT_CODEC,
+        min_bytes: int = DEFAULT_MIN_BYTES,
+        level: int = DEFAULT_ZSTD_LEVEL,
+    ) -> None:
+        if codec is not None and not codec_available(codec):
+            raise ValueError(f"compression codec '{codec}' is not installed")
+        self.serde = serde or JsonPlusSerializer()
+        self.codec = codec
+        self.min_bytes = min_bytes
+        self.level = level
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        typ, data = self.serde.dumps_typed(obj)
+        if self.codec is None or data is None or len(data) < self.min_bytes:
+            return typ, data
+        compress = _CODECS[self.codec][0]
+        compressed = compress(data, self.level)
+        # incompressible payloads (already packed binary) are stored as-is
+        if len(compressed) >= len(data):
+            return typ, data
+        return f"{typ}+{self.codec}", compressed
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        typ, payload = data
+        base, _, codec = typ.rpartition("+")
+        if base and codec in _CODECS:
+            if not codec_available(codec):
+                raise ValueError(
+                    f"checkpoint was compressed with '{codec}' which is not installed"
+                )
+            payload = _CODECS[codec][1](payload)
+            typ = base
+        return self.serde.loads_typed((typ, payload))
+
+
+def make_checkpoint_serde() -> CompressedSerializer:
+    """
+    Build the serializer shared by all backends.
+
+    CHECKPOINT_COMPRESSION: zstd (default), lz4 or off
+    CHECKPOINT_COMPRESSION_MIN_BYTES: payloads smaller than this stay uncompressed
+
+    zstandard is in requirements.txt; lz4 is optional. A codec that is not
+    installed means no compression, logged once per process.
+    """
+    codec = os.environ.get("CHECKPOINT_COMPRESSION", DEFAULT_CODEC).strip().lower()
+    min_bytes = int(os.environ.get("CHECKPOINT_COMPRESSION_MIN_BYTES", DEFAULT_MIN_BYTES))
+    if codec in ("", "off", "none"):
+        codec = None
+    elif not codec_available(codec):
+        if codec not in _reported_missing:
+            _reported_missing.add(codec)
+            logger.warning("checkpoint compression codec %r is not installed, storing uncompressed", codec)
+        codec = None
+    return CompressedSerializer(codec=codec, min_bytes=min_bytes)
@@ -0,0 +1,318 @@
+"""
+Checkpointer wrappers shared by the backends.
+
+DelegatingCheckpointSaver forwards every call to a real saver (InMemorySaver,
+SqliteSaver, PostgresSaver, AsyncPostgresSaver) so behaviour can be layered
+on top without touching the LangGraph classes themselves.
+
+A wrapper that keeps a table of its own next to the checkpoints can hand
+statements to the checkpoint write with `written_with_checkpoint()`. The
+repo's savers (PooledSqliteSaver, ResilientPostgresSaver,
+PooledAsyncPostgresSaver) run them on the write's cursor, in its
+transaction; with any other saver `pending.written` stays False and the
+wrapper writes them itself.
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    copy_checkpoint,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+
+
+class PendingStatements:
+    """SQL statements (text, params) to run in the transaction of a checkpoint write."""
+
+    def __init__(self, statements: Sequence[tuple[str, tuple]]) -> None:
+        self.statements = list(statements)
+        self.written = False
+
+
+_pending_statements: ContextVar[Optional[PendingStatements]] = ContextVar("pending_statements", default=None)
+
+
+@contextmanager
+def written_with_checkpoint(statements: Sequence[tuple[str, tuple]]) -> Iterator[PendingStatements]:
+    """
+    Statements for the checkpoint put()/aput() called inside this block. A
+    block inside another one (stacked wrappers) adds its statements to the
+    outer block's, so they all commit with the same write.
+    """
+    outer = _pending_statements.get()
+    if outer is not None and not outer.written:
+        outer.statements.extend(statements)
+        yield outer
+        return
+    pending = PendingStatements(statements)
+    token = _pending_statements.set(pending)
+    try:
+        yield pending
+    finally:
+        _pending_statements.reset(token)
+
+
+def pending_statements() -> Optional[PendingStatements]:
+    """For a saver's checkpoint-write cursor: statements still to run, if any."""
+    pending = _pending_statements.get()
+    if pending is None or pending.written or not pending.statements:
+        return None
+    return pending
+
+
+class DelegatingCheckpointSaver(BaseCheckpointSaver):
+    """Forward all checkpointer calls to `saver`. Subclasses override what they need."""
+
+    def __init__(self, saver: BaseCheckpointSaver) -> None:
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+
+    def __getattr__(self, name: str) -> Any:
+        # setup(), conn, lock ... of the wrapped saver stay reachable
+        if name == "saver":
+            raise AttributeError(name)
+        return getattr(self.saver, name)
+
+    @property
+    def config_specs(self) -> list:
+        return self.saver.config_specs
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.saver.get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs: Any) -> Iterator[CheckpointTuple]:
+        return self.saver.list(config, **kwargs)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.saver.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return self.saver.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        return self.saver.delete_thread(thread_id)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self.saver.aget_tuple(config)
+
+    async def alist(self, config: Optional[RunnableConfig], **kwargs: Any) -> AsyncIterator[CheckpointTuple]:
+        async for item in self.saver.alist(config, **kwargs):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await self.saver.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await self.saver.adelete_thread(thread_id)
+
+    def get_next_version(self, current: Any, channel: None) -> Any:
+        return self.saver.get_next_version(current, channel)
+
+
+def _cache_key(config: RunnableConfig) -> tuple[str, str]:
+    configurable = config["configurable"]
+    return str(configurable["thread_id"]), configurable.get("checkpoint_ns", "")
+
+
+def _copy_tuple(value: CheckpointTuple) -> CheckpointTuple:
+    # the pregel loop mutates channel_versions / versions_seen in place
+    return value._replace(checkpoint=copy_checkpoint(value.checkpoint))
+
+
+def checkpoint_cache_enabled() -> bool:
+    return os.environ.get("CHECKPOINT_CACHE", "").strip().lower() in ("1", "true", "on")
+
+
+class CachedCheckpointSaver(DelegatingCheckpointSaver):
+    """
+    Read-through LRU cache of the latest checkpoint per thread.
+
+    Entries are filled on put/aput and on cache-miss reads, and dropped as
+    soon as writes land on the cached checkpoint id (those would change its
+    pending_writes). This is only correct while this process is the only
+    writer for its threads, so the cache is opt-in per deployment:
+    CHECKPOINT_CACHE=1 turns it on. Off (the default, and the setting for
+    any deployment where several processes write), every call goes to the
+    wrapped saver and peek() finds nothing.
+    """
+
+    def __init__(
+        self, saver: BaseCheckpointSaver, maxsize: Optional[int] = None, enabled: Optional[bool] = None
+    ) -> None:
+        super().__init__(saver)
+        self.enabled = checkpoint_cache_enabled() if enabled is None else enabled
+        self.maxsize = maxsize or int(os.environ.get("CHECKPOINT_CACHE_SIZE", 256))
+        self._entries: "OrderedDict[tuple[str, str], CheckpointTuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ----------- cache bookkeeping ----------- #
+    def _lookup(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if not self.enabled:
+            return None
+        key = _cache_key(config)
+        checkpoint_id = get_checkpoint_id(config)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None or (
+                checkpoint_id and value.config["configurable"]["checkpoint_id"] != checkpoint_id
+            ):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _copy_tuple(value)
+
+    def _store(self, value: CheckpointTuple, only_if_newer: bool = False) -> None:
+        if not self.enabled:
+            return
+        key = _cache_key(value.config)
+        with self._lock:
+            current = self._entries.get(key)
+            if only_if_newer and current is not None and (
+                current.config["configurable"]["checkpoint_id"]
+                >= value.config["configurable"]["checkpoint_id"]
+            ):
+                return
+            self._entries[key] = _copy_tuple(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _invalidate_checkpoint(self, config: RunnableConfig) -> None:
+        key = _cache_key(config)
+        checkpoint_id = get_checkpoint_id(config)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None and value.config["configurable"]["checkpoint_id"] == checkpoint_id:
+                del self._entries[key]
+
+    def _after_put(
+        self,
+        config: RunnableConfig,
+        next_config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+    ) -> None:
+        parent_config = None
+        if parent_id := get_checkpoint_id(config):
+            parent_config = {
+                "configurable": {
+                    "thread_id": next_config["configurable"]["thread_id"],
+                    "checkpoint_ns": next_config["configurable"].get("checkpoint_ns", ""),
+                    "checkpoint_id": parent_id,
+                }
+            }
+        self._store(CheckpointTuple(
+            config=next_config,
+            checkpoint=checkpoint,
+            metadata=get_serializable_checkpoint_metadata(config, metadata),
+            parent_config=parent_config,
+            pending_writes=[],
+        ))
+
+    def peek(self, thread_id: str, checkpoint_ns: str = "") -> Optional[CheckpointTuple]:
+        """Cached latest checkpoint of a thread, without a storage read or stats update."""
+        with self._lock:
+            value = self._entries.get((str(thread_id), checkpoint_ns))
+        return _copy_tuple(value) if value is not None else None
+
+    def invalidate(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == str(thread_id)]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    # ----------- sync API ----------- #
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if cached := self._lookup(config):
+            return cached
+        value = self.saver.get_tuple(config)
+        if value is not None and not get_checkpoint_id(config):
+            self._store(value, only_if_newer=True)
+        return value
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = self.saver.put(config, checkpoint, metadata, new_versions)
+        self._after_put(config, next_config, checkpoint, metadata)
+        return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self._invalidate_checkpoint(config)
+        self.saver.put_writes(config, writes, task_id, task_path)
+        self._invalidate_checkpoint(config)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.invalidate(thread_id)
+        return self.saver.delete_thread(thread_id)
+
+    # ----------- async API ----------- #
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if cached := self._lookup(config):
+            return cached
+        value = await self.saver.aget_tuple(config)
+        if value is not None and not get_checkpoint_id(config):
+            self._store(value, only_if_newer=True)
+        return value
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        next_config = await self.saver.aput(config, checkpoint, metadata, new_versions)
+        self._after_put(config, next_config, checkpoint, metadata)
+        return next_config
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        self._invalidate_checkpoint(config)
+        await self.saver.aput_writes(config, writes, task_id, task_path)
+        self._invalidate_checkpoint(config)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.invalidate(thread_id)
+        return await self.saver.adelete_thread(thread_id)
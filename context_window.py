@@ -0,0 +1,153 @@
+"""
+Bounded model context for long threads.
+
+chat_node used to send the whole `messages` channel, old tool outputs
+included, on every call. Prompt size and time-to-first-token then grew with
+the age of the thread. Here the prompt is:
+
+    one system message (the node's own prompt + a rolling summary)
+    the turns not folded into the summary, newest first, within
+    CONTEXT_MAX_TOKENS and never cut inside a turn
+
+`summarized` in the graph state counts the leading messages already folded
+into `summary`. ContextSummarizer.arefresh() runs in a task of its own after
+a turn has finished streaming (TurnScheduler's after_turn hook), so neither
+the user nor a message sent next waits on it.
+Once more than CONTEXT_MAX_TURNS + CONTEXT_SUMMARY_EVERY turns are
+unsummarized, it folds all but the last CONTEXT_MAX_TURNS into the summary
+with one extra model call. The full history stays in the checkpoint; only
+the prompt is bounded.
+"""
+import os
+from typing import Optional, Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
+
+from llm_limiter import FairLimiter, fairness_key
+from rate_limiter import background
+from thread_catalog import message_text
+
+DEFAULT_MAX_TURNS = 10
+DEFAULT_MAX_TOKENS = 8000
+DEFAULT_SUMMARY_EVERY = 4
+TOOL_OUTPUT_CHARS = 500  # of each tool result, when it is folded into the summary
+
+SUMMARY_PROMPT = (
+    "You maintain the running summary of a conversation between a user and an assistant. "
+    "Merge the new messages into the existing summary. Keep facts, names, numbers, decisions, "
+    "documents mentioned and open questions; drop small talk. Reply with the summary only."
+)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def turn_starts(messages: Sequence[BaseMessage], start: int = 0) -> list[int]:
+    """Indexes of the messages that open a turn (user messages) from `start` on."""
+    return [i for i in range(start, len(messages)) if isinstance(messages[i], HumanMessage)]
+
+
+def window_start(
+    messages: Sequence[BaseMessage],
+    summarized: int = 0,
+    max_tokens: Optional[int] = None,
+) -> int:
+    """
+    First message sent verbatim: the oldest turn after `summarized` that
+    still fits the token budget, counting back from the newest. The newest
+    turn is always kept, whatever its size.
+    """
+    max_tokens = max_tokens or _env_int("CONTEXT_MAX_TOKENS", DEFAULT_MAX_TOKENS)
+    starts = turn_starts(messages, summarized) or [summarized]
+    start = starts[-1]
+    used = count_tokens_approximately(messages[start:])
+    for candidate in reversed(starts[:-1]):
+        cost = count_tokens_approximately(messages[candidate:start])
+        if used + cost > max_tokens:
+            break
+        used += cost
+        start = candidate
+    return start
+
+
+def context_messages(state: dict, system_prompt: Optional[str] = None) -> list[BaseMessage]:
+    """The bounded prompt for a chat_node call on `state`."""
+    messages = state["messages"]
+    summarized = min(state.get("summarized") or 0, len(messages))
+    system = [part.strip() for part in (system_prompt, state.get("summary")) if part]
+    if state.get("summary"):
+        system[-1] = "Summary of the earlier conversation:\n" + system[-1]
+    prompt = [SystemMessage(content="\n\n".join(system))] if system else []
+    return prompt + list(messages[window_start(messages, summarized):])
+
+
+def _transcript(messages: Sequence[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        text = message_text(message.content)
+        if message.type == "tool":
+            text = text[:TOOL_OUTPUT_CHARS]
+        if text:
+            lines.append(f"{message.type}: {text}")
+    return "\n".join(lines)
+
+
+class ContextSummarizer:
+    """Fold old turns of a thread into its rolling summary, between turns."""
+
+    def __init__(
+        self,
+        chatbot: CompiledStateGraph,
+        llm: BaseChatModel,
+        limiter: Optional[FairLimiter] = None,
+        max_turns: Optional[int] = None,
+        summary_every: Optional[int] = None,
+    ) -> None:
+        self.chatbot = chatbot
+        self.llm = llm
+        self.limiter = limiter
+        self.max_turns = max_turns or _env_int("CONTEXT_MAX_TURNS", DEFAULT_MAX_TURNS)
+        self.summary_every = summary_every or _env_int("CONTEXT_SUMMARY_EVERY", DEFAULT_SUMMARY_EVERY)
+
+    def fold_until(self, messages: Sequence[BaseMessage], summarized: int) -> Optional[int]:
+        """Where the summary should end, or None if it is not due yet."""
+        starts = turn_starts(messages, summarized)
+        if len(starts) <= self.max_turns + self.summary_every:
+            return None
+        return starts[-self.max_turns]
+
+    async def _asummarize(self, summary: str, messages: Sequence[BaseMessage], config: RunnableConfig) -> str:
+        prompt = [
+            SystemMessage(content=SUMMARY_PROMPT),
+            HumanMessage(
+                content=f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{_transcript(messages)}"
+            ),
+        ]
+        # between turns: queues behind interactive calls for the Gemini quota
+        with background():
+            if self.limiter is None:
+                response = await self.llm.ainvoke(prompt)
+            else:
+                async with self.limiter.slot(fairness_key(config)):
+                    response = await self.llm.ainvoke(prompt)
+        return message_text(response.content).strip()
+
+    async def arefresh(self, config: RunnableConfig) -> bool:
+        """Update the thread's summary if enough turns piled up; returns whether it did."""
+        config = {"configurable": {"thread_id": config["configurable"]["thread_id"]}}
+        snapshot = await self.chatbot.aget_state(config)
+        messages = snapshot.values.get("messages") or []
+        summarized = snapshot.values.get("summarized") or 0
+        until = self.fold_until(messages, summarized)
+        if until is None:
+            return False
+        summary = await self._asummarize(snapshot.values.get("summary") or "", messages[summarized:until], config)
+        # runs between turns (TurnScheduler), so no graph run writes this thread meanwhile
+        await self.chatbot.aupdate_state(config, {"summary": summary, "summarized": until}, as_node="chat_node")
+        print(f"[context_window] {config['configurable']['thread_id']}: summary now covers {until} messages")
+        return True
@@ -0,0 +1,70 @@
+"""
+Process-wide store of uploaded PDF retrievers, per thread.
+
+The RAG backend used to keep retrievers in the first importing session's
+st.session_state. Every other session then read and wrote that one dict,
+nothing was ever dropped, and reloading the backend after a database error
+rebound the names to a fresh dict, so the other sessions lost their
+documents. The store lives in its own module: reloading the backend
+re-imports the same instance.
+
+Entries are evicted least recently used once RAG_MAX_DOCUMENTS threads
+hold a document. A thread whose retriever was evicted answers without it
+until the PDF is uploaded again.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+DEFAULT_MAX_DOCUMENTS = 64
+
+
+class ThreadDocumentStore:
+    """LRU map of thread id -> (retriever, metadata), safe across threads."""
+
+    def __init__(self, maxsize: Optional[int] = None) -> None:
+        self.maxsize = maxsize or int(os.environ.get("RAG_MAX_DOCUMENTS", DEFAULT_MAX_DOCUMENTS))
+        self._entries: "OrderedDict[str, tuple[Any, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def __contains__(self, thread_id: object) -> bool:
+        with self._lock:
+            return str(thread_id) in self._entries
+
+    def put(self, thread_id: str, retriever: Any, metadata: dict) -> None:
+        with self._lock:
+            self._entries[str(thread_id)] = (retriever, dict(metadata))
+            self._entries.move_to_end(str(thread_id))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def retriever(self, thread_id: Optional[str]) -> Any:
+        """The thread's retriever, or None."""
+        with self._lock:
+            entry = self._entries.get(str(thread_id)) if thread_id else None
+            if entry is None:
+                return None
+            self._entries.move_to_end(str(thread_id))
+            return entry[0]
+
+    def metadata(self, thread_id: str) -> dict:
+        with self._lock:
+            entry = self._entries.get(str(thread_id))
+        return dict(entry[1]) if entry is not None else {}
+
+    def share(self, source_thread_id: str, thread_id: str) -> None:
+        """Give `thread_id` the document of `source_thread_id` (KeyError if it has none)."""
+        with self._lock:
+            retriever, metadata = self._entries[str(source_thread_id)]
+        self.put(thread_id, retriever, metadata)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "maxsize": self.maxsize, "evicted": self.evicted}
+
+
+# one per process, shared by every session and kept across backend reloads
+thread_documents = ThreadDocumentStore()
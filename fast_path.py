@@ -0,0 +1,196 @@
+"""
+Deterministic answers for unambiguous calculator and stock-quote turns.
+
+"add 19 and 6" or "price of TSLA" used to take two model round trips: one
+to emit the tool call, one to phrase the tool's result. The `fast_path` node
+runs first in the graph. It matches the new user message against a few
+anchored patterns, runs `calculator` / `stock_price` itself and renders a
+templated answer. A turn that does not match exactly, or whose tool result
+cannot be rendered (an API error, an unknown symbol), goes on to the model
+unchanged.
+
+The checkpoint gets the same shape as the model path: an AIMessage with the
+tool call, the ToolMessage, then the answer. All three reach the `messages`
+stream in that order when the node finishes, so the frontends need no
+changes.
+
+Stock symbols need a `$` ("$tsla price", "quote $AAPL"), or capitals right
+after an explicit "price of/for" ("price of TSLA"). That keeps "price of
+apple" with the model, which knows what the user means, and keeps capitalized
+words such as "I quote" or "WHAT price" from being looked up as tickers.
+"""
+import json
+import re
+import uuid
+from collections import Counter
+from typing import Callable, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.tools import BaseTool
+from langgraph.graph import END
+
+from thread_catalog import message_text
+
+_INT = r"(-?\d+)"
+_POLITE = re.compile(r"^(?:please\s+|can you\s+|could you\s+)|(?:\s+please)?[\s?.!]*$", re.IGNORECASE)
+_ASK = r"(?:what(?:'s| is)\s+|calculate\s+|compute\s+)?"
+
+# (pattern, operation, whether the numbers come in reverse order)
+_CALCULATIONS = [
+    (re.compile(rf"^{_ASK}{_INT}\s*\+\s*{_INT}$", re.IGNORECASE), "add", False),
+    (re.compile(rf"^{_ASK}{_INT}\s*-\s*{_INT}$", re.IGNORECASE), "sub", False),
+    (re.compile(rf"^{_ASK}{_INT}\s*[*x×]\s*{_INT}$", re.IGNORECASE), "mult", False),
+    (re.compile(rf"^{_ASK}{_INT}\s*[/÷]\s*{_INT}$", re.IGNORECASE), "div", False),
+    (re.compile(rf"^{_ASK}{_INT}\s+plus\s+{_INT}$", re.IGNORECASE), "add", False),
+    (re.compile(rf"^{_ASK}{_INT}\s+minus\s+{_INT}$", re.IGNORECASE), "sub", False),
+    (re.compile(rf"^{_ASK}{_INT}\s+(?:times|multiplied by)\s+{_INT}$", re.IGNORECASE), "mult", False),
+    (re.compile(rf"^{_ASK}{_INT}\s+divided by\s+{_INT}$", re.IGNORECASE), "div", False),
+    (re.compile(rf"^add\s+{_INT}\s+(?:and|with|to)\s+{_INT}$", re.IGNORECASE), "add", False),
+    (re.compile(rf"^subtract\s+{_INT}\s+from\s+{_INT}$", re.IGNORECASE), "sub", True),
+    (re.compile(rf"^multiply\s+{_INT}\s+(?:and|by|with)\s+{_INT}$", re.IGNORECASE), "mult", False),
+    (re.compile(rf"^divide\s+{_INT}\s+by\s+{_INT}$", re.IGNORECASE), "div", False),
+]
+_SYMBOLS = r"(\$?[A-Za-z]{1,5}(?:\.[A-Za-z]{1,2})?)"
+# (pattern, whether a bare capitalized symbol is accepted without a `$`)
+_QUOTES = [
+    (
+        re.compile(
+            rf"^(?:what(?:'s| is)\s+)?(?:the\s+)?(?:current\s+|latest\s+)?(?:stock\s+|share\s+)?price\s+(?:of|for)\s+{_SYMBOLS}$",
+            re.IGNORECASE,
+        ),
+        True,
+    ),
+    (re.compile(rf"^{_SYMBOLS}\s+(?:stock\s+|share\s+)?(?:price|quote)$", re.IGNORECASE), False),
+    (re.compile(rf"^(?:stock\s+)?(?:price|quote)\s+{_SYMBOLS}$", re.IGNORECASE), False),
+]
+# shouted words that are no ticker, even after "price of"
+_NOT_SYMBOLS = frozenset({"A", "I", "IT", "THE", "THAT", "THIS", "WHAT", "GOLD", "OIL", "BTC", "ETH"})
+_OPERATORS = {"add": "+", "sub": "-", "mult": "×", "div": "÷"}
+
+
+def _new_question(messages: list[BaseMessage]) -> Optional[str]:
+    # exactly one user message since the last answer (none merged by TurnScheduler)
+    if not messages or not isinstance(messages[-1], HumanMessage):
+        return None
+    if len(messages) > 1 and isinstance(messages[-2], HumanMessage):
+        return None
+    return _POLITE.sub("", " ".join(message_text(messages[-1].content).split()))
+
+
+def match_intent(question: str) -> Optional[tuple[str, dict]]:
+    """("calculator" | "stock_price", tool args) when `question` is an unambiguous request."""
+    for pattern, operation, reverse in _CALCULATIONS:
+        if found := pattern.match(question):
+            num1, num2 = int(found.group(1)), int(found.group(2))
+            if reverse:
+                num1, num2 = num2, num1
+            return "calculator", {"num1": num1, "num2": num2, "operation": operation}
+    for pattern, bare in _QUOTES:
+        if found := pattern.match(question):
+            symbol = found.group(1)
+            if symbol.startswith("$"):
+                return "stock_price", {"symbol": symbol[1:].upper()}
+            if bare and symbol.isupper() and symbol not in _NOT_SYMBOLS:
+                return "stock_price", {"symbol": symbol}
+    return None
+
+
+def _number(value: float) -> str:
+    return f"{value:g}" if isinstance(value, float) and not value.is_integer() else f"{int(value)}"
+
+
+def render_answer(intent: str, args: dict, result) -> Optional[str]:
+    """The templated answer for a tool result, or None if it should go to the model."""
+    if not isinstance(result, dict) or "error" in result:
+        return None
+    if intent == "calculator":
+        if "result" not in result:
+            return None
+        return f"{args['num1']} {_OPERATORS[args['operation']]} {args['num2']} = {_number(result['result'])}"
+    quote = result.get("Global Quote") or {}
+    price = quote.get("05. price")
+    if not price:
+        return None  # unknown symbol, or the API's rate-limit note
+    answer = f"{quote.get('01. symbol', args['symbol'])} last traded at {float(price):.2f}"
+    if quote.get("09. change") and quote.get("10. change percent"):
+        answer += f" ({float(quote['09. change']):+.2f}, {quote['10. change percent']})"
+    if quote.get("07. latest trading day"):
+        answer += f" on {quote['07. latest trading day']}"
+    return answer + "."
+
+
+class FastPath:
+    """Answers matched turns with the backend's own tools, without a model call."""
+
+    def __init__(self, calculator: Optional[BaseTool] = None, stock_price: Optional[BaseTool] = None) -> None:
+        self.tools = {
+            intent: tool
+            for intent, tool in (("calculator", calculator), ("stock_price", stock_price))
+            if tool is not None
+        }
+        self.counts: Counter = Counter()
+
+    def stats(self) -> dict:
+        return dict(self.counts)
+
+    def _match(self, messages: list[BaseMessage]) -> Optional[tuple[str, dict]]:
+        question = _new_question(messages)
+        intent = match_intent(question) if question else None
+        if intent is None or intent[0] not in self.tools:
+            self.counts["model"] += 1
+            return None
+        return intent
+
+    def _tool_messages(self, intent: str, args: dict, result) -> list[BaseMessage]:
+        tool = self.tools[intent]
+        call_id = f"fast_path_{uuid.uuid4().hex}"
+        return [
+            AIMessage(content="", tool_calls=[{"name": tool.name, "args": args, "id": call_id}]),
+            ToolMessage(content=json.dumps(result), tool_call_id=call_id, name=tool.name),
+        ]
+
+    def _fallback(self, intent: str) -> dict:
+        self.counts[f"{intent}:fallback"] += 1
+        return {}
+
+    def node(self) -> Callable:
+        """The graph node for a sync backend."""
+
+        def fast_path(state: dict) -> dict:
+            if (matched := self._match(state["messages"])) is None:
+                return {}
+            intent, args = matched
+            try:
+                result = self.tools[intent].invoke(args)
+            except Exception:
+                return self._fallback(intent)
+            if (answer := render_answer(intent, args, result)) is None:
+                return self._fallback(intent)
+            self.counts[intent] += 1
+            return {"messages": self._tool_messages(intent, args, result) + [AIMessage(content=answer)]}
+
+        return fast_path
+
+    def anode(self) -> Callable:
+        """The graph node for an async backend."""
+
+        async def fast_path(state: dict) -> dict:
+            if (matched := self._match(state["messages"])) is None:
+                return {}
+            intent, args = matched
+            try:
+                result = await self.tools[intent].ainvoke(args)
+            except Exception:
+                return self._fallback(intent)
+            if (answer := render_answer(intent, args, result)) is None:
+                return self._fallback(intent)
+            self.counts[intent] += 1
+            return {"messages": self._tool_messages(intent, args, result) + [AIMessage(content=answer)]}
+
+        return fast_path
+
+
+def fast_path_condition(state: dict, next_node: str = "router") -> str:
+    """END once fast_path answered the turn, else on to `next_node`."""
+    last = state["messages"][-1]
+    return END if isinstance(last, AIMessage) and not last.tool_calls else next_node
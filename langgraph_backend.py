@@ -4,24 +4,57 @@ from dotenv import load_dotenv
 from langchain_core.messages import BaseMessage
 from langgraph.checkpoint.memory import InMemorySaver
 from typing import TypedDict, Annotated
+import time
 from langgraph.graph.message import add_messages
+from checkpoint_serde import make_checkpoint_serde
+from checkpointers import CachedCheckpointSaver
+from model_resilience import CALL_TIMEOUT, FALLBACK_MODEL, ResilientModel
+from model_router import FLASH_MODEL, PRO_MODEL, ModelRouter
+from rate_limiter import chat_quota
+from response_cache import ResponseCache, replay
+from thread_catalog import CatalogCheckpointSaver, InMemoryThreadCatalog
 
 load_dotenv()
 
-llm = ChatGoogleGenerativeAI(model='gemini-2.5-pro')
+llm = ChatGoogleGenerativeAI(model=PRO_MODEL, timeout=CALL_TIMEOUT, **chat_quota.model_kwargs())
+# greetings and simple turns no longer pay Pro latency
+router = ModelRouter({'flash': ChatGoogleGenerativeAI(model=FLASH_MODEL, timeout=CALL_TIMEOUT, **chat_quota.model_kwargs()), 'pro': llm})
+# a failed or timed-out call is retried on the fallback model
+resilience = ResilientModel(fallback=ChatGoogleGenerativeAI(model=FALLBACK_MODEL, timeout=CALL_TIMEOUT, **chat_quota.model_kwargs()))
+# model responses by exact prompt; in memory, like the checkpoints
+response_cache = ResponseCache()
 
 class ChatState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    route: str
 
 def chat_node(state: ChatState):
     messages = state['messages']
-    response = llm.invoke(messages)
+    route = router.route_of(state)
+    model = router.models[route]
+    # a prompt answered before is replayed from the cache, streamed like a live answer
+    if (cached := response_cache.get(model, messages)) is not None:
+        return {'messages': [replay(cached)]}
+    started = time.perf_counter()
+    response = resilience.invoke(model, messages, route)
+    router.record(route, time.perf_counter() - started, response)
+    response_cache.put(model, messages, response)
     return {'messages': [response]}
 
-checkpoint = InMemorySaver()
+# titles are recorded when a thread's first message is checkpointed
+catalog = InMemoryThreadCatalog()
+checkpoint = CachedCheckpointSaver(
+    CatalogCheckpointSaver(InMemorySaver(serde=make_checkpoint_serde()), catalog)
+)
 graph = StateGraph(ChatState)
+graph.add_node('router', router.node())
 graph.add_node('chat_node', chat_node)
-graph.add_edge(START, 'chat_node')
+graph.add_edge(START, 'router')
+graph.add_edge('router', 'chat_node')
 graph.add_edge('chat_node', END)
 
-chatbot = graph.compile(checkpoint)
\ No newline at end of file
+chatbot = graph.compile(checkpoint)
+
+def fetch_thread_titles(thread_ids):
+    # one lookup for the whole sidebar instead of get_state per thread
+    return catalog.get_thread_titles(thread_ids)
@@ -9,9 +9,20 @@ from langgraph.graph.message import add_messages
 from langchain_core.tools import tool
 from langchain_community.tools import DuckDuckGoSearchRun
 from langgraph.prebuilt import ToolNode, tools_condition
+from checkpoint_serde import make_checkpoint_serde
+from checkpointers import CachedCheckpointSaver
+from fast_path import FastPath, fast_path_condition
+from message_index import MESSAGE_WINDOW_SIZE, SEARCH_LIMIT, MessageIndexCheckpointSaver, SqliteMessageIndex
+from model_resilience import CALL_TIMEOUT, FALLBACK_MODEL, ResilientModel
+from model_router import FLASH_MODEL, PRO_MODEL, ModelRouter
+from rate_limiter import chat_quota
+from response_cache import ResponseCache, SqliteResponseStore, replay
+from sqlite_checkpoint import PooledSqliteSaver
+from thread_catalog import THREADS_PAGE_SIZE, CatalogCheckpointSaver, SqliteThreadCatalog
 
 import sqlite3
 import requests
+import time
 import os
 
 load_dotenv()
@@ -57,32 +68,74 @@ def stock_price(symbol: str):
     response = requests.get(url=url)
     return response.json()
 
-llm = ChatGoogleGenerativeAI(model='gemini-2.5-flash')
+llm = ChatGoogleGenerativeAI(model=FLASH_MODEL, timeout=CALL_TIMEOUT, **chat_quota.model_kwargs())
+pro_llm = ChatGoogleGenerativeAI(model=PRO_MODEL, timeout=CALL_TIMEOUT, **chat_quota.model_kwargs())
+fallback_llm = ChatGoogleGenerativeAI(model=FALLBACK_MODEL, timeout=CALL_TIMEOUT, **chat_quota.model_kwargs())
 ll_with_tools = llm.bind_tools([calculator, search_tool, stock_price])
+router = ModelRouter({'flash': ll_with_tools, 'pro': pro_llm.bind_tools([calculator, search_tool, stock_price])})
+# a failed or timed-out call is retried on the fallback model
+resilience = ResilientModel(fallback=fallback_llm.bind_tools([calculator, search_tool, stock_price]))
 
 class ChatState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    route: str
 
 def chat_node(state: ChatState):
     """
     LLM Node may answer the question or requests for a call.
     """
     messages = state['messages']
-    response = ll_with_tools.invoke(messages)
+    route = router.route_of(state)
+    model = router.models[route]
+    # a prompt answered before is replayed from the cache, streamed like a live answer
+    if (cached := response_cache.get(model, messages)) is not None:
+        return {'messages': [replay(cached)]}
+    started = time.perf_counter()
+    response = resilience.invoke(model, messages, route)
+    router.record(route, time.perf_counter() - started, response)
+    response_cache.put(model, messages, response)
     return {'messages': [response]}
 
 tool_node = ToolNode([calculator, search_tool, stock_price])
+# unambiguous calculator / stock quote turns are answered without the model
+fast_path = FastPath(calculator=calculator, stock_price=stock_price)
 
 # Estalish the database connection
-conn = sqlite3.connect('chatarena.db', check_same_thread=False)
+# SQLITE_MODE=simple keeps the single shared connection, the default pools
+# WAL connections so concurrent sessions don't stall on 'database is locked'
+DB_PATH = os.environ.get('SQLITE_DB_PATH', 'chatarena.db')
 
-checkpoint = SqliteSaver(conn=conn)
+if os.environ.get('SQLITE_MODE', 'production') == 'simple':
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    saver = SqliteSaver(conn=conn, serde=make_checkpoint_serde())
+else:
+    saver = PooledSqliteSaver(DB_PATH, serde=make_checkpoint_serde())
+
+# threads table kept up to date on every checkpoint write
+catalog = SqliteThreadCatalog(saver)
+catalog.setup()
+
+# full-text index over message contents, also kept up to date on writes
+message_index = SqliteMessageIndex(saver)
+message_index.setup()
+
+# model responses by exact prompt, kept in memory and in the same database
+response_cache = ResponseCache(SqliteResponseStore(saver))
+response_cache.store.setup()
+
+checkpoint = CachedCheckpointSaver(
+    CatalogCheckpointSaver(MessageIndexCheckpointSaver(saver, message_index), catalog)
+)
 
 graph = StateGraph(ChatState)
+graph.add_node('fast_path', fast_path.node())
+graph.add_node('router', router.node())
 graph.add_node('chat_node', chat_node)
 graph.add_node('tools', tool_node)
 
-graph.add_edge(START, 'chat_node')
+graph.add_edge(START, 'fast_path')
+graph.add_conditional_edges('fast_path', fast_path_condition, ['router', END])
+graph.add_edge('router', 'chat_node')
 graph.add_conditional_edges('chat_node', tools_condition)
 graph.add_edge('tools', 'chat_node')
 
@@ -103,8 +156,20 @@ cursor = conn.cursor()
 cursor.execute("drop table writes") """
 
 def fetch_all_threads():
-    all_threads = set()
-    for item in checkpoint.list(None):
-        all_threads.add(item.config['configurable']['thread_id'])
+    return catalog.list_thread_ids()
+
+def fetch_threads_page(limit=THREADS_PAGE_SIZE, before=None):
+    # newest first; pass page.next_cursor as `before` to get the next page
+    return catalog.list_threads_page(limit=limit, before=before)
+
+def fetch_thread_titles(thread_ids):
+    # stored titles for a set of threads in one query
+    return catalog.get_thread_titles(thread_ids)
+
+def search_threads(query, limit=SEARCH_LIMIT):
+    # ranked threads whose messages match `query`, each with a snippet
+    return message_index.search(query, limit=limit)
 
-    print(list(all_threads))
\ No newline at end of file
+def fetch_message_window(thread_id, limit=MESSAGE_WINDOW_SIZE, before=None):
+    # last `limit` messages (before seq `before`), read without loading the checkpoint
+    return message_index.message_window(thread_id, limit=limit, before=before)
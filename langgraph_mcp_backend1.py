@@ -1,8 +1,8 @@
 from langgraph.graph import StateGraph, START, END
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from dotenv import load_dotenv
 from langchain_core.messages import BaseMessage, HumanMessage
-from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langchain_core.runnables import RunnableConfig
 from langchain.tools import BaseTool
 from typing import TypedDict, Annotated
 from langgraph.graph.message import add_messages
@@ -12,11 +12,34 @@ from langchain_core.tools import tool
 from langchain_community.tools import DuckDuckGoSearchRun
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from checkpoint_serde import make_checkpoint_serde
+from checkpointers import CachedCheckpointSaver
+from context_window import ContextSummarizer, context_messages
+from fast_path import FastPath, fast_path_condition
+from llm_limiter import FairLimiter, fairness_key
+from rate_limiter import RateLimitedEmbeddings, chat_quota, embedding_quota
+from response_cache import AsyncPostgresResponseStore, ResponseCache, areplay, cache_key
+from semantic_cache import SemanticCache
+from singleflight import Singleflight, ashared_model_call
+from message_index import (
+    MESSAGE_WINDOW_SIZE,
+    SEARCH_LIMIT,
+    AsyncPostgresMessageIndex,
+    MessageIndexCheckpointSaver,
+    window_from_messages,
+)
+from model_resilience import FALLBACK_MODEL, ResilientModel
+from model_router import FLASH_MODEL, PRO_MODEL, ModelRouter
+from postgres_checkpoint import PooledAsyncPostgresSaver, open_async_pool
+from thread_catalog import THREADS_PAGE_SIZE, AsyncPostgresThreadCatalog, CatalogCheckpointSaver
+from thread_prefetch import ThreadPrefetcher
+from turn_scheduler import TurnScheduler
 
 import psycopg
 import requests
 import os
 import threading
+import time
 import sys
 
 load_dotenv()
@@ -42,6 +65,8 @@ def submit_async_task(coro):
     # Schedule a coroutine on the backend event loop.
     return _submit_async(coro)
 
+flights = Singleflight()
+
 search_tool = DuckDuckGoSearchRun(response_format='content')
 
 @tool
@@ -73,17 +98,26 @@ def calculator(num1: int, num2: int, operation: str) -> dict:
     except Exception as e:
         return {'error': str(e)}
     
+def _fetch_stock_price(symbol: str) -> dict:
+    url =  f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={os.environ['STOCK_API_KEY']}"
+    response = requests.get(url=url)
+    return response.json()
+
 @tool
-def stock_price(symbol: str):
+async def stock_price(symbol: str):
     """
     Fetch stock price by the given symbol(e.g. AAPL, TSLA)
     Use given API key for fetch the stock price details.
     """
-    url =  f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={os.environ['STOCK_API_KEY']}"
-    response = requests.get(url=url)
-    return response.json()
+    return await flights.do(
+        f"stock_price:{symbol.strip().upper()}", lambda: asyncio.to_thread(_fetch_stock_price, symbol)
+    )
 
-llm = ChatGoogleGenerativeAI(model='gemini-2.5-flash')
+llm = ChatGoogleGenerativeAI(model=FLASH_MODEL, **chat_quota.model_kwargs())
+pro_llm = ChatGoogleGenerativeAI(model=PRO_MODEL, **chat_quota.model_kwargs())
+fallback_llm = ChatGoogleGenerativeAI(model=FALLBACK_MODEL, **chat_quota.model_kwargs())
+# every Gemini call of the process shares one quota, interactive turns first
+embeddings = RateLimitedEmbeddings(GoogleGenerativeAIEmbeddings(model="gemini-embedding-001"), embedding_quota)
 
 # build MCP client
 client = MultiServerMCPClient(
@@ -97,6 +131,10 @@ client = MultiServerMCPClient(
 
 class ChatState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    # rolling summary of messages[:summarized], kept by context_window
+    summary: str
+    summarized: int
+    route: str
 
 def load_mcp_tools() -> list[BaseTool]:
     try:
@@ -109,15 +147,46 @@ tools = load_mcp_tools()
 print(tools)
 
 ll_with_tools = llm.bind_tools([calculator, stock_price, search_tool, *tools])
-async def chat_node(state: ChatState):
+router = ModelRouter({'flash': ll_with_tools, 'pro': pro_llm.bind_tools([calculator, stock_price, search_tool, *tools])})
+# straggling calls are hedged on Flash, failed ones retried on the fallback model
+resilience = ResilientModel(fallback=fallback_llm.bind_tools([calculator, stock_price, search_tool, *tools]), hedge=ll_with_tools)
+# caps Gemini calls in flight on the backend loop; waiting users are served in turn
+llm_limiter = FairLimiter()
+
+# the same opening question in other words gets the stored answer; MCP tools have side effects
+semantic_cache = SemanticCache(
+    embeddings, verify_model=llm, limiter=llm_limiter, exclude_tools=[t.name for t in tools]
+)
+
+async def chat_node(state: ChatState, config: RunnableConfig):
     """
     LLM Node may answer the question or requests for a call.
     """
-    messages = state['messages']
-    response = ll_with_tools.invoke(messages)
+    # recent turns verbatim, older ones through the rolling summary
+    messages = context_messages(state)
+    route = router.route_of(state)
+    model = router.models[route]
+    # a prompt answered before is replayed from the cache, streamed like a live answer
+    if (cached := await response_cache.aget(model, messages)) is not None:
+        return {'messages': [await areplay(cached, config)]}
+    if (similar := await semantic_cache.alookup(state['messages'])) is not None:
+        return {'messages': [await areplay(similar, config, cache="semantic")]}
+    # awaited, so other conversations keep streaming during the call; users
+    # asking the same thing at once share one call and each get its tokens
+    started = time.perf_counter()
+    response = await ashared_model_call(
+        flights, cache_key(model, messages), model, messages,
+        config=config, limiter=llm_limiter, limiter_key=fairness_key(config),
+        resilience=resilience, route=route
+    )
+    router.record(route, time.perf_counter() - started, response)
+    await response_cache.aput(model, messages, response)
+    await semantic_cache.aremember(state['messages'], response)
     return {'messages': [response]}
 
 tool_node = ToolNode([calculator, search_tool, stock_price, *tools])
+# unambiguous calculator / stock quote turns are answered without the model
+fast_path = FastPath(calculator=calculator, stock_price=stock_price)
 
 # Estalish the database connection
 #conn = sqlite3.connect('chatarena.db', check_same_thread=False)
@@ -126,18 +195,28 @@ DB_URI = os.environ["DB_URL"]
 #checkpoint = SqliteSaver(conn=conn)
 
 async def _init_checkpointer():
-    conn = await psycopg.AsyncConnection.connect(DB_URI)
-    await conn.set_autocommit(True)
-    checkpoint = AsyncPostgresSaver(conn)
+    # pooled for the life of the process: a dropped connection is replaced, and
+    # sessions don't queue behind one connection's lock
+    checkpoint = PooledAsyncPostgresSaver(await open_async_pool(DB_URI), serde=make_checkpoint_serde())
     await checkpoint.setup()
-    return checkpoint
+    catalog = AsyncPostgresThreadCatalog(checkpoint)
+    await catalog.asetup()
+    message_index = AsyncPostgresMessageIndex(checkpoint)
+    await message_index.asetup()
+    return CachedCheckpointSaver(
+        CatalogCheckpointSaver(MessageIndexCheckpointSaver(checkpoint, message_index), catalog)
+    )
 
 """ async with AsyncPostgresSaver.from_conn_string(DB_URI) as checkpoint:
     checkpoint.setup() """
 
 graph = StateGraph(ChatState)
 graph.add_node('chat_node', chat_node)
-graph.add_edge(START, 'chat_node')
+graph.add_node('router', router.node())
+graph.add_node('fast_path', fast_path.anode())
+graph.add_edge(START, 'fast_path')
+graph.add_conditional_edges('fast_path', fast_path_condition, ['router', END])
+graph.add_edge('router', 'chat_node')
 
 if tool_node:
     graph.add_node('tools', tool_node)
@@ -150,15 +229,53 @@ else:
 checkpointer = run_async(_init_checkpointer())
 chatbot = graph.compile(checkpointer)
 
+# model responses by exact prompt, kept in memory and next to the checkpoints
+response_cache = ResponseCache(AsyncPostgresResponseStore(checkpointer))
+run_async(response_cache.store.asetup())
+
+# folds old turns into the thread's summary once a turn has finished streaming
+summarizer = ContextSummarizer(chatbot, llm, limiter=llm_limiter)
+
+# one run at a time per thread; messages sent meanwhile are merged into the next turn
+turns = TurnScheduler(chatbot, after_turn=summarizer.arefresh)
+
+def thread_queue_depth(thread_id):
+    # messages waiting for the turn in progress on this thread to finish
+    return turns.queue_depth(thread_id)
+
 async def _alist_threads():
-    all_threads = set()
-    async for checkpoint in checkpointer.alist(None):
-        all_threads.add(checkpoint.config['configurable']['thread_id'])
-    return list(all_threads)
+    # served from the threads catalog instead of walking every checkpoint
+    return await checkpointer.catalog.alist_thread_ids()
 
 def retrieve_all_threads():
     return run_async(_alist_threads())
 
+def retrieve_threads_page(limit=THREADS_PAGE_SIZE, before=None):
+    # newest first; pass page.next_cursor as `before` to get the next page
+    return run_async(checkpointer.catalog.alist_threads_page(limit=limit, before=before))
+
+def retrieve_thread_titles(thread_ids):
+    # stored titles for a set of threads in one query
+    return run_async(checkpointer.catalog.aget_thread_titles(thread_ids))
+
+def search_threads(query, limit=SEARCH_LIMIT):
+    # ranked threads whose messages match `query`, each with a snippet
+    return run_async(checkpointer.message_index.asearch(query, limit=limit))
+
+def retrieve_message_window(thread_id, limit=MESSAGE_WINDOW_SIZE, before=None):
+    # last `limit` messages (before seq `before`), read without loading the checkpoint
+    if before is None and (cached := checkpointer.peek(thread_id)) is not None:
+        # warm thread (prefetched or active): no database round trip
+        return window_from_messages(cached.checkpoint["channel_values"].get("messages") or [], limit)
+    return run_async(checkpointer.message_index.amessage_window(thread_id, limit=limit, before=before))
+
+prefetcher = ThreadPrefetcher(checkpointer)
+
+def prefetch_recent_threads(k=None, caller=None):
+    # warm the checkpoint cache for the K most recently active threads, in the background;
+    # a new call only cancels the same caller's (session's) earlier prefetch
+    return prefetcher.submit(_ASYNC_LOOP, k, caller=caller)
+
 # test purpose
 """ config = {'configurable': {'thread_id': 'thread-1'}}
 for message, metadata in chatbot.stream(
@@ -5,7 +5,6 @@ from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmb
 from dotenv import load_dotenv
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_core.runnables.config import RunnableConfig
-from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from langchain.tools import BaseTool
 from typing import TypedDict, Annotated, Dict, Any, Optional
 from langgraph.graph.message import add_messages
@@ -18,14 +17,37 @@ from langchain_core.tools import tool
 from langchain_community.tools import DuckDuckGoSearchRun
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from checkpoint_serde import make_checkpoint_serde
+from checkpointers import CachedCheckpointSaver
+from context_window import ContextSummarizer, context_messages
+from document_store import thread_documents
+from fast_path import FastPath, fast_path_condition
+from llm_limiter import FairLimiter, fairness_key
+from rate_limiter import RateLimitedEmbeddings, background, chat_quota, embedding_quota
+from response_cache import AsyncPostgresResponseStore, ResponseCache, areplay, cache_key
+from semantic_cache import SemanticCache
+from singleflight import Singleflight, ashared_model_call
+from message_index import (
+    MESSAGE_WINDOW_SIZE,
+    SEARCH_LIMIT,
+    AsyncPostgresMessageIndex,
+    MessageIndexCheckpointSaver,
+    window_from_messages,
+)
+from model_resilience import FALLBACK_MODEL, ResilientModel
+from model_router import FLASH_MODEL, PRO_MODEL, ModelRouter
+from postgres_checkpoint import PooledAsyncPostgresSaver, open_async_pool
+from thread_catalog import THREADS_PAGE_SIZE, AsyncPostgresThreadCatalog, CatalogCheckpointSaver
+from thread_prefetch import ThreadPrefetcher
+from turn_scheduler import TurnScheduler
 
 import psycopg
 import requests
 import os
 import threading
+import time
 import sys
 import tempfile
-import streamlit as st
 
 load_dotenv()
 
@@ -38,32 +60,27 @@ _ASYNC_LOOP = asyncio.new_event_loop()
 _ASYNC_THREAD = threading.Thread(target=_ASYNC_LOOP.run_forever, daemon=True)
 _ASYNC_THREAD.start()
 
-# PDF retriever store(per thread)
-""" _THREAD_RETRIEVERS: Dict[str, Any] = {}
-_THREAD_METADATA: Dict[str, dict] = {} """
-
-# Persist across Streamlit reruns / Added on 11-04-2026
-if "retrievers" not in st.session_state:
-    st.session_state["retrievers"] = {}
-
-if "metadata" not in st.session_state:
-    st.session_state["metadata"] = {}
-
-_THREAD_RETRIEVERS = st.session_state["retrievers"]
-_THREAD_METADATA = st.session_state["metadata"]
-
-llm = ChatGoogleGenerativeAI(model='gemini-2.5-flash')
-embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
+llm = ChatGoogleGenerativeAI(model=FLASH_MODEL, **chat_quota.model_kwargs())
+pro_llm = ChatGoogleGenerativeAI(model=PRO_MODEL, **chat_quota.model_kwargs())
+fallback_llm = ChatGoogleGenerativeAI(model=FALLBACK_MODEL, **chat_quota.model_kwargs())
+# every Gemini call of the process shares one quota, interactive turns first
+embeddings = RateLimitedEmbeddings(GoogleGenerativeAIEmbeddings(model="gemini-embedding-001"), embedding_quota)
 
 def _get_retriever(thread_id: Optional[str]):
     """Fetch the retriever for a thread if available."""
-    if thread_id and str(thread_id) in _THREAD_RETRIEVERS:
-        return _THREAD_RETRIEVERS[str(thread_id)]
-    return None
+    # process-wide store, kept across reloads of this module (document_store.py)
+    return thread_documents.retriever(thread_id)
+
+def thread_has_document(thread_id: str) -> bool:
+    return str(thread_id) in thread_documents
+
+def thread_document_metadata(thread_id: str) -> dict:
+    return thread_documents.metadata(str(thread_id))
 
-def ingest_pdf(file_bytes: bytes, thread_id: str, filename: Optional[str] = None) -> dict:
+def ingest_pdf(file_bytes: bytes, thread_id: str, filename: Optional[str] = None, catalog: bool = True) -> dict:
     """
     Build a FAISS retriever for the uploaded PDF and store it for the thread.
+    With `catalog=False` the thread is not marked in the threads catalog.
 
     Returns a summary dict that can be surfaced in the UI.
     """
@@ -83,17 +100,20 @@ def ingest_pdf(file_bytes: bytes, thread_id: str, filename: Optional[str] = None
         )
         chunks = splitter.split_documents(docs)
 
-        vector_store = FAISS.from_documents(chunks, embeddings)
+        # bulk embedding waits behind interactive turns for the shared quota
+        with background():
+            vector_store = FAISS.from_documents(chunks, embeddings)
         retriever = vector_store.as_retriever(
             search_type="similarity", search_kwargs={"k": 4}
         )
 
-        _THREAD_RETRIEVERS[str(thread_id)] = retriever
-        _THREAD_METADATA[str(thread_id)] = {
+        thread_documents.put(str(thread_id), retriever, {
             "filename": filename or os.path.basename(temp_path),
             "documents": len(docs),
             "chunks": len(chunks),
-        }
+        })
+        if catalog:
+            run_async(checkpointer.catalog.amark_document(str(thread_id)))
 
         return {
             "filename": filename or os.path.basename(temp_path),
@@ -117,6 +137,8 @@ def submit_async_task(coro):
     # Schedule a coroutine on the backend event loop.
     return _submit_async(coro)
 
+flights = Singleflight()
+
 search_tool = DuckDuckGoSearchRun(response_format='content')
 
 @tool
@@ -148,15 +170,20 @@ def calculator(num1: int, num2: int, operation: str) -> dict:
     except Exception as e:
         return {'error': str(e)}
     
+def _fetch_stock_price(symbol: str) -> dict:
+    url =  f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={os.environ['STOCK_API_KEY']}"
+    response = requests.get(url=url)
+    return response.json()
+
 @tool
-def stock_price(symbol: str):
+async def stock_price(symbol: str):
     """
     Fetch stock price by the given symbol(e.g. AAPL, TSLA)
     Use given API key for fetch the stock price details.
     """
-    url =  f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={os.environ['STOCK_API_KEY']}"
-    response = requests.get(url=url)
-    return response.json()
+    return await flights.do(
+        f"stock_price:{symbol.strip().upper()}", lambda: asyncio.to_thread(_fetch_stock_price, symbol)
+    )
 
 @tool
 def rag_tool(query: str, config: RunnableConfig) -> dict:
@@ -186,7 +213,7 @@ def rag_tool(query: str, config: RunnableConfig) -> dict:
         "query": query,
         "context": context,
         "metadata": metadata,
-        "source_file": _THREAD_METADATA.get(str(thread_id), {}).get("filename")
+        "source_file": thread_documents.metadata(str(thread_id)).get("filename")
     }
 
 # build MCP client
@@ -210,6 +237,10 @@ client = MultiServerMCPClient(
 
 class ChatState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    # rolling summary of messages[:summarized], kept by context_window
+    summary: str
+    summarized: int
+    route: str
 
 def load_mcp_tools() -> list[BaseTool]:
     try:
@@ -224,29 +255,59 @@ print(mcp_tools)
 tools = [calculator, stock_price, search_tool, rag_tool, *mcp_tools]
 
 ll_with_tools = llm.bind_tools(tools)
-async def chat_node(state: ChatState, **kwargs):
+router = ModelRouter({'flash': ll_with_tools, 'pro': pro_llm.bind_tools(tools)})
+# straggling calls are hedged on Flash, failed ones retried on the fallback model
+resilience = ResilientModel(fallback=fallback_llm.bind_tools(tools), hedge=ll_with_tools)
+# caps Gemini calls in flight on the backend loop; waiting users are served in turn
+llm_limiter = FairLimiter()
+
+# the same opening question in other words gets the stored answer; MCP tools have side effects
+semantic_cache = SemanticCache(
+    embeddings, verify_model=llm, limiter=llm_limiter, exclude_tools=[t.name for t in mcp_tools]
+)
+
+async def chat_node(state: ChatState, config: RunnableConfig):
     """
     LLM Node may answer the question or requests for a call.
     """
-    config: RunnableConfig = kwargs.get("config", {})
-    messages = [
-        SystemMessage(content="""
+    # recent turns verbatim, older ones through the rolling summary
+    messages = context_messages(state, system_prompt="""
             You are a helpful assistant.
 
             If a document is uploaded, ALWAYS use rag_tool to answer questions about it.
             Do NOT answer from general knowledge if the answer exists in the document.
-            """),
-        *state['messages']
-    ]
+            """)
     #messages = state['messages']
-    #thread_id = config.get("configurable", {}).get("thread_id")
-    response = ll_with_tools.invoke(
-        messages,
-        config=config
+    thread_id = config.get("configurable", {}).get("thread_id")
+    # another thread's answer never stands in for one about this thread's document
+    context_free = not thread_has_document(thread_id)
+    route = router.route_of(state)
+    model = router.models[route]
+    # batch_qa.py --no-cache runs with the caches switched off, for reads and writes
+    use_cache = config.get("configurable", {}).get("cache", True)
+    # a prompt answered before is replayed from the cache, streamed like a live answer
+    if use_cache and (cached := await response_cache.aget(model, messages)) is not None:
+        return {'messages': [await areplay(cached, config)]}
+    if use_cache and context_free and (similar := await semantic_cache.alookup(state['messages'])) is not None:
+        return {'messages': [await areplay(similar, config, cache="semantic")]}
+    # awaited, so other conversations keep streaming during the call; users
+    # asking the same thing at once share one call and each get its tokens
+    started = time.perf_counter()
+    response = await ashared_model_call(
+        flights, cache_key(model, messages), model, messages,
+        config=config, limiter=llm_limiter, limiter_key=fairness_key(config),
+        resilience=resilience, route=route
     )
+    router.record(route, time.perf_counter() - started, response)
+    if use_cache:
+        await response_cache.aput(model, messages, response)
+    if use_cache and context_free:
+        await semantic_cache.aremember(state['messages'], response)
     return {'messages': [response]}
 
 tool_node = ToolNode(tools)
+# unambiguous calculator / stock quote turns are answered without the model
+fast_path = FastPath(calculator=calculator, stock_price=stock_price)
 
 # Estalish the database connection
 #conn = sqlite3.connect('chatarena.db', check_same_thread=False)
@@ -255,18 +316,28 @@ DB_URI = os.environ["DB_URL"]
 #checkpoint = SqliteSaver(conn=conn)
 
 async def _init_checkpointer():
-    conn = await psycopg.AsyncConnection.connect(DB_URI)
-    await conn.set_autocommit(True)
-    checkpoint = AsyncPostgresSaver(conn)
+    # pooled for the life of the process: a dropped connection is replaced, and
+    # sessions don't queue behind one connection's lock
+    checkpoint = PooledAsyncPostgresSaver(await open_async_pool(DB_URI), serde=make_checkpoint_serde())
     await checkpoint.setup()
-    return checkpoint
+    catalog = AsyncPostgresThreadCatalog(checkpoint)
+    await catalog.asetup()
+    message_index = AsyncPostgresMessageIndex(checkpoint)
+    await message_index.asetup()
+    return CachedCheckpointSaver(
+        CatalogCheckpointSaver(MessageIndexCheckpointSaver(checkpoint, message_index), catalog)
+    )
 
 """ async with AsyncPostgresSaver.from_conn_string(DB_URI) as checkpoint:
     checkpoint.setup() """
 
 graph = StateGraph(ChatState)
 graph.add_node('chat_node', chat_node)
-graph.add_edge(START, 'chat_node')
+graph.add_node('router', router.node(has_document=thread_has_document))
+graph.add_node('fast_path', fast_path.anode())
+graph.add_edge(START, 'fast_path')
+graph.add_conditional_edges('fast_path', fast_path_condition, ['router', END])
+graph.add_edge('router', 'chat_node')
 
 if tool_node:
     graph.add_node('tools', tool_node)
@@ -279,20 +350,58 @@ else:
 checkpointer = run_async(_init_checkpointer())
 chatbot = graph.compile(checkpointer)
 
+# model responses by exact prompt, kept in memory and next to the checkpoints
+response_cache = ResponseCache(AsyncPostgresResponseStore(checkpointer))
+run_async(response_cache.store.asetup())
+
+# folds old turns into the thread's summary once a turn has finished streaming
+summarizer = ContextSummarizer(chatbot, llm, limiter=llm_limiter)
+
+# one run at a time per thread; messages sent meanwhile are merged into the next turn
+turns = TurnScheduler(chatbot, after_turn=summarizer.arefresh)
+
+def thread_queue_depth(thread_id):
+    # messages waiting for the turn in progress on this thread to finish
+    return turns.queue_depth(thread_id)
+
 async def _alist_threads():
-    all_threads = set()
-    async for checkpoint in checkpointer.alist(None):
-        all_threads.add(checkpoint.config['configurable']['thread_id'])
-    return list(all_threads)
+    # served from the threads catalog instead of walking every checkpoint
+    return await checkpointer.catalog.alist_thread_ids()
 
 def retrieve_all_threads():
     return run_async(_alist_threads())
 
-def thread_has_document(thread_id: str) -> bool:
-    return str(thread_id) in _THREAD_RETRIEVERS
-
-def thread_document_metadata(thread_id: str) -> dict:
-    return _THREAD_METADATA.get(str(thread_id), {})
+def retrieve_threads_page(limit=THREADS_PAGE_SIZE, before=None):
+    # newest first; pass page.next_cursor as `before` to get the next page
+    return run_async(checkpointer.catalog.alist_threads_page(limit=limit, before=before))
+
+def retrieve_thread_titles(thread_ids):
+    # stored titles for a set of threads in one query
+    return run_async(checkpointer.catalog.aget_thread_titles(thread_ids))
+
+def search_threads(query, limit=SEARCH_LIMIT):
+    # ranked threads whose messages match `query`, each with a snippet
+    return run_async(checkpointer.message_index.asearch(query, limit=limit))
+
+def retrieve_message_window(thread_id, limit=MESSAGE_WINDOW_SIZE, before=None):
+    # last `limit` messages (before seq `before`), read without loading the checkpoint
+    if before is None and (cached := checkpointer.peek(thread_id)) is not None:
+        # warm thread (prefetched or active): no database round trip
+        return window_from_messages(cached.checkpoint["channel_values"].get("messages") or [], limit)
+    return run_async(checkpointer.message_index.amessage_window(thread_id, limit=limit, before=before))
+
+prefetcher = ThreadPrefetcher(checkpointer)
+
+def prefetch_recent_threads(k=None, caller=None):
+    # warm the checkpoint cache for the K most recently active threads, in the background;
+    # a new call only cancels the same caller's (session's) earlier prefetch
+    return prefetcher.submit(_ASYNC_LOOP, k, caller=caller)
+
+async def ashare_document(source_thread_id: str, thread_id: str, catalog: bool = True) -> None:
+    # another thread asks about the same PDF without embedding it again (batch_qa.py)
+    thread_documents.share(str(source_thread_id), str(thread_id))
+    if catalog:
+        await checkpointer.catalog.amark_document(str(thread_id))
 
 # test purpose
 """ config = {'configurable': {'thread_id': 'thread-1'}}
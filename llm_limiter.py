@@ -0,0 +1,95 @@
+"""
+Concurrency limit for model calls on a backend event loop.
+
+All conversations of a process share one event loop, so the number of
+Gemini calls in flight has to be capped (LLM_MAX_CONCURRENCY) or a burst of
+users runs into the provider's rate limits all at once. A plain semaphore
+wakes waiters first come, first served, so one user with many queued calls
+(a long tool loop, several tabs) would hold every slot in turn. FairLimiter
+hands a freed slot to the next user in round-robin order instead. Each user
+is queued by `user_id` from the run's configurable, falling back to
+`thread_id`.
+"""
+import asyncio
+import os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+def fairness_key(config: Optional[RunnableConfig]) -> str:
+    """Who a model call is queued for: the run's user_id, else its thread_id."""
+    configurable = (config or {}).get("configurable", {})
+    return str(configurable.get("user_id") or configurable.get("thread_id") or "")
+
+
+class FairLimiter:
+    """At most `max_concurrency` holders; waiting users are served round-robin."""
+
+    def __init__(self, max_concurrency: Optional[int] = None) -> None:
+        self.max_concurrency = max_concurrency or int(
+            os.environ.get("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+        )
+        self.active = 0
+        self._waiters: "OrderedDict[str, deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "waiting_users": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+        }
+
+    async def acquire(self, key: str) -> None:
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just before the cancel landed
+                self.release()
+            else:
+                self._discard(key, waiter)
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        while self._waiters and self.active < self.max_concurrency:
+            # the user at the front gets one slot, then goes to the back
+            key, queue = next(iter(self._waiters.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(key)
+            else:
+                del self._waiters[key]
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+    def _discard(self, key: str, waiter: asyncio.Future) -> None:
+        queue = self._waiters.get(key)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._waiters[key]
+
+    @asynccontextmanager
+    async def slot(self, key: str) -> AsyncIterator[None]:
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
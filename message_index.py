@@ -0,0 +1,468 @@
+"""
+Full-text search over conversation history.
+
+Finding an old chat meant opening threads one by one through get_state.
+MessageIndexCheckpointSaver copies the text of every message into a
+`thread_messages` table as root checkpoints are written (only the messages
+appended since the last write), indexed with FTS5 on SQLite and a tsvector
+GIN index on Postgres, so search_threads() is a single indexed query.
+
+The same table serves message_window(): the last N messages of a thread
+(and earlier ones on demand) without deserializing the whole history.
+"""
+from typing import Any, NamedTuple, Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+from checkpointers import DelegatingCheckpointSaver, written_with_checkpoint
+from thread_catalog import message_text
+
+SEARCH_LIMIT = 20
+MESSAGE_WINDOW_SIZE = 50
+
+
+class MessageWindow(NamedTuple):
+    """Consecutive messages of a thread, oldest first, as {seq, role, content}.
+
+    `before` is the seq of the first message, to pass as `before` for the
+    window preceding this one; None when the window starts the thread.
+    """
+
+    messages: list[dict]
+    before: Optional[int]
+
+
+def _window(rows: list[dict], limit: int) -> MessageWindow:
+    # rows are newest first with one extra to know if earlier messages exist
+    messages = rows[:limit][::-1]
+    has_earlier = len(rows) > limit
+    return MessageWindow(messages, messages[0]["seq"] if has_earlier else None)
+
+
+def window_from_messages(
+    messages: Sequence[BaseMessage], limit: int = MESSAGE_WINDOW_SIZE, before: Optional[int] = None
+) -> MessageWindow:
+    """The same window message_window() returns, cut from an in-memory history."""
+    end = len(messages) if before is None else before
+    start = max(end - limit, 0)
+    return MessageWindow(
+        [
+            {"seq": seq, "role": m.type, "content": message_text(m.content)}
+            for seq, m in enumerate(messages[start:end], start)
+        ],
+        start if start > 0 else None,
+    )
+
+
+def _root_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": str(thread_id), "checkpoint_ns": ""}}
+
+
+def _message_rows(thread_id: str, messages: Sequence[BaseMessage], start: int) -> list[tuple]:
+    return [
+        (str(thread_id), seq, getattr(m, "id", None), m.type, message_text(m.content))
+        for seq, m in enumerate(messages[start:], start)
+    ]
+
+
+def _index_start(last: Optional[tuple], messages: Sequence[BaseMessage]) -> Optional[int]:
+    """
+    Position of the first message not indexed yet, or None when the stored
+    rows no longer match the history (a message was removed or replaced)
+    and the thread has to be indexed again from scratch.
+    """
+    if last is None:
+        return 0
+    seq, message_id = last
+    if seq < len(messages) and getattr(messages[seq], "id", None) == message_id:
+        return seq + 1
+    return None
+
+
+def _index_statements(
+    thread_id: str,
+    messages: Sequence[BaseMessage],
+    last: Optional[tuple],
+    delete_from: str,
+    insert: str,
+) -> list[tuple[str, tuple]]:
+    """
+    Statements bringing the thread's rows in line with `messages`, given the
+    last indexed (seq, message_id). Rows from the first new seq on are
+    deleted first, so running them twice leaves the same rows.
+    """
+    start = _index_start(last, messages)
+    start = 0 if start is None else start
+    if start >= len(messages):
+        return []
+    return [(delete_from, (str(thread_id), start))] + [
+        (insert, row) for row in _message_rows(thread_id, messages, start)
+    ]
+
+
+def _upper_seq(before: Optional[int]) -> int:
+    # seq is an INTEGER column on both backends, 2**31 - 1 is past any thread
+    return 2**31 - 1 if before is None else before
+
+
+def fts5_query(query: str) -> str:
+    """User input as an FTS5 query: every word must match, the last one as a prefix."""
+    terms = ['"%s"' % term.replace('"', '""') for term in query.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+# ----------- SQLite ----------- #
+SQLITE_SETUP = (
+    """CREATE TABLE IF NOT EXISTS thread_messages (
+        thread_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        message_id TEXT,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (thread_id, seq)
+    )""",
+    # external content table: the text is stored once, in thread_messages
+    """CREATE VIRTUAL TABLE IF NOT EXISTS thread_messages_fts USING fts5(
+        content, content='thread_messages', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS thread_messages_ai AFTER INSERT ON thread_messages BEGIN
+        INSERT INTO thread_messages_fts(rowid, content) VALUES (new.rowid, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS thread_messages_ad AFTER DELETE ON thread_messages BEGIN
+        INSERT INTO thread_messages_fts(thread_messages_fts, rowid, content)
+        VALUES ('delete', old.rowid, old.content);
+    END""",
+)
+
+SQLITE_WINDOW = """
+    SELECT seq, role, content FROM thread_messages
+    WHERE thread_id = ? AND seq < ?
+    ORDER BY seq DESC
+    LIMIT ?
+"""
+
+SQLITE_INSERT = """
+    INSERT INTO thread_messages (thread_id, seq, message_id, role, content)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+SQLITE_LAST = "SELECT seq, message_id FROM thread_messages WHERE thread_id = ? ORDER BY seq DESC LIMIT 1"
+
+SQLITE_DELETE_FROM = "DELETE FROM thread_messages WHERE thread_id = ? AND seq >= ?"
+
+# best matching message per thread, best threads first (bm25: lower is better).
+# FTS5 auxiliary functions can't run under a window function, so the hits
+# are materialized first and snippet() only runs for the rows kept.
+SQLITE_SEARCH = """
+    WITH hits AS MATERIALIZED (
+        SELECT rowid, bm25(thread_messages_fts) AS score
+        FROM thread_messages_fts
+        WHERE thread_messages_fts MATCH :match
+    ),
+    top AS MATERIALIZED (
+        SELECT thread_id, rowid, score FROM (
+            SELECT m.thread_id, hits.rowid, hits.score,
+                   row_number() OVER (PARTITION BY m.thread_id ORDER BY hits.score) AS n
+            FROM hits JOIN thread_messages m ON m.rowid = hits.rowid
+        )
+        WHERE n = 1
+        ORDER BY score
+        LIMIT :limit
+    )
+    SELECT top.thread_id, threads.title,
+           snippet(thread_messages_fts, 0, '**', '**', '…', 16) AS snippet,
+           -top.score AS rank
+    FROM thread_messages_fts
+    JOIN top ON top.rowid = thread_messages_fts.rowid
+    LEFT JOIN threads ON threads.thread_id = top.thread_id
+    WHERE thread_messages_fts MATCH :match
+    ORDER BY top.score
+"""
+
+
+class SqliteMessageIndex:
+    """FTS5 message index stored next to the checkpoints of a SqliteSaver."""
+
+    def __init__(self, saver: BaseCheckpointSaver) -> None:
+        self.saver = saver
+
+    def setup(self) -> None:
+        with self.saver.cursor() as cur:
+            for statement in SQLITE_SETUP:
+                cur.execute(statement)
+            backfill = cur.execute("SELECT 1 FROM thread_messages LIMIT 1").fetchone() is None
+            thread_ids = (
+                [row[0] for row in cur.execute("SELECT DISTINCT thread_id FROM checkpoints")]
+                if backfill else []
+            )
+        # first run on an existing database: index the history we already have
+        for thread_id in thread_ids:
+            value = self.saver.get_tuple(_root_config(thread_id))
+            if value is not None:
+                self.index_messages(thread_id, value.checkpoint["channel_values"].get("messages") or [])
+
+    def last_indexed(self, thread_id: str) -> Optional[tuple]:
+        """(seq, message_id) of the thread's last indexed message, or None."""
+        with self.saver.cursor(transaction=False) as cur:
+            return cur.execute(SQLITE_LAST, (str(thread_id),)).fetchone()
+
+    def index_statements(
+        self, thread_id: str, messages: Sequence[BaseMessage], last: Optional[tuple]
+    ) -> list[tuple[str, tuple]]:
+        return _index_statements(thread_id, messages, last, SQLITE_DELETE_FROM, SQLITE_INSERT)
+
+    def index_messages(self, thread_id: str, messages: Sequence[BaseMessage]) -> None:
+        statements = self.index_statements(thread_id, messages, self.last_indexed(thread_id))
+        with self.saver.cursor() as cur:
+            for statement, params in statements:
+                cur.execute(statement, params)
+
+    def delete(self, thread_id: str) -> None:
+        with self.saver.cursor() as cur:
+            cur.execute("DELETE FROM thread_messages WHERE thread_id = ?", (str(thread_id),))
+
+    def message_window(
+        self, thread_id: str, limit: int = MESSAGE_WINDOW_SIZE, before: Optional[int] = None
+    ) -> MessageWindow:
+        """The `limit` messages preceding seq `before` (the latest ones by default)."""
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute(SQLITE_WINDOW, (str(thread_id), _upper_seq(before), limit + 1))
+            rows = [{"seq": seq, "role": role, "content": content} for seq, role, content in cur.fetchall()]
+        return _window(rows, limit)
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> list[dict]:
+        """Threads whose messages match `query`, best match first, with a snippet."""
+        if not (match := fts5_query(query)):
+            return []
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute(SQLITE_SEARCH, {"match": match, "limit": limit})
+            columns = [c[0] for c in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+# ----------- Postgres ----------- #
+POSTGRES_SETUP = (
+    """CREATE TABLE IF NOT EXISTS thread_messages (
+        thread_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        message_id TEXT,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
+        PRIMARY KEY (thread_id, seq)
+    )""",
+    "CREATE INDEX IF NOT EXISTS thread_messages_tsv_idx ON thread_messages USING GIN (content_tsv)",
+)
+
+POSTGRES_LAST = """
+    SELECT seq, message_id FROM thread_messages WHERE thread_id = %s ORDER BY seq DESC LIMIT 1
+"""
+
+POSTGRES_DELETE_FROM = "DELETE FROM thread_messages WHERE thread_id = %s AND seq >= %s"
+
+POSTGRES_WINDOW = """
+    SELECT seq, role, content FROM thread_messages
+    WHERE thread_id = %s AND seq < %s
+    ORDER BY seq DESC
+    LIMIT %s
+"""
+
+POSTGRES_INSERT = """
+    INSERT INTO thread_messages (thread_id, seq, message_id, role, content)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (thread_id, seq) DO UPDATE SET
+        message_id = EXCLUDED.message_id, role = EXCLUDED.role, content = EXCLUDED.content
+"""
+
+# ts_headline is costly, so it only runs on the rows that survive the LIMIT
+POSTGRES_SEARCH = """
+    WITH q AS (SELECT websearch_to_tsquery('english', %s) AS query),
+    best AS (
+        SELECT DISTINCT ON (m.thread_id)
+               m.thread_id, m.content, ts_rank(m.content_tsv, q.query) AS rank
+        FROM thread_messages m, q
+        WHERE m.content_tsv @@ q.query
+        ORDER BY m.thread_id, rank DESC
+    ),
+    top AS (SELECT * FROM best ORDER BY rank DESC, thread_id LIMIT %s)
+    SELECT top.thread_id, threads.title,
+           ts_headline('english', top.content, q.query,
+                       'StartSel=**, StopSel=**, MaxWords=24, MinWords=8') AS snippet,
+           top.rank
+    FROM top CROSS JOIN q
+    LEFT JOIN threads ON threads.thread_id = top.thread_id
+    ORDER BY top.rank DESC, top.thread_id
+"""
+
+
+class PostgresMessageIndex:
+    """tsvector message index for a sync PostgresSaver."""
+
+    def __init__(self, saver: BaseCheckpointSaver) -> None:
+        self.saver = saver
+
+    def setup(self) -> None:
+        with self.saver._cursor() as cur:
+            for statement in POSTGRES_SETUP:
+                cur.execute(statement)
+            backfill = cur.execute("SELECT 1 FROM thread_messages LIMIT 1").fetchone() is None
+            thread_ids = (
+                [row["thread_id"] for row in cur.execute(
+                    "SELECT DISTINCT thread_id FROM checkpoints WHERE checkpoint_ns = ''"
+                )]
+                if backfill else []
+            )
+        for thread_id in thread_ids:
+            value = self.saver.get_tuple(_root_config(thread_id))
+            if value is not None:
+                self.index_messages(thread_id, value.checkpoint["channel_values"].get("messages") or [])
+
+    def last_indexed(self, thread_id: str) -> Optional[tuple]:
+        with self.saver._cursor() as cur:
+            cur.execute(POSTGRES_LAST, (str(thread_id),))
+            last = cur.fetchone()
+        return last and (last["seq"], last["message_id"])
+
+    def index_statements(
+        self, thread_id: str, messages: Sequence[BaseMessage], last: Optional[tuple]
+    ) -> list[tuple[str, tuple]]:
+        return _index_statements(thread_id, messages, last, POSTGRES_DELETE_FROM, POSTGRES_INSERT)
+
+    def index_messages(self, thread_id: str, messages: Sequence[BaseMessage]) -> None:
+        statements = self.index_statements(thread_id, messages, self.last_indexed(thread_id))
+        with self.saver._cursor(pipeline=True) as cur:
+            for statement, params in statements:
+                cur.execute(statement, params)
+
+    def delete(self, thread_id: str) -> None:
+        with self.saver._cursor() as cur:
+            cur.execute("DELETE FROM thread_messages WHERE thread_id = %s", (str(thread_id),))
+
+    def message_window(
+        self, thread_id: str, limit: int = MESSAGE_WINDOW_SIZE, before: Optional[int] = None
+    ) -> MessageWindow:
+        with self.saver._cursor() as cur:
+            cur.execute(POSTGRES_WINDOW, (str(thread_id), _upper_seq(before), limit + 1))
+            return _window(cur.fetchall(), limit)
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> list[dict]:
+        if not query.strip():
+            return []
+        with self.saver._cursor() as cur:
+            cur.execute(POSTGRES_SEARCH, (query, limit))
+            return cur.fetchall()
+
+
+class AsyncPostgresMessageIndex:
+    """tsvector message index for an AsyncPostgresSaver."""
+
+    def __init__(self, saver: BaseCheckpointSaver) -> None:
+        self.saver = saver
+
+    async def asetup(self) -> None:
+        async with self.saver._cursor() as cur:
+            for statement in POSTGRES_SETUP:
+                await cur.execute(statement)
+            await cur.execute("SELECT 1 FROM thread_messages LIMIT 1")
+            thread_ids = []
+            if await cur.fetchone() is None:
+                await cur.execute("SELECT DISTINCT thread_id FROM checkpoints WHERE checkpoint_ns = ''")
+                thread_ids = [row["thread_id"] for row in await cur.fetchall()]
+        for thread_id in thread_ids:
+            value = await self.saver.aget_tuple(_root_config(thread_id))
+            if value is not None:
+                await self.aindex_messages(thread_id, value.checkpoint["channel_values"].get("messages") or [])
+
+    async def alast_indexed(self, thread_id: str) -> Optional[tuple]:
+        async with self.saver._cursor() as cur:
+            await cur.execute(POSTGRES_LAST, (str(thread_id),))
+            last = await cur.fetchone()
+        return last and (last["seq"], last["message_id"])
+
+    def index_statements(
+        self, thread_id: str, messages: Sequence[BaseMessage], last: Optional[tuple]
+    ) -> list[tuple[str, tuple]]:
+        return _index_statements(thread_id, messages, last, POSTGRES_DELETE_FROM, POSTGRES_INSERT)
+
+    async def aindex_messages(self, thread_id: str, messages: Sequence[BaseMessage]) -> None:
+        statements = self.index_statements(thread_id, messages, await self.alast_indexed(thread_id))
+        async with self.saver._cursor(pipeline=True) as cur:
+            for statement, params in statements:
+                await cur.execute(statement, params)
+
+    async def adelete(self, thread_id: str) -> None:
+        async with self.saver._cursor() as cur:
+            await cur.execute("DELETE FROM thread_messages WHERE thread_id = %s", (str(thread_id),))
+
+    async def amessage_window(
+        self, thread_id: str, limit: int = MESSAGE_WINDOW_SIZE, before: Optional[int] = None
+    ) -> MessageWindow:
+        async with self.saver._cursor() as cur:
+            await cur.execute(POSTGRES_WINDOW, (str(thread_id), _upper_seq(before), limit + 1))
+            return _window(await cur.fetchall(), limit)
+
+    async def asearch(self, query: str, limit: int = SEARCH_LIMIT) -> list[dict]:
+        if not query.strip():
+            return []
+        async with self.saver._cursor() as cur:
+            await cur.execute(POSTGRES_SEARCH, (query, limit))
+            return await cur.fetchall()
+
+
+# ----------- Checkpointer hook ----------- #
+class MessageIndexCheckpointSaver(DelegatingCheckpointSaver):
+    """
+    Index the messages appended by every root checkpoint write.
+
+    The last indexed row is read first; the rows to add then go to the write
+    through checkpointers.written_with_checkpoint and commit in its
+    transaction, as the thread catalog's upsert does. Other savers get a
+    separate index write right after the checkpoint.
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver, message_index: Any) -> None:
+        super().__init__(saver)
+        self.message_index = message_index
+
+    @staticmethod
+    def _messages(config, checkpoint) -> Optional[list[BaseMessage]]:
+        if config["configurable"].get("checkpoint_ns", ""):
+            return None
+        return checkpoint["channel_values"].get("messages")
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        messages = self._messages(config, checkpoint)
+        statements = []
+        if messages:
+            last = self.message_index.last_indexed(thread_id)
+            statements = self.message_index.index_statements(thread_id, messages, last)
+        with written_with_checkpoint(statements) as pending:
+            next_config = self.saver.put(config, checkpoint, metadata, new_versions)
+        if statements and not pending.written:
+            self.message_index.index_messages(thread_id, messages)
+        return next_config
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        messages = self._messages(config, checkpoint)
+        statements = []
+        if messages:
+            last = await self.message_index.alast_indexed(thread_id)
+            statements = self.message_index.index_statements(thread_id, messages, last)
+        with written_with_checkpoint(statements) as pending:
+            next_config = await self.saver.aput(config, checkpoint, metadata, new_versions)
+        if statements and not pending.written:
+            await self.message_index.aindex_messages(thread_id, messages)
+        return next_config
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.saver.delete_thread(thread_id)
+        self.message_index.delete(thread_id)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self.saver.adelete_thread(thread_id)
+        await self.message_index.adelete(thread_id)
@@ -0,0 +1,319 @@
+"""
+Bulk-copy LangGraph checkpoint history between saver backends.
+
+    python migrate_checkpoints.py --source chatarena.db --target "$DB_URL"
+
+A source or target is either a SQLite file path or a postgres:// URL.
+Checkpoints are streamed in primary-key order (thread_id, checkpoint_ns,
+checkpoint_id): Postgres sources are read through a server-side cursor,
+Postgres targets are written with binary COPY into temp staging tables and
+merged with ON CONFLICT DO NOTHING. After every committed batch the last key
+is written to the state file, so an interrupted run resumes where it stopped
+and re-copying a half-finished batch is harmless.
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Iterator, Optional
+
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from langgraph.checkpoint.base import WRITES_IDX_MAP, CheckpointTuple
+from langgraph.checkpoint.postgres import PostgresSaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from checkpoint_serde import make_checkpoint_serde
+from sqlite_checkpoint import connect_sqlite
+
+Key = tuple[str, str, str]
+_START_KEY: Key = ("", "", "")
+
+
+def is_postgres(uri: str) -> bool:
+    return uri.startswith(("postgres://", "postgresql://"))
+
+
+def _tuple_key(item: CheckpointTuple) -> Key:
+    configurable = item.config["configurable"]
+    return configurable["thread_id"], configurable["checkpoint_ns"], configurable["checkpoint_id"]
+
+
+def _group_writes(item: CheckpointTuple) -> dict[str, list[tuple[str, object]]]:
+    by_task = defaultdict(list)
+    for task_id, channel, value in item.pending_writes or []:
+        by_task[task_id].append((channel, value))
+    return by_task
+
+
+# ----------- Sources ----------- #
+def iter_sqlite(path: str, serde: SerializerProtocol, after: Key, batch_size: int) -> Iterator[CheckpointTuple]:
+    conn = connect_sqlite(path)
+    reader = SqliteSaver(conn, serde=serde)
+    try:
+        cur = conn.cursor()
+        wcur = conn.cursor()
+        cur.arraysize = batch_size
+        cur.execute(
+            """SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata
+            FROM checkpoints
+            WHERE (thread_id, checkpoint_ns, checkpoint_id) > (?, ?, ?)
+            ORDER BY thread_id, checkpoint_ns, checkpoint_id""",
+            after,
+        )
+        for thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, metadata in cur:
+            wcur.execute(
+                "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+            yield CheckpointTuple(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+                reader.serde.loads_typed((type_, checkpoint)),
+                json.loads(metadata) if metadata is not None else {},
+                (
+                    {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                    if parent_id
+                    else None
+                ),
+                [(task_id, channel, reader.serde.loads_typed((t, v))) for task_id, channel, t, v in wcur],
+            )
+    finally:
+        conn.close()
+
+
+def iter_postgres(uri: str, serde: SerializerProtocol, after: Key, batch_size: int) -> Iterator[CheckpointTuple]:
+    # server-side cursors need a transaction, so no autocommit on the read side
+    with psycopg.connect(uri, row_factory=dict_row) as conn:
+        reader = PostgresSaver(conn, serde=serde)
+        with conn.cursor(name="migrate_checkpoints", binary=True, row_factory=dict_row) as cur:
+            cur.itersize = batch_size
+            cur.execute(
+                reader.SELECT_SQL
+                + "WHERE (thread_id, checkpoint_ns, checkpoint_id) > (%s, %s, %s) "
+                + "ORDER BY thread_id, checkpoint_ns, checkpoint_id",
+                after,
+            )
+            for row in cur:
+                yield reader._load_checkpoint_tuple(row)
+
+
+# ----------- Targets ----------- #
+class SqliteTarget:
+    def __init__(self, path: str, serde: SerializerProtocol) -> None:
+        self.conn = connect_sqlite(path)
+        self.saver = SqliteSaver(self.conn, serde=serde)
+        self.saver.setup()
+
+    def write_batch(self, batch: list[CheckpointTuple]) -> dict:
+        checkpoint_rows, write_rows = [], []
+        for item in batch:
+            thread_id, checkpoint_ns, checkpoint_id = _tuple_key(item)
+            parent_id = item.parent_config["configurable"]["checkpoint_id"] if item.parent_config else None
+            checkpoint_rows.append((
+                thread_id, checkpoint_ns, checkpoint_id, parent_id,
+                *self.saver.serde.dumps_typed(item.checkpoint),
+                json.dumps(item.metadata, ensure_ascii=False).encode("utf-8", "ignore"),
+            ))
+            for task_id, writes in _group_writes(item).items():
+                for idx, (channel, value) in enumerate(writes):
+                    write_rows.append((
+                        thread_id, checkpoint_ns, checkpoint_id, task_id,
+                        WRITES_IDX_MAP.get(channel, idx), channel,
+                        *self.saver.serde.dumps_typed(value),
+                    ))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                checkpoint_rows,
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                write_rows,
+            )
+        return {"checkpoints": len(checkpoint_rows), "writes": len(write_rows), "blobs": 0}
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_STAGING = {
+    "checkpoints": (
+        ("thread_id", "checkpoint_ns", "checkpoint_id", "parent_checkpoint_id", "checkpoint", "metadata"),
+        ("text", "text", "text", "text", "jsonb", "jsonb"),
+    ),
+    "checkpoint_blobs": (
+        ("thread_id", "checkpoint_ns", "channel", "version", "type", "blob"),
+        ("text", "text", "text", "text", "text", "bytea"),
+    ),
+    "checkpoint_writes": (
+        ("thread_id", "checkpoint_ns", "checkpoint_id", "task_id", "task_path", "idx", "channel", "type", "blob"),
+        ("text", "text", "text", "text", "text", "int4", "text", "text", "bytea"),
+    ),
+}
+
+
+class PostgresTarget:
+    def __init__(self, uri: str, serde: SerializerProtocol) -> None:
+        self.conn = psycopg.connect(uri, autocommit=True, prepare_threshold=0, row_factory=dict_row)
+        self.saver = PostgresSaver(self.conn, serde=serde)
+        self.saver.setup()
+        for table in _STAGING:
+            self.conn.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS _migrate_{table} "
+                f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+            )
+        # blob versions already staged for the thread being copied; consecutive
+        # checkpoints share the versions of every channel they did not update
+        self._seen_thread: Optional[tuple[str, str]] = None
+        self._seen_versions: set[tuple[str, str]] = set()
+
+    def _rows(self, batch: list[CheckpointTuple]) -> dict[str, list[tuple]]:
+        rows = {table: [] for table in _STAGING}
+        for item in batch:
+            thread_id, checkpoint_ns, checkpoint_id = _tuple_key(item)
+            if self._seen_thread != (thread_id, checkpoint_ns):
+                self._seen_thread = (thread_id, checkpoint_ns)
+                self._seen_versions = set()
+
+            # same split as PostgresSaver.put: primitives inline, the rest as blobs
+            inline, blob_values = {}, {}
+            for channel, value in item.checkpoint["channel_values"].items():
+                if value is None or isinstance(value, (str, int, float, bool)):
+                    inline[channel] = value
+                else:
+                    blob_values[channel] = value
+            versions = {}
+            for channel in blob_values:
+                version = item.checkpoint["channel_versions"][channel]
+                if (channel, str(version)) not in self._seen_versions:
+                    self._seen_versions.add((channel, str(version)))
+                    versions[channel] = version
+            rows["checkpoint_blobs"].extend(
+                self.saver._dump_blobs(thread_id, checkpoint_ns, blob_values, versions)
+            )
+
+            metadata = dict(item.metadata)
+            metadata.pop("writes", None)
+            parent_id = item.parent_config["configurable"]["checkpoint_id"] if item.parent_config else None
+            rows["checkpoints"].append((
+                thread_id, checkpoint_ns, checkpoint_id, parent_id,
+                Jsonb({**item.checkpoint, "channel_values": inline}),
+                Jsonb(metadata),
+            ))
+            for task_id, writes in _group_writes(item).items():
+                rows["checkpoint_writes"].extend(
+                    self.saver._dump_writes(thread_id, checkpoint_ns, checkpoint_id, task_id, "", writes)
+                )
+        return rows
+
+    def write_batch(self, batch: list[CheckpointTuple]) -> dict:
+        rows = self._rows(batch)
+        with self.conn.transaction(), self.conn.cursor() as cur:
+            for table, (columns, types) in _STAGING.items():
+                if not rows[table]:
+                    continue
+                column_list = ", ".join(columns)
+                with cur.copy(f"COPY _migrate_{table} ({column_list}) FROM STDIN (FORMAT BINARY)") as copy:
+                    copy.set_types(list(types))
+                    for row in rows[table]:
+                        copy.write_row(row)
+                cur.execute(
+                    f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM _migrate_{table} "
+                    "ON CONFLICT DO NOTHING"
+                )
+        return {
+            "checkpoints": len(rows["checkpoints"]),
+            "writes": len(rows["checkpoint_writes"]),
+            "blobs": len(rows["checkpoint_blobs"]),
+        }
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+# ----------- Resumable driver ----------- #
+def load_state(path: str, source: str, target: str, restart: bool = False) -> dict:
+    if not restart and os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+        if state.get("source") == source and state.get("target") == target:
+            return state
+        print(f"[migrate] {path} belongs to another source/target pair, starting over")
+    return {"source": source, "target": target, "last_key": list(_START_KEY),
+            "checkpoints": 0, "writes": 0, "blobs": 0, "done": False}
+
+
+def save_state(path: str, state: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def migrate(source: str, target: str, state_file: str, batch_size: int = 500, restart: bool = False) -> dict:
+    serde = make_checkpoint_serde()
+    state = load_state(state_file, source, target, restart)
+    if state["done"]:
+        print(f"[migrate] already complete ({state['checkpoints']} checkpoints), use --restart to copy again")
+        return state
+
+    reader = iter_postgres if is_postgres(source) else iter_sqlite
+    writer = PostgresTarget(target, serde) if is_postgres(target) else SqliteTarget(target, serde)
+    after = tuple(state["last_key"])
+    started = time.perf_counter()
+    copied = 0
+    try:
+        batch: list[CheckpointTuple] = []
+        for item in reader(source, serde, after, batch_size):
+            batch.append(item)
+            if len(batch) < batch_size:
+                continue
+            copied += _flush(writer, batch, state, state_file, started, copied)
+            batch = []
+        if batch:
+            copied += _flush(writer, batch, state, state_file, started, copied)
+        state["done"] = True
+        save_state(state_file, state)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"[migrate] finished: {copied} checkpoints this run in {elapsed:.1f}s "
+        f"({copied / elapsed if elapsed else 0:.0f}/s), {state['checkpoints']} total"
+    )
+    return state
+
+
+def _flush(writer, batch: list[CheckpointTuple], state: dict, state_file: str, started: float, copied: int) -> int:
+    counts = writer.write_batch(batch)
+    for name, value in counts.items():
+        state[name] += value
+    state["last_key"] = list(_tuple_key(batch[-1]))
+    save_state(state_file, state)
+
+    elapsed = time.perf_counter() - started
+    done = copied + len(batch)
+    print(
+        f"[migrate] {state['checkpoints']} checkpoints, {state['writes']} writes, "
+        f"{state['blobs']} blobs | {done / elapsed:.0f} checkpoints/s | at thread {batch[-1].config['configurable']['thread_id']}"
+    )
+    return len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy checkpoint history between SQLite and Postgres savers.")
+    parser.add_argument("--source", required=True, help="SQLite path or postgres:// URL to read from")
+    parser.add_argument("--target", required=True, help="SQLite path or postgres:// URL to write to")
+    parser.add_argument("--batch-size", type=int, default=500, help="checkpoints per committed batch")
+    parser.add_argument("--state-file", default="migrate_checkpoints.state.json")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and copy from the start")
+    args = parser.parse_args()
+    migrate(args.source, args.target, args.state_file, args.batch_size, args.restart)
+
+
+if __name__ == "__main__":
+    main()
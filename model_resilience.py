@@ -0,0 +1,217 @@
+"""
+Deadlines, hedging and a fallback model for chat model calls.
+
+A slow Gemini response used to hold its turn indefinitely. ResilientModel
+wraps the model stream that chat_node consumes:
+
+    hedge       no first token after the route's p95 time-to-first-token
+                (LLM_HEDGE_QUANTILE of the last samples, at least
+                LLM_HEDGE_MIN_DELAY): a second request goes to the hedge
+                model (Flash), and whichever stream starts first is used.
+                The other is cancelled.
+    deadline    no first token within LLM_FIRST_TOKEN_TIMEOUT, or no complete
+                answer within LLM_CALL_TIMEOUT seconds, counts as a failure.
+    fallback    a failure before any token was streamed re-runs the call on
+                the fallback model (LLM_FALLBACK_MODEL). After tokens
+                have reached the user, the error is raised as before.
+
+A call the hedge won, or that timed out, still adds its elapsed time as a
+first-token sample of the route: a lower bound for the primary, so stragglers
+keep pulling the p95 up instead of dropping out of it.
+
+Hedging starts once LLM_HEDGE_MIN_SAMPLES calls were measured for a route;
+LLM_HEDGE=0 turns it off. Sync backends only get the fallback, through
+invoke(). Their deadline is the client's own `timeout=CALL_TIMEOUT`, and
+they get no hedging: a second sync stream would write into the same
+answer. stats() counts hedges fired and won, timeouts, errors and
+fallbacks, and reports p50/p95/p99 latencies per route.
+"""
+import asyncio
+import os
+from collections import Counter, defaultdict, deque
+from typing import AsyncIterator, Optional, Sequence
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.runnables import Runnable
+
+FALLBACK_MODEL = os.environ.get("LLM_FALLBACK_MODEL", "gemini-2.0-flash")
+
+DEFAULT_FIRST_TOKEN_TIMEOUT = 30.0
+DEFAULT_CALL_TIMEOUT = 120.0
+DEFAULT_HEDGE_QUANTILE = 0.95
+DEFAULT_HEDGE_MIN_DELAY = 1.0
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+LATENCY_SAMPLES = 500  # per route, for the quantiles
+
+CALL_TIMEOUT = float(os.environ.get("LLM_CALL_TIMEOUT", DEFAULT_CALL_TIMEOUT))
+
+_END = object()
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _quantile(samples: Sequence[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _next(stream: AsyncIterator) -> object:
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+
+async def _close(stream: AsyncIterator, task: asyncio.Task) -> None:
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+    try:
+        await stream.aclose()
+    except Exception:
+        pass
+
+
+class ResilientModel:
+    """Calls a chat model under deadlines, with hedging and a fallback."""
+
+    def __init__(
+        self,
+        fallback: Optional[Runnable] = None,
+        hedge: Optional[Runnable] = None,
+        first_token_timeout: Optional[float] = None,
+        call_timeout: Optional[float] = None,
+    ) -> None:
+        self.fallback = fallback
+        self.hedge = hedge if os.environ.get("LLM_HEDGE", "1") != "0" else None
+        self.first_token_timeout = first_token_timeout or _env_float(
+            "LLM_FIRST_TOKEN_TIMEOUT", DEFAULT_FIRST_TOKEN_TIMEOUT
+        )
+        self.call_timeout = call_timeout or CALL_TIMEOUT
+        self.hedge_quantile = _env_float("LLM_HEDGE_QUANTILE", DEFAULT_HEDGE_QUANTILE)
+        self.hedge_min_delay = _env_float("LLM_HEDGE_MIN_DELAY", DEFAULT_HEDGE_MIN_DELAY)
+        self.hedge_min_samples = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", DEFAULT_HEDGE_MIN_SAMPLES))
+        self.counts: Counter = Counter()
+        self._first_token: dict[str, deque] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+        self._total: dict[str, deque] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    def hedge_delay(self, route: str) -> Optional[float]:
+        """Seconds to wait for a first token before hedging, or None if not yet known."""
+        samples = self._first_token.get(route, ())
+        if self.hedge is None or len(samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, _quantile(samples, self.hedge_quantile))
+
+    def stats(self) -> dict:
+        def percentiles(samples) -> dict:
+            return {f"p{q}": round(1000 * (_quantile(samples, q / 100) or 0.0), 1) for q in (50, 95, 99)}
+
+        return {
+            **self.counts,
+            "first_token_ms": {route: percentiles(s) for route, s in self._first_token.items()},
+            "total_ms": {route: percentiles(s) for route, s in self._total.items()},
+        }
+
+    async def _start(
+        self, model: Runnable, messages: Sequence[BaseMessage], route: str
+    ) -> tuple[AsyncIterator, object]:
+        """The stream that produced the first chunk, and that chunk."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        primary = model.astream(messages).__aiter__()
+        racing = {asyncio.ensure_future(_next(primary)): primary}
+        hedge_at = self.hedge_delay(route)
+        error: Optional[BaseException] = None
+        hedged = False
+        try:
+            while racing:
+                hedge_pending = hedge_at is not None and not hedged
+                deadline = started + self.first_token_timeout
+                wait_until = min(deadline, started + hedge_at) if hedge_pending else deadline
+                done, _ = await asyncio.wait(
+                    racing, timeout=max(0.0, wait_until - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if loop.time() >= deadline:
+                        self.counts["timeouts"] += 1
+                        self._first_token[route].append(loop.time() - started)
+                        raise asyncio.TimeoutError(f"no first token within {self.first_token_timeout}s")
+                    # the primary is a straggler: race a second request against it
+                    self.counts["hedges_fired"] += 1
+                    hedged = True
+                    hedge = self.hedge.astream(messages).__aiter__()
+                    racing[asyncio.ensure_future(_next(hedge))] = hedge
+                    continue
+                for task in done:
+                    stream = racing.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        self.counts["errors"] += 1
+                        await _close(stream, task)
+                        continue
+                    if stream is not primary:
+                        self.counts["hedges_won"] += 1
+                    # when the hedge won, the primary would have taken at least this long
+                    self._first_token[route].append(loop.time() - started)
+                    return stream, task.result()
+            raise error
+        finally:
+            for task, stream in racing.items():
+                await _close(stream, task)
+
+    async def _stream(
+        self, model: Runnable, messages: Sequence[BaseMessage], route: str
+    ) -> AsyncIterator[AIMessageChunk]:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        stream, chunk = await self._start(model, messages, route)
+        try:
+            while chunk is not _END:
+                yield chunk
+                remaining = started + self.call_timeout - loop.time()
+                try:
+                    chunk = await asyncio.wait_for(_next(stream), timeout=max(0.0, remaining))
+                except asyncio.TimeoutError:
+                    self.counts["timeouts"] += 1
+                    raise
+            self._total[route].append(loop.time() - started)
+        finally:
+            await stream.aclose()
+
+    async def astream(
+        self, model: Runnable, messages: Sequence[BaseMessage], route: str = "default"
+    ) -> AsyncIterator[AIMessageChunk]:
+        """model.astream(messages), under deadlines, hedged, with the fallback model on failure."""
+        self.counts["calls"] += 1
+        streamed = False
+        try:
+            async for chunk in self._stream(model, messages, route):
+                streamed = True
+                yield chunk
+            return
+        except Exception as exc:
+            if streamed or self.fallback is None:
+                raise
+            print(f"[model_resilience] {route} call failed ({exc!r}), using the fallback model")
+        self.counts["fallbacks"] += 1
+        async for chunk in self._stream(self.fallback, messages, "fallback"):
+            yield chunk
+
+    def invoke(self, model: Runnable, messages: Sequence[BaseMessage], route: str = "default") -> BaseMessage:
+        """model.invoke(messages), with the fallback model on failure (sync backends)."""
+        self.counts["calls"] += 1
+        try:
+            return model.invoke(messages)
+        except Exception as exc:
+            self.counts["errors"] += 1
+            if self.fallback is None:
+                raise
+            print(f"[model_resilience] {route} call failed ({exc!r}), using the fallback model")
+        self.counts["fallbacks"] += 1
+        return self.fallback.invoke(messages)
@@ -0,0 +1,158 @@
+"""
+Per-turn model choice between Gemini Flash and Pro.
+
+Each backend used to hardcode one model: langgraph_backend sent greetings
+to gemini-2.5-pro and the others sent hard reasoning to gemini-2.5-flash.
+A `router` node now runs in front of chat_node once per turn. It classifies
+the latest user message with local heuristics only (no model call) and
+writes the route ('flash' or 'pro') into the state's `route` key.
+chat_node, including its calls after tools, answers with that route's model:
+
+    greeting / small talk                      -> flash
+    tool intent (prices, search, expenses...)  -> flash, unless reasoning is asked for
+    document uploaded on the thread            -> pro
+    long question (ROUTER_LONG_CHARS)          -> pro
+    reasoning words (why, explain, compare...) -> pro
+    deep thread (ROUTER_DEEP_TURNS turns)      -> pro
+    anything else                              -> flash
+
+stats() reports the turns, the reasons, the model calls, the average latency,
+the tokens and an estimated cost per route. Use them to tune the
+thresholds. Prices per million tokens come from ROUTER_<ROUTE>_PRICE_IN /
+ROUTER_<ROUTE>_PRICE_OUT.
+"""
+import os
+import re
+from collections import Counter
+from typing import Callable, Mapping, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from thread_catalog import message_text
+
+FLASH_MODEL = os.environ.get("ROUTER_FLASH_MODEL", "gemini-2.5-flash")
+PRO_MODEL = os.environ.get("ROUTER_PRO_MODEL", "gemini-2.5-pro")
+
+DEFAULT_SHORT_CHARS = 40
+DEFAULT_LONG_CHARS = 400
+DEFAULT_DEEP_TURNS = 8
+# USD per million input / output tokens
+DEFAULT_PRICES = {"flash": (0.30, 2.50), "pro": (1.25, 10.00)}
+
+_GREETING = re.compile(
+    r"^\s*(hi|hello|hey|hiya|thanks|thank you|thx|ok|okay|cool|great|bye|good (morning|afternoon|evening))\b",
+    re.IGNORECASE,
+)
+_TOOL_INTENT = re.compile(
+    r"\b(stock|share price|price of|ticker|search|look up|latest|news|expenses?|spent|spend|calculate)\b",
+    re.IGNORECASE,
+)
+_REASONING = re.compile(
+    r"\b(why|explain|compare|analy[sz]e|prove|derive|step by step|reason|plan|design|debug|code|"
+    r"essay|pros and cons|trade-?offs?|summari[sz]e)\b",
+    re.IGNORECASE,
+)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _last_question(messages: list[BaseMessage]) -> str:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return " ".join(message_text(message.content).split())
+    return ""
+
+
+class ModelRouter:
+    """Picks the model for a turn and keeps per-route counters."""
+
+    def __init__(
+        self,
+        models: Mapping[str, Runnable],
+        default: str = "flash",
+        short_chars: Optional[int] = None,
+        long_chars: Optional[int] = None,
+        deep_turns: Optional[int] = None,
+    ) -> None:
+        self.models = dict(models)
+        self.default = default
+        self.short_chars = short_chars or _env_int("ROUTER_SHORT_CHARS", DEFAULT_SHORT_CHARS)
+        self.long_chars = long_chars or _env_int("ROUTER_LONG_CHARS", DEFAULT_LONG_CHARS)
+        self.deep_turns = deep_turns or _env_int("ROUTER_DEEP_TURNS", DEFAULT_DEEP_TURNS)
+        self._turns: Counter = Counter()
+        self._reasons: Counter = Counter()
+        self._calls: Counter = Counter()
+        self._seconds: Counter = Counter()
+        self._tokens_in: Counter = Counter()
+        self._tokens_out: Counter = Counter()
+
+    def classify(self, messages: list[BaseMessage], has_document: bool = False) -> tuple[str, str]:
+        """(route, reason) for the turn opened by the latest user message."""
+        question = _last_question(messages)
+        reasoning = bool(_REASONING.search(question))
+        if len(question) <= self.short_chars and _GREETING.match(question) and not reasoning:
+            return "flash", "greeting"
+        if _TOOL_INTENT.search(question) and not reasoning and len(question) < self.long_chars:
+            return "flash", "tool_intent"
+        if has_document:
+            return "pro", "document"
+        if len(question) >= self.long_chars:
+            return "pro", "long_question"
+        if reasoning:
+            return "pro", "reasoning"
+        if sum(isinstance(m, HumanMessage) for m in messages) >= self.deep_turns:
+            return "pro", "deep_thread"
+        return "flash", "default"
+
+    def node(self, has_document: Optional[Callable[[str], bool]] = None) -> Callable:
+        """The graph node that routes a turn; `has_document(thread_id)` marks document threads."""
+
+        def router(state: dict, config: RunnableConfig) -> dict:
+            thread_id = config.get("configurable", {}).get("thread_id")
+            document = bool(has_document and thread_id and has_document(thread_id))
+            route, reason = self.classify(state["messages"], has_document=document)
+            if route not in self.models:
+                route = self.default
+            self._turns[route] += 1
+            self._reasons[f"{route}:{reason}"] += 1
+            return {"route": route}
+
+        return router
+
+    def route_of(self, state: dict) -> str:
+        """The route chosen for the current turn; its model is models[route]."""
+        route = state.get("route") or self.default
+        return route if route in self.models else self.default
+
+    def record(self, route: str, seconds: float, response: BaseMessage) -> None:
+        """Count one model call of `route` (cache hits are not calls)."""
+        self._calls[route] += 1
+        self._seconds[route] += seconds
+        usage = getattr(response, "usage_metadata", None) or {}
+        self._tokens_in[route] += usage.get("input_tokens", 0)
+        self._tokens_out[route] += usage.get("output_tokens", 0)
+
+    def _cost(self, route: str) -> float:
+        price_in, price_out = DEFAULT_PRICES.get(route, (0.0, 0.0))
+        price_in = float(os.environ.get(f"ROUTER_{route.upper()}_PRICE_IN", price_in))
+        price_out = float(os.environ.get(f"ROUTER_{route.upper()}_PRICE_OUT", price_out))
+        return (self._tokens_in[route] * price_in + self._tokens_out[route] * price_out) / 1_000_000
+
+    def stats(self) -> dict:
+        return {
+            "routes": {
+                route: {
+                    "turns": self._turns[route],
+                    "calls": self._calls[route],
+                    "avg_latency_ms": 1000 * self._seconds[route] / self._calls[route] if self._calls[route] else 0.0,
+                    "input_tokens": self._tokens_in[route],
+                    "output_tokens": self._tokens_out[route],
+                    "est_cost_usd": round(self._cost(route), 6),
+                }
+                for route in self.models
+            },
+            "reasons": dict(self._reasons),
+        }
@@ -0,0 +1,174 @@
+"""
+Long-lived, pool-backed Postgres checkpointers.
+
+PostgresSaver.from_conn_string() is a context manager: once the `with`
+block exits its connection is closed, yet the compiled graph keeps using the
+saver. Here the saver owns a psycopg ConnectionPool for the life of the
+process, checks connections on checkout, and retries a query once on a
+dropped connection instead of surfacing OperationalError to the UI.
+
+PooledAsyncPostgresSaver is the async counterpart over an AsyncConnectionPool
+(open_async_pool), used by the async backends and the API server: the pool
+lives as long as the process, and each query checks out its own connection
+instead of queueing on the saver's lock.
+"""
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, TypeVar
+
+import psycopg
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+from langgraph.checkpoint.postgres import PostgresSaver
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+
+from checkpointers import pending_statements
+
+T = TypeVar("T")
+
+
+def make_pool(db_uri: str, max_size: Optional[int] = None) -> ConnectionPool:
+    """Connection pool configured the way PostgresSaver expects its connections."""
+    return ConnectionPool(
+        conninfo=db_uri,
+        min_size=1,
+        max_size=max_size or int(os.environ.get("DB_POOL_SIZE", 10)),
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        # drop connections the server closed while they sat idle in the pool
+        check=ConnectionPool.check_connection,
+        open=True,
+    )
+
+
+async def open_async_pool(db_uri: str, max_size: Optional[int] = None) -> AsyncConnectionPool:
+    """make_pool() for the async savers, opened on the running event loop."""
+    pool = AsyncConnectionPool(
+        conninfo=db_uri,
+        min_size=1,
+        max_size=max_size or int(os.environ.get("DB_POOL_SIZE", 10)),
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+    await pool.open()
+    return pool
+
+
+class ResilientPostgresSaver(PostgresSaver):
+    """
+    PostgresSaver over a ConnectionPool with transparent retry.
+
+    Every query runs on its own pooled connection without the saver-wide
+    lock, so Streamlit sessions don't queue behind each other. All writes
+    are upserts, which makes a retried put/put_writes safe. A put also runs
+    the statements its wrappers passed in (checkpointers.written_with_checkpoint)
+    in the checkpoint's transaction.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        *,
+        serde: Optional[SerializerProtocol] = None,
+        retries: int = 2,
+        backoff: float = 0.2,
+    ) -> None:
+        super().__init__(pool, serde=serde)
+        self.retries = retries
+        self.backoff = backoff
+
+    @classmethod
+    def from_db_uri(cls, db_uri: str, **kwargs: Any) -> "ResilientPostgresSaver":
+        return cls(make_pool(db_uri), **kwargs)
+
+    @contextmanager
+    def _cursor(self, *, pipeline: bool = False) -> Iterator[psycopg.Cursor]:
+        # a checkpoint write also runs its wrappers' statements (catalog, message index), same transaction
+        pending = pending_statements() if pipeline else None
+        with self.conn.connection() as conn:
+            if pipeline and self.supports_pipeline:
+                with conn.pipeline(), conn.transaction(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+                    for statement, params in pending.statements if pending else ():
+                        cur.execute(statement, params)
+            elif pipeline:
+                with conn.transaction(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+                    for statement, params in pending.statements if pending else ():
+                        cur.execute(statement, params)
+            else:
+                with conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+        if pending:
+            pending.written = True
+
+    def _retry(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        for attempt in range(self.retries + 1):
+            try:
+                return fn(*args, **kwargs)
+            except psycopg.OperationalError as e:
+                if attempt == self.retries:
+                    raise
+                print(f"[postgres_checkpoint] {fn.__name__} failed ({e}), retrying")
+                # health-check idle connections so the retry gets a live one
+                self.conn.check()
+                time.sleep(self.backoff * (attempt + 1))
+
+    def setup(self) -> None:
+        self._retry(super().setup)
+
+    def get_tuple(self, config):
+        return self._retry(super().get_tuple, config)
+
+    def list(self, config, **kwargs):
+        parent = super()
+
+        def list_checkpoints():
+            # materialized so a retry never replays half-yielded results
+            return [*parent.list(config, **kwargs)]
+
+        return iter(self._retry(list_checkpoints))
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        return self._retry(super().put, config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        return self._retry(super().put_writes, config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        return self._retry(super().delete_thread, thread_id)
+
+
+class PooledAsyncPostgresSaver(AsyncPostgresSaver):
+    """
+    AsyncPostgresSaver over an AsyncConnectionPool, without the saver lock.
+
+    The stock _cursor takes `self.lock` even when it was given a pool, so
+    every query of every conversation ran one at a time whatever the pool
+    size. Here each query checks out a connection of its own, and
+    concurrency is bounded by the pool's max_size. Checkpoint writes run
+    their wrappers' statements in the same transaction, as in
+    ResilientPostgresSaver.
+    """
+
+    @asynccontextmanager
+    async def _cursor(self, *, pipeline: bool = False) -> AsyncIterator[psycopg.AsyncCursor]:
+        pending = pending_statements() if pipeline else None
+        async with self.conn.connection() as conn:
+            if pipeline and self.supports_pipeline:
+                async with conn.pipeline(), conn.transaction(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+                    for statement, params in pending.statements if pending else ():
+                        await cur.execute(statement, params)
+            elif pipeline:
+                async with conn.transaction(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+                    for statement, params in pending.statements if pending else ():
+                        await cur.execute(statement, params)
+            else:
+                async with conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+        if pending:
+            pending.written = True
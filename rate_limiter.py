@@ -0,0 +1,333 @@
+"""
+Process-wide Gemini quota: token buckets and a priority queue.
+
+All sessions share one API key. Under load, Gemini answered with 429s and
+every call retried on its own, which made everything slower. Every chat
+model and embedding call now goes through a QuotaLimiter first:
+
+    chat_quota        GEMINI_CHAT_RPM requests/min, GEMINI_CHAT_TPM tokens/min
+    embedding_quota   GEMINI_EMBED_RPM requests/min, GEMINI_EMBED_TPM tokens/min
+
+Each quota is two token buckets, refilled continuously. A call waits until
+both buckets cover it. Waiters are served by priority, then in arrival
+order. Interactive turns go first; work inside `with background():`
+(PDF ingestion, summaries, semantic cache checks) waits behind them.
+
+Chat models get the limiter through LangChain's `rate_limiter=` hook
+(quota.model_kwargs()). Their token use is only known afterwards, so it is
+charged from usage_metadata once the call ends. The bucket may run into
+debt, and the next calls then wait it out. Embedding calls are wrapped
+by RateLimitedEmbeddings, which charges an estimate up front.
+
+stats() reports what is left in each bucket, the queue and the wait times
+per priority.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+DEFAULT_CHAT_RPM = 1000
+DEFAULT_CHAT_TPM = 1_000_000
+DEFAULT_EMBED_RPM = 3000
+DEFAULT_EMBED_TPM = 1_000_000
+EMBED_BATCH_SIZE = 100  # texts per embedding request
+CHARS_PER_TOKEN = 4
+MAX_POLL_SECONDS = 1.0  # waiters re-check at least this often
+
+_priority: ContextVar[int] = ContextVar("quota_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def at_priority(priority: int) -> Iterator[None]:
+    """Model and embedding calls in this block queue at `priority`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def background():
+    """Model and embedding calls in this block queue behind interactive ones."""
+    return at_priority(BACKGROUND)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class _Waiter:
+    __slots__ = ("priority", "requests", "tokens", "wake", "granted")
+
+    def __init__(self, priority: int, requests: float, tokens: float, wake: Callable[[], None]) -> None:
+        self.priority = priority
+        self.requests = requests
+        self.tokens = tokens
+        self.wake = wake
+        self.granted = False
+
+
+class _UsageHandler(BaseCallbackHandler):
+    """Charges the tokens a chat model call reports once it has ended."""
+
+    run_inline = True
+
+    def __init__(self, quota: "QuotaLimiter") -> None:
+        self.quota = quota
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        used = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                used += usage.get("total_tokens", 0)
+        if used:
+            self.quota.charge(used)
+
+
+class QuotaLimiter(BaseRateLimiter):
+    """Requests/min and tokens/min buckets shared by every caller in the process."""
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float) -> None:
+        self.name = name
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute)
+        self._requests = self.requests_per_minute
+        self._tokens = self.tokens_per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._queue: list[tuple[int, int, _Waiter]] = []
+        self._order = itertools.count()
+        self._granted = {priority: 0 for priority in PRIORITY_NAMES}
+        self._waited = {priority: 0 for priority in PRIORITY_NAMES}
+        self._wait_seconds = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self._max_wait = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.usage_handler = _UsageHandler(self)
+
+    def model_kwargs(self) -> dict:
+        """Keyword arguments that put a LangChain chat model under this quota."""
+        return {"rate_limiter": self, "callbacks": [self.usage_handler]}
+
+    # buckets, all called with the lock held
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _fits(self, requests: float, tokens: float) -> bool:
+        # a call larger than a whole minute's tokens only waits for a full bucket
+        return self._requests >= requests and self._tokens >= min(tokens, self.tokens_per_minute)
+
+    def _take(self, requests: float, tokens: float) -> None:
+        self._requests -= requests
+        self._tokens -= tokens
+
+    def _admit(self) -> None:
+        # strictly in queue order, so a large head is not starved by small calls behind it
+        self._refill()
+        while self._queue:
+            waiter = self._queue[0][2]
+            if not self._fits(waiter.requests, waiter.tokens):
+                break
+            heapq.heappop(self._queue)
+            self._take(waiter.requests, waiter.tokens)
+            waiter.granted = True
+            waiter.wake()
+
+    def _delay(self) -> float:
+        if not self._queue:
+            return 0.0
+        head = self._queue[0][2]
+        missing_requests = head.requests - self._requests
+        missing_tokens = min(head.tokens, self.tokens_per_minute) - self._tokens
+        delay = max(
+            missing_requests * 60 / self.requests_per_minute,
+            missing_tokens * 60 / self.tokens_per_minute,
+            0.0,
+        )
+        return min(max(delay, 0.001), MAX_POLL_SECONDS)
+
+    def _enqueue(self, requests: float, tokens: float, priority: int, wake: Callable[[], None]) -> Optional[_Waiter]:
+        """None when the call may go straight away, else its queued waiter."""
+        self._refill()
+        if not self._queue and self._fits(requests, tokens):
+            self._take(requests, tokens)
+            self._granted[priority] += 1
+            return None
+        waiter = _Waiter(priority, requests, tokens, wake)
+        heapq.heappush(self._queue, (priority, next(self._order), waiter))
+        return waiter
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        if waiter.granted:
+            # admitted just as the caller gave up
+            self._take(-waiter.requests, -waiter.tokens)
+        else:
+            self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+            heapq.heapify(self._queue)
+        self._admit()
+
+    def _record(self, priority: int, waited: float) -> None:
+        self._granted[priority] += 1
+        self._waited[priority] += 1
+        self._wait_seconds[priority] += waited
+        self._max_wait[priority] = max(self._max_wait[priority], waited)
+
+    # public API
+
+    def wait(self, requests: float = 1, tokens: float = 0, priority: Optional[int] = None, blocking: bool = True) -> bool:
+        """Block until the buckets cover the call; False if `blocking` is off and they don't."""
+        priority = _priority.get() if priority is None else priority
+        event = threading.Event()
+        with self._lock:
+            if not blocking:
+                self._refill()
+                if self._queue or not self._fits(requests, tokens):
+                    return False
+            waiter = self._enqueue(requests, tokens, priority, event.set)
+        if waiter is None:
+            return True
+        started = time.monotonic()
+        try:
+            while True:
+                with self._lock:
+                    self._admit()
+                    if waiter.granted:
+                        self._record(priority, time.monotonic() - started)
+                        return True
+                    delay = self._delay()
+                event.wait(delay)
+        except BaseException:
+            with self._lock:
+                self._abandon(waiter)
+            raise
+
+    async def await_turn(
+        self, requests: float = 1, tokens: float = 0, priority: Optional[int] = None, blocking: bool = True
+    ) -> bool:
+        """wait() for the event loop: other coroutines keep running while this one queues."""
+        if not blocking:
+            return self.wait(requests, tokens, priority, blocking=False)
+        priority = _priority.get() if priority is None else priority
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        with self._lock:
+            # admitted from another thread (a sync backend) as often as from this loop
+            waiter = self._enqueue(requests, tokens, priority, lambda: loop.call_soon_threadsafe(event.set))
+        if waiter is None:
+            return True
+        started = time.monotonic()
+        try:
+            while True:
+                with self._lock:
+                    self._admit()
+                    if waiter.granted:
+                        self._record(priority, time.monotonic() - started)
+                        return True
+                    delay = self._delay()
+                try:
+                    await asyncio.wait_for(event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        except BaseException:
+            with self._lock:
+                self._abandon(waiter)
+            raise
+
+    def charge(self, tokens: float) -> None:
+        """Debit tokens whose count was only known after the call."""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        return self.wait(blocking=blocking)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        return await self.await_turn(blocking=blocking)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill()
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _order, _waiter in self._queue:
+                queued[PRIORITY_NAMES.get(priority, str(priority))] += 1
+            return {
+                "requests_available": round(self._requests, 1),
+                "tokens_available": round(self._tokens),
+                "queued": queued,
+                "priorities": {
+                    name: {
+                        "granted": self._granted[priority],
+                        "waited": self._waited[priority],
+                        "avg_wait_ms": (
+                            1000 * self._wait_seconds[priority] / self._granted[priority]
+                            if self._granted[priority] else 0.0
+                        ),
+                        "max_wait_ms": 1000 * self._max_wait[priority],
+                    }
+                    for priority, name in PRIORITY_NAMES.items()
+                },
+            }
+
+
+def _estimated_tokens(texts: list[str]) -> int:
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN + len(texts)
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """An Embeddings model whose calls wait for the embedding quota."""
+
+    def __init__(self, embeddings: Embeddings, quota: QuotaLimiter) -> None:
+        self.embeddings = embeddings
+        self.quota = quota
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.quota.wait(requests=max(1, math.ceil(len(texts) / EMBED_BATCH_SIZE)), tokens=_estimated_tokens(texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        self.quota.wait(tokens=_estimated_tokens([text]))
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await self.quota.await_turn(
+            requests=max(1, math.ceil(len(texts) / EMBED_BATCH_SIZE)), tokens=_estimated_tokens(texts)
+        )
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await self.quota.await_turn(tokens=_estimated_tokens([text]))
+        return await self.embeddings.aembed_query(text)
+
+
+# one per process: every backend and the API server draw from the same key
+chat_quota = QuotaLimiter(
+    "chat",
+    float(os.environ.get("GEMINI_CHAT_RPM", DEFAULT_CHAT_RPM)),
+    float(os.environ.get("GEMINI_CHAT_TPM", DEFAULT_CHAT_TPM)),
+)
+embedding_quota = QuotaLimiter(
+    "embedding",
+    float(os.environ.get("GEMINI_EMBED_RPM", DEFAULT_EMBED_RPM)),
+    float(os.environ.get("GEMINI_EMBED_TPM", DEFAULT_EMBED_TPM)),
+)
@@ -0,0 +1,333 @@
+"""
+Exact-match cache of model responses.
+
+Many first questions are word for word the same across users ("what can
+you do", onboarding FAQs), and each one used to cost a Gemini call. chat_node
+now looks its prompt up first. The key is a SHA-256 over:
+
+    the model's llm string (model name, generation params and, for a
+    bind_tools binding, the bound tool schemas)
+    the prompt messages reduced to type, whitespace-normalized text, tool
+    calls and tool names (message ids and tool-call ids vary per run)
+
+Hits come from an in-process LRU (RESPONSE_CACHE_SIZE entries), then from an
+optional table next to the checkpoints, so other workers and restarts share
+it. Entries expire after RESPONSE_CACHE_TTL seconds; 0 turns the cache off.
+
+A hit is replayed through ReplayChatModel, which streams the cached message
+in small chunks through the normal callbacks. stream_mode="messages", the
+stream bridge and the SSE API therefore see it exactly like a live answer.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import generate_from_stream
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    ToolMessage,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableBinding, RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+from thread_catalog import message_text
+
+DEFAULT_CACHE_SIZE = 1000
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+REPLAY_CHUNK_CHARS = 24
+
+SQLITE_SETUP = (
+    """
+    CREATE TABLE IF NOT EXISTS response_cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """,
+)
+SQLITE_GET = "SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?"
+SQLITE_PUT = "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)"
+
+POSTGRES_SETUP = (
+    """
+    CREATE TABLE IF NOT EXISTS response_cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at DOUBLE PRECISION NOT NULL
+    )
+    """,
+)
+POSTGRES_GET = "SELECT value, expires_at FROM response_cache WHERE key = %s AND expires_at > %s"
+POSTGRES_PUT = """
+    INSERT INTO response_cache (key, value, expires_at) VALUES (%s, %s, %s)
+    ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at
+"""
+
+
+def model_string(model: Runnable) -> str:
+    """Model name, params and bound tools of a chat model or its bind_tools() binding."""
+    if isinstance(model, RunnableBinding):
+        return model.bound._get_llm_string(**model.kwargs)
+    return model._get_llm_string()
+
+
+def _normalized(messages: Sequence[BaseMessage]) -> list[dict]:
+    rows = []
+    for message in messages:
+        row = {"type": message.type, "text": " ".join(message_text(message.content).split())}
+        if isinstance(message, AIMessage) and message.tool_calls:
+            row["tool_calls"] = [[call["name"], call["args"]] for call in message.tool_calls]
+        if isinstance(message, ToolMessage):
+            row["name"] = message.name
+        rows.append(row)
+    return rows
+
+
+def cache_key(model: Runnable, messages: Sequence[BaseMessage]) -> str:
+    payload = json.dumps([model_string(model), _normalized(messages)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _cacheable(response: BaseMessage) -> bool:
+    return isinstance(response, AIMessage) and bool(message_text(response.content) or response.tool_calls)
+
+
+def _dumps(message: AIMessage) -> str:
+    return json.dumps(message_to_dict(message))
+
+
+def _loads(value: str) -> AIMessage:
+    return messages_from_dict([json.loads(value)])[0]
+
+
+def _stored(response: AIMessage) -> AIMessage:
+    # no ids: a replay gets fresh ones, like a live answer
+    return AIMessage(
+        content=response.content,
+        additional_kwargs=response.additional_kwargs,
+        response_metadata=response.response_metadata,
+        tool_calls=[{**call, "id": None} for call in response.tool_calls],
+    )
+
+
+class SqliteResponseStore:
+    """Persistent entries next to the checkpoints of a SqliteSaver / PooledSqliteSaver."""
+
+    def __init__(self, saver: BaseCheckpointSaver) -> None:
+        self.saver = saver
+
+    def setup(self) -> None:
+        with self.saver.cursor() as cur:
+            for statement in SQLITE_SETUP:
+                cur.execute(statement)
+            cur.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        with self.saver.cursor(transaction=False) as cur:
+            row = cur.execute(SQLITE_GET, (key, time.time())).fetchone()
+            return (row[0], row[1]) if row else None
+
+    def put(self, key: str, value: str, expires_at: float) -> None:
+        with self.saver.cursor() as cur:
+            cur.execute(SQLITE_PUT, (key, value, expires_at))
+
+
+class PostgresResponseStore:
+    """Persistent entries for a sync PostgresSaver; runs on the saver's own connections."""
+
+    def __init__(self, saver: BaseCheckpointSaver) -> None:
+        self.saver = saver
+
+    def setup(self) -> None:
+        with self.saver._cursor() as cur:
+            for statement in POSTGRES_SETUP:
+                cur.execute(statement)
+            cur.execute("DELETE FROM response_cache WHERE expires_at <= %s", (time.time(),))
+
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        with self.saver._cursor() as cur:
+            cur.execute(POSTGRES_GET, (key, time.time()))
+            row = cur.fetchone()
+            return (row["value"], row["expires_at"]) if row else None
+
+    def put(self, key: str, value: str, expires_at: float) -> None:
+        with self.saver._cursor() as cur:
+            cur.execute(POSTGRES_PUT, (key, value, expires_at))
+
+
+class AsyncPostgresResponseStore:
+    """Persistent entries for an AsyncPostgresSaver; runs on the saver's own connections."""
+
+    def __init__(self, saver: BaseCheckpointSaver) -> None:
+        self.saver = saver
+
+    async def asetup(self) -> None:
+        async with self.saver._cursor() as cur:
+            for statement in POSTGRES_SETUP:
+                await cur.execute(statement)
+            await cur.execute("DELETE FROM response_cache WHERE expires_at <= %s", (time.time(),))
+
+    async def aget(self, key: str) -> Optional[tuple[str, float]]:
+        async with self.saver._cursor() as cur:
+            await cur.execute(POSTGRES_GET, (key, time.time()))
+            row = await cur.fetchone()
+            return (row["value"], row["expires_at"]) if row else None
+
+    async def aput(self, key: str, value: str, expires_at: float) -> None:
+        async with self.saver._cursor() as cur:
+            await cur.execute(POSTGRES_PUT, (key, value, expires_at))
+
+
+class ResponseCache:
+    """LRU of model responses with a TTL, optionally backed by a response store."""
+
+    def __init__(self, store: Any = None, maxsize: Optional[int] = None, ttl: Optional[float] = None) -> None:
+        self.store = store
+        self.maxsize = maxsize or int(os.environ.get("RESPONSE_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        self.ttl = float(os.environ.get("RESPONSE_CACHE_TTL", DEFAULT_TTL_SECONDS)) if ttl is None else ttl
+        self._entries: "OrderedDict[str, tuple[float, AIMessage]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+    def use_store(self, store: Any) -> None:
+        """Back the cache with `store` from now on, e.g. one bound to another event loop."""
+        self.store = store
+
+    def _local(self, key: str) -> Optional[AIMessage]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry[1] if entry is not None else None
+
+    def _remember(self, key: str, message: AIMessage, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, message)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _count(self, message: Optional[AIMessage]) -> Optional[AIMessage]:
+        with self._lock:
+            if message is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return message
+
+    def get(self, model: Runnable, messages: Sequence[BaseMessage]) -> Optional[AIMessage]:
+        """The cached response to `messages` on `model`, if any."""
+        if self.ttl <= 0:
+            return None
+        key = cache_key(model, messages)
+        message = self._local(key)
+        if message is None and self.store is not None and (row := self.store.get(key)) is not None:
+            message = _loads(row[0])
+            self._remember(key, message, row[1])
+        return self._count(message)
+
+    def put(self, model: Runnable, messages: Sequence[BaseMessage], response: BaseMessage) -> None:
+        if self.ttl <= 0 or not _cacheable(response):
+            return
+        key, message, expires_at = cache_key(model, messages), _stored(response), time.time() + self.ttl
+        self._remember(key, message, expires_at)
+        if self.store is not None:
+            self.store.put(key, _dumps(message), expires_at)
+
+    async def aget(self, model: Runnable, messages: Sequence[BaseMessage]) -> Optional[AIMessage]:
+        if self.ttl <= 0:
+            return None
+        key = cache_key(model, messages)
+        message = self._local(key)
+        if message is None and self.store is not None and (row := await self.store.aget(key)) is not None:
+            message = _loads(row[0])
+            self._remember(key, message, row[1])
+        return self._count(message)
+
+    async def aput(self, model: Runnable, messages: Sequence[BaseMessage], response: BaseMessage) -> None:
+        if self.ttl <= 0 or not _cacheable(response):
+            return
+        key, message, expires_at = cache_key(model, messages), _stored(response), time.time() + self.ttl
+        self._remember(key, message, expires_at)
+        if self.store is not None:
+            await self.store.aput(key, _dumps(message), expires_at)
+
+
+class ReplayChatModel(BaseChatModel):
+    """Streams one fixed message, chunk by chunk, as if a provider produced it."""
+
+    message: AIMessage
+    chunk_chars: int = REPLAY_CHUNK_CHARS
+    # which cache answered, stamped as response_metadata["cache"] on the replay
+    source: str = "exact"
+
+    @property
+    def _llm_type(self) -> str:
+        return "response-cache-replay"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # same message a streamed replay adds up to (fresh tool-call ids included)
+        return generate_from_stream(self._chunks())
+
+    def _chunks(self) -> Iterator[ChatGenerationChunk]:
+        content = self.message.content
+        if isinstance(content, str):
+            pieces = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)]
+        else:
+            pieces = [content]
+        pieces = pieces or [""]
+        for position, piece in enumerate(pieces):
+            last = position == len(pieces) - 1
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content=piece,
+                    additional_kwargs=self.message.additional_kwargs if position == 0 else {},
+                    response_metadata={**self.message.response_metadata, "cache": self.source} if last else {},
+                    tool_call_chunks=[
+                        tool_call_chunk(
+                            name=call["name"],
+                            args=json.dumps(call["args"]),
+                            id=call.get("id") or str(uuid.uuid4()),
+                            index=index,
+                        )
+                        for index, call in enumerate(self.message.tool_calls)
+                    ] if last else [],
+                    chunk_position="last" if last else None,
+                )
+            )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        yield from self._chunks()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        for chunk in self._chunks():
+            yield chunk
+
+
+def replay(message: AIMessage, config: Optional[RunnableConfig] = None, cache: str = "exact") -> BaseMessage:
+    """Stream a cached response through the callbacks of the current run."""
+    return ReplayChatModel(message=message, source=cache).invoke([], config=config)
+
+
+async def areplay(message: AIMessage, config: Optional[RunnableConfig] = None, cache: str = "exact") -> BaseMessage:
+    return await ReplayChatModel(message=message, source=cache).ainvoke([], config=config)
@@ -0,0 +1,203 @@
+"""
+Semantic cache for first questions.
+
+The exact-match response cache misses "what can you do?" vs "what are you
+able to do?". This one embeds the opening question of a thread and searches
+a small in-process index of earlier opening questions (cosine similarity
+over normalized vectors, SEMANTIC_CACHE_SIZE entries). Above
+SEMANTIC_CACHE_THRESHOLD it serves that question's final answer, with no
+model or tool calls.
+
+Only context-free turns take part: the thread holds nothing but the
+question, and the caller can veto a thread (e.g. one with an uploaded
+document). A turn is remembered once chat_node produces its final answer.
+It is not remembered if it used a tool in `exclude_tools`: live data
+(stock_price, search) and side effects (the MCP expense tools) must not be
+replayed. Numbers in a question must match exactly, so "2 + 3" never
+answers "2 + 4".
+
+Metrics (stats()): lookups, hits, lookup latency, and an estimated
+precision. A SEMANTIC_CACHE_VERIFY_RATE share of hits is re-asked to the
+model in the background, outside the user's stream. A hit counts as correct
+when both answers embed within SEMANTIC_CACHE_AGREE of each other.
+"""
+import asyncio
+import contextvars
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from llm_limiter import FairLimiter
+from rate_limiter import background
+from thread_catalog import message_text
+
+DEFAULT_CACHE_SIZE = 500
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_VERIFY_RATE = 0.05
+DEFAULT_AGREE = 0.85
+DEFAULT_EXCLUDE_TOOLS = "stock_price,get_stock_price,rag_tool,duckduckgo_search"
+PENDING_VECTORS = 256  # question embeddings kept between lookup and remember
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+def opening_question(messages: Sequence[BaseMessage]) -> Optional[str]:
+    """The question of a thread's first turn, or None once the thread has more context."""
+    questions = [m for m in messages if isinstance(m, HumanMessage)]
+    if len(questions) != 1 or not isinstance(messages[0], HumanMessage):
+        return None
+    return " ".join(message_text(questions[0].content).split()) or None
+
+
+class _Entry:
+    __slots__ = ("question", "numbers", "answer")
+
+    def __init__(self, question: str, numbers: tuple, answer: AIMessage) -> None:
+        self.question = question
+        self.numbers = numbers
+        self.answer = answer
+
+
+class SemanticCache:
+    """Answers to opening questions, looked up by embedding similarity."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        verify_model: Optional[BaseChatModel] = None,
+        limiter: Optional[FairLimiter] = None,
+        exclude_tools: Iterable[str] = (),
+        maxsize: Optional[int] = None,
+        threshold: Optional[float] = None,
+        verify_rate: Optional[float] = None,
+    ) -> None:
+        self.embeddings = embeddings
+        self.verify_model = verify_model
+        self.limiter = limiter
+        env_exclude = os.environ.get("SEMANTIC_CACHE_EXCLUDE_TOOLS", DEFAULT_EXCLUDE_TOOLS)
+        self.exclude_tools = {name.strip() for name in env_exclude.split(",") if name.strip()} | set(exclude_tools)
+        self.maxsize = maxsize or int(os.environ.get("SEMANTIC_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        self.threshold = threshold or float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", DEFAULT_THRESHOLD))
+        self.verify_rate = (
+            float(os.environ.get("SEMANTIC_CACHE_VERIFY_RATE", DEFAULT_VERIFY_RATE))
+            if verify_rate is None else verify_rate
+        )
+        self.agree = float(os.environ.get("SEMANTIC_CACHE_AGREE", DEFAULT_AGREE))
+        # row i of _matrix is the unit vector of _entries[i]
+        self._entries: list[_Entry] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._pending: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+        self.verified = 0
+        self.agreed = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "avg_lookup_ms": 1000 * self.lookup_seconds / self.lookups if self.lookups else 0.0,
+            "verified": self.verified,
+            "precision": self.agreed / self.verified if self.verified else None,
+        }
+
+    def _search(self, vector: np.ndarray, numbers: tuple) -> tuple[Optional[_Entry], float]:
+        if not self._entries:
+            return None, 0.0
+        scores = self._matrix @ vector
+        for index in np.argsort(scores)[::-1]:
+            if scores[index] < self.threshold:
+                break
+            if self._entries[index].numbers == numbers:
+                return self._entries[index], float(scores[index])
+        return None, float(scores.max())
+
+    async def alookup(self, messages: Sequence[BaseMessage]) -> Optional[AIMessage]:
+        """The stored answer to a near-identical opening question, if any."""
+        # only before the first model call of the thread, not after its tool calls
+        question = opening_question(messages) if len(messages) == 1 else None
+        if question is None:
+            return None
+        started = time.perf_counter()
+        vector = _unit(await self.embeddings.aembed_query(question))
+        self._pending[question] = vector
+        while len(self._pending) > PENDING_VECTORS:
+            self._pending.popitem(last=False)
+        entry, score = self._search(vector, tuple(_NUMBER.findall(question)))
+        self.lookups += 1
+        self.lookup_seconds += time.perf_counter() - started
+        if entry is None:
+            return None
+        self.hits += 1
+        print(f"[semantic_cache] hit {score:.3f} for {question[:60]!r} ~ {entry.question[:60]!r}")
+        if self.verify_model is not None and random.random() < self.verify_rate:
+            self._verify_later(question, entry)
+        return entry.answer
+
+    async def aremember(self, messages: Sequence[BaseMessage], response: BaseMessage) -> None:
+        """Store the final answer of a context-free first turn."""
+        question = opening_question(messages)
+        if question is None or not isinstance(response, AIMessage) or response.tool_calls:
+            return
+        if not message_text(response.content):
+            return
+        used = {m.name for m in messages if isinstance(m, ToolMessage)}
+        if used & self.exclude_tools:
+            return
+        vector = self._pending.pop(question, None)
+        if vector is None:
+            vector = _unit(await self.embeddings.aembed_query(question))
+        numbers = tuple(_NUMBER.findall(question))
+        if self._search(vector, numbers)[0] is not None:
+            return  # a near-identical question already answers this one
+        answer = AIMessage(content=response.content, additional_kwargs=response.additional_kwargs)
+        if len(self._entries) >= self.maxsize:
+            # oldest first out
+            self._entries.pop(0)
+            self._matrix = self._matrix[1:]
+        self._entries.append(_Entry(question, numbers, answer))
+        self._matrix = vector[None, :] if not len(self._matrix) else np.vstack([self._matrix, vector])
+
+    def _verify_later(self, question: str, entry: _Entry) -> None:
+        # a fresh context: the check must not stream into the user's answer
+        task = asyncio.get_running_loop().create_task(
+            self._averify(question, entry), context=contextvars.Context()
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _averify(self, question: str, entry: _Entry) -> None:
+        try:
+            with background():
+                if self.limiter is None:
+                    live = await self.verify_model.ainvoke([HumanMessage(content=question)])
+                else:
+                    async with self.limiter.slot("semantic-cache-verify"):
+                        live = await self.verify_model.ainvoke([HumanMessage(content=question)])
+                vectors = await self.embeddings.aembed_documents(
+                    [message_text(live.content), message_text(entry.answer.content)]
+                )
+        except Exception as exc:
+            print(f"[semantic_cache] verification failed: {exc}")
+            return
+        self.verified += 1
+        if float(_unit(vectors[0]) @ _unit(vectors[1])) >= self.agree:
+            self.agreed += 1
@@ -0,0 +1,205 @@
+"""
+Coalescing of identical concurrent calls on a backend event loop.
+
+During a burst, many users send the same prompt or look up the same stock
+at once, and each of them used to start its own upstream request.
+Singleflight keys each call. The first caller starts the call in its own task;
+callers that arrive while it is in flight wait on that task instead of
+starting another:
+
+    do(key, fn)        one awaited result, shared (tool calls)
+    stream(key, fn)    one async stream, every caller sees every item from
+                       the start, including items produced before it joined
+
+do() runs the shared call in a copy of the first caller's context, so a
+call made under rate_limiter.background() keeps its quota priority. The
+shared task of stream() only keeps that priority and otherwise runs in a
+fresh context, so it is not tied to one caller's run or callbacks. Each
+caller streams the items through its own callbacks (ashared_model_call
+replays LLM chunks via StreamReplayChatModel). The task is cancelled once
+every caller has left, and the next identical call starts a new one.
+"""
+import asyncio
+import contextvars
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional, Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from llm_limiter import FairLimiter
+from model_resilience import ResilientModel
+from rate_limiter import at_priority, current_priority
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.task: Optional[asyncio.Task] = None
+        self.callers = 0
+        self.items: list = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.updated = asyncio.Event()
+
+    def publish(self) -> None:
+        # wake everyone waiting on this event, later waiters get a fresh one
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+
+class Singleflight:
+    """At most one in-flight call per key; concurrent callers share it."""
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight] = {}
+        self.started = 0
+        self.shared = 0
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "started": self.started, "shared": self.shared}
+
+    def _join(
+        self, key: str, run: Callable[[_Flight], Awaitable[Any]], context: contextvars.Context
+    ) -> _Flight:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.get_running_loop().create_task(run(flight), context=context)
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+            self.started += 1
+        else:
+            self.shared += 1
+        flight.callers += 1
+        return flight
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _leave(self, key: str, flight: _Flight) -> None:
+        flight.callers -= 1
+        if flight.callers == 0 and not flight.task.done():
+            # nobody wants the result any more
+            flight.task.cancel()
+            self._forget(key, flight)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn(), or the identical call already in flight under `key`."""
+
+        async def run(flight: _Flight) -> Any:
+            return await fn()
+
+        flight = self._join(key, run, contextvars.copy_context())
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(key, flight)
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Iterate fn(), or the identical stream already in flight under `key`."""
+
+        priority = current_priority()
+
+        async def run(flight: _Flight) -> None:
+            try:
+                with at_priority(priority):
+                    async for item in fn():
+                        flight.items.append(item)
+                        flight.publish()
+            except Exception as exc:
+                flight.error = exc
+            finally:
+                flight.done = True
+                flight.publish()
+
+        flight = self._join(key, run, contextvars.Context())
+        try:
+            seen = 0
+            while True:
+                while seen < len(flight.items):
+                    yield flight.items[seen]
+                    seen += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.updated.wait()
+        finally:
+            self._leave(key, flight)
+
+
+def _own_chunk(chunk: AIMessageChunk) -> ChatGenerationChunk:
+    # chunks are shared between callers; each run stamps its own ids on a copy
+    return ChatGenerationChunk(message=AIMessageChunk(**chunk.model_dump(exclude={"id", "type"})))
+
+
+class StreamReplayChatModel(BaseChatModel):
+    """
+    Emits the AIMessageChunks of `source` as this model's own streamed output.
+
+    `source` is an async iterator (a shared flight) or, for sync callers, an
+    iterable of chunks already received.
+    """
+
+    source: Any  # AsyncIterator[AIMessageChunk] | Iterable[AIMessageChunk]
+
+    @property
+    def _llm_type(self) -> str:
+        return "singleflight-replay"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return generate_from_stream(self._stream(messages))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        if hasattr(self.source, "__aiter__"):
+            raise TypeError("an async source can only be replayed with ainvoke() or astream()")
+        for chunk in self.source:
+            yield _own_chunk(chunk)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        if not hasattr(self.source, "__aiter__"):
+            for chunk in self.source:
+                yield _own_chunk(chunk)
+            return
+        async for chunk in self.source:
+            yield _own_chunk(chunk)
+
+
+async def ashared_model_call(
+    flights: Singleflight,
+    key: str,
+    model: Runnable,
+    messages: Sequence[BaseMessage],
+    config: Optional[RunnableConfig] = None,
+    limiter: Optional[FairLimiter] = None,
+    limiter_key: str = "",
+    resilience: Optional[ResilientModel] = None,
+    route: str = "default",
+) -> BaseMessage:
+    """
+    model.ainvoke(messages), shared with identical concurrent calls. The
+    tokens reach every caller's stream as they arrive; the limiter slot is
+    taken once, by the shared call. With `resilience`, the shared call runs
+    under its deadlines, hedging and fallback.
+    """
+
+    def upstream() -> AsyncIterator[AIMessageChunk]:
+        if resilience is None:
+            return model.astream(messages)
+        return resilience.astream(model, messages, route)
+
+    async def chunks() -> AsyncIterator[AIMessageChunk]:
+        if limiter is None:
+            async for chunk in upstream():
+                yield chunk
+            return
+        async with limiter.slot(limiter_key):
+            async for chunk in upstream():
+                yield chunk
+
+    return await StreamReplayChatModel(source=flights.stream(key, chunks)).ainvoke([], config=config)
@@ -0,0 +1,155 @@
+"""
+Production SQLite mode for the checkpointer.
+
+SqliteSaver funnels every read and write through one connection guarded by
+one lock, so a slow write stalls every Streamlit session and a second
+connection opened elsewhere can hit `database is locked`. Here connections
+come from a small pool with WAL journaling and tuned pragmas: readers run
+concurrently and only writers are serialized.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from checkpointers import pending_statements
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    # WAL + NORMAL is durable across application crashes, only an OS crash
+    # can lose the last transactions
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-65536",  # 64 MiB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+SQLITE_INDEXES = (
+    # global "newest first" listing (checkpointer.list(None), thread discovery)
+    "CREATE INDEX IF NOT EXISTS checkpoints_checkpoint_id_idx ON checkpoints(checkpoint_id)",
+)
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class SqliteConnectionPool:
+    """Fixed-size pool of tuned connections to one database file."""
+
+    def __init__(self, path: str, size: int = 4) -> None:
+        self.path = path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return connect_sqlite(self.path)
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class PooledSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver whose cursors come from a SqliteConnectionPool.
+
+    Reads do not take the saver lock; writes still do, and open their
+    transaction with BEGIN IMMEDIATE so they queue on busy_timeout instead
+    of failing with `database is locked` on lock upgrade. A put commits the
+    statements its wrappers passed in (checkpointers.written_with_checkpoint)
+    with the checkpoint.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        pool_size: Optional[int] = None,
+        serde: Optional[SerializerProtocol] = None,
+    ) -> None:
+        self.pool = SqliteConnectionPool(
+            path, pool_size or int(os.environ.get("SQLITE_POOL_SIZE", 4))
+        )
+        # dedicated connection for setup() and the writes cursor used by list()
+        super().__init__(connect_sqlite(path), serde=serde)
+        self._setup_lock = threading.Lock()
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        with self._setup_lock:
+            if self.is_setup:
+                return
+            super().setup()
+            for statement in SQLITE_INDEXES:
+                self.conn.execute(statement)
+            self.conn.execute("PRAGMA optimize")
+            self.conn.commit()
+
+    @contextmanager
+    def cursor(self, transaction: bool = True) -> Iterator[sqlite3.Cursor]:
+        self.setup()
+        with self.pool.connection() as conn:
+            if not transaction:
+                cur = conn.cursor()
+                try:
+                    yield cur
+                finally:
+                    cur.close()
+                return
+            # a checkpoint write also runs its wrappers' statements (catalog, message index)
+            pending = pending_statements()
+            with self.lock:
+                conn.execute("BEGIN IMMEDIATE")
+                cur = conn.cursor()
+                try:
+                    yield cur
+                    for statement, params in pending.statements if pending else ():
+                        cur.execute(statement, params)
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+                finally:
+                    cur.close()
+            if pending:
+                pending.written = True
+
+    def list_thread_ids(self) -> list[str]:
+        """Distinct thread ids, read from the primary key index."""
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT DISTINCT thread_id FROM checkpoints")
+            return [row[0] for row in cur.fetchall()]
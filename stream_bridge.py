@@ -0,0 +1,254 @@
+"""
+Bridge from a LangGraph `stream_mode="messages"` stream to st.write_stream.
+
+The frontends pushed every (message_chunk, metadata) pair through a queue
+and yielded each token to st.write_stream, which re-renders the whole
+markdown block per token. Here the producer side (the backend event loop,
+or a worker thread for sync streams) only enqueues what the UI shows: AI
+text and tool names. The consumer coalesces text and yields it when
+STREAM_FLUSH_CHARS characters are buffered or STREAM_FLUSH_MS milliseconds
+have passed since the first buffered token, whichever comes first.
+
+Every stream is owned by a StreamHandle. The queue between the two sides is
+bounded (STREAM_QUEUE_SIZE), so a stalled consumer pauses the producer
+instead of buffering the whole answer. Cancelling the handle, from the Stop
+button or from the next rerun via cancel_stale_stream(), cancels the
+producer task on the backend loop. That cancellation reaches the model and
+tool calls awaiting inside astream.
+"""
+import asyncio
+import inspect
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import AsyncIterator, Callable, Iterable, Iterator, MutableMapping, Optional, Union
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from thread_catalog import message_text
+
+DEFAULT_FLUSH_CHARS = 200
+DEFAULT_FLUSH_MS = 50
+DEFAULT_QUEUE_SIZE = 256
+BACKPRESSURE_POLL = 0.01  # seconds between retries while the queue is full
+IDLE_POLL = 0.1
+
+ACTIVE_STREAM_KEY = "active_stream"
+
+_DONE = ("done", None)
+
+
+class StreamHandle:
+    """The producer side of one streamed answer, so it can be stopped."""
+
+    def __init__(self, queue_size: Optional[int] = None) -> None:
+        self.events: queue.Queue = queue.Queue(
+            maxsize=queue_size or int(os.environ.get("STREAM_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+        )
+        self.cancelled = threading.Event()
+        self.future: Optional[Future] = None
+        self.done = False
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        if self.future is not None and not self.future.done():
+            # cancels the task on the backend loop, and with it the awaits
+            # inside astream (model call, tool calls)
+            self.future.cancel()
+
+
+def cancel_stale_stream(state: MutableMapping) -> None:
+    """
+    Cancel the answer a rerun interrupted (Stop button, sidebar click, page
+    reload). Streamlit aborts the script without closing the generator that
+    st.write_stream was consuming, so the handle lives in session_state.
+    """
+    handle = state.pop(ACTIVE_STREAM_KEY, None)
+    if handle is not None and not handle.done:
+        handle.cancel()
+
+
+class StreamStats:
+    """Counters for one streamed answer: tokens in, rendered updates out."""
+
+    def __init__(self) -> None:
+        self.chunks = 0
+        self.chars = 0
+        self.updates = 0
+        self.tools = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def updates_per_second(self) -> float:
+        return self.updates / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.chunks} chunks / {self.chars} chars -> {self.updates} updates "
+            f"in {self.elapsed:.2f}s ({self.updates_per_second:.1f} updates/s)"
+        )
+
+
+def _event(message_chunk) -> Optional[tuple]:
+    # filtering happens before the queue, so tool payloads and empty
+    # tool-call chunks never cross over to the Streamlit thread
+    if isinstance(message_chunk, ToolMessage):
+        return ("tool", getattr(message_chunk, "name", None) or "tool")
+    if isinstance(message_chunk, AIMessage):
+        if text := message_text(message_chunk.content):
+            return ("text", text)
+    return None
+
+
+async def _aput(handle: StreamHandle, event: tuple) -> None:
+    # never block the event loop: wait for room, give up once cancelled
+    while not handle.cancelled.is_set():
+        try:
+            handle.events.put_nowait(event)
+            return
+        except queue.Full:
+            await asyncio.sleep(BACKPRESSURE_POLL)
+
+
+def _put(handle: StreamHandle, event: tuple) -> None:
+    while not handle.cancelled.is_set():
+        try:
+            handle.events.put(event, timeout=BACKPRESSURE_POLL)
+            return
+        except queue.Full:
+            pass
+
+
+async def pump_async(stream: AsyncIterator, handle: StreamHandle) -> None:
+    """Drain an astream(..., stream_mode="messages") iterator into the handle's queue."""
+    try:
+        async for message_chunk, _metadata in stream:
+            if event := _event(message_chunk):
+                await _aput(handle, event)
+    except Exception as exc:
+        await _aput(handle, ("error", exc))
+    finally:
+        # cancelled while waiting on the queue: close the graph run right away
+        # instead of leaving it suspended until garbage collection
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+        await _aput(handle, _DONE)
+
+
+def pump_sync(stream: Iterable, handle: StreamHandle) -> None:
+    """
+    Same as pump_async for a sync stream(...) iterator, run in a worker
+    thread. A thread can't be cancelled, so the stream is closed at the next
+    chunk after cancel(); the graph then stops before its next step.
+    """
+    try:
+        for message_chunk, _metadata in stream:
+            if handle.cancelled.is_set():
+                break
+            if event := _event(message_chunk):
+                _put(handle, event)
+    except Exception as exc:
+        _put(handle, ("error", exc))
+    finally:
+        if hasattr(stream, "close"):
+            stream.close()
+        _put(handle, _DONE)
+
+
+def coalesce(
+    handle: StreamHandle,
+    *,
+    on_tool: Optional[Callable[[str], None]] = None,
+    flush_chars: Optional[int] = None,
+    flush_interval: Optional[float] = None,
+    stats: Optional[StreamStats] = None,
+) -> Iterator[str]:
+    """Yield the text events of the handle's queue in batches, calling on_tool for tool events."""
+    flush_chars = flush_chars or int(os.environ.get("STREAM_FLUSH_CHARS", DEFAULT_FLUSH_CHARS))
+    if flush_interval is None:
+        flush_interval = int(os.environ.get("STREAM_FLUSH_MS", DEFAULT_FLUSH_MS)) / 1000
+    stats = stats if stats is not None else StreamStats()
+    buffer: list[str] = []
+    size = 0
+    deadline: Optional[float] = None
+
+    def flush() -> Iterator[str]:
+        nonlocal size, deadline
+        if buffer:
+            stats.updates += 1
+            yield "".join(buffer)
+            buffer.clear()
+        size = 0
+        deadline = None
+
+    try:
+        while not handle.cancelled.is_set():
+            # idle waits are bounded too, so a cancel() is noticed
+            timeout = IDLE_POLL if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                kind, value = handle.events.get(timeout=timeout)
+            except queue.Empty:
+                yield from flush()
+                continue
+            if kind == "text":
+                stats.chunks += 1
+                stats.chars += len(value)
+                buffer.append(value)
+                size += len(value)
+                if deadline is None:
+                    deadline = time.monotonic() + flush_interval
+                if size >= flush_chars:
+                    yield from flush()
+                continue
+            # anything else ends the current batch first, so text stays in order
+            yield from flush()
+            if kind == "tool":
+                stats.tools += 1
+                if on_tool is not None:
+                    on_tool(value)
+            elif kind == "error":
+                raise value
+            elif kind == "done":
+                handle.done = True
+                break
+    finally:
+        stats.finished = time.monotonic()
+        if not handle.done:
+            # the consumer went away early (generator closed or raised)
+            handle.cancel()
+
+
+def coalesced_text(
+    stream: Union[AsyncIterator, Iterable],
+    *,
+    submit: Optional[Callable] = None,
+    on_tool: Optional[Callable[[str], None]] = None,
+    flush_chars: Optional[int] = None,
+    flush_interval: Optional[float] = None,
+    stats: Optional[StreamStats] = None,
+    handle: Optional[StreamHandle] = None,
+) -> Iterator[str]:
+    """
+    Text of a messages-mode stream, batched for st.write_stream.
+
+    An async stream (chatbot.astream) is driven by `submit`, the backend's
+    submit_async_task, whose future is kept on the handle; a sync stream
+    (chatbot.stream) by a daemon thread.
+    """
+    handle = handle if handle is not None else StreamHandle()
+    if inspect.isasyncgen(stream) or hasattr(stream, "__anext__"):
+        handle.future = submit(pump_async(stream, handle))
+    else:
+        threading.Thread(target=pump_sync, args=(stream, handle), daemon=True).start()
+    stats = stats if stats is not None else StreamStats()
+    yield from coalesce(
+        handle, on_tool=on_tool, flush_chars=flush_chars, flush_interval=flush_interval, stats=stats
+    )
+    print(f"[stream_bridge] {stats}{'' if handle.done else ' (stopped)'}")
@@ -1,5 +1,5 @@
 import streamlit as st
-from langgraph_backend import chatbot
+from langgraph_backend import chatbot, fetch_thread_titles
 from langchain_core.messages import HumanMessage
 import uuid
 
@@ -39,11 +39,14 @@ def get_messages(thread_id):
 def truncate_label(text, max_len=25):
     return text if len(text) <= max_len else text[:max_len - 3] + "..."
 
-def get_first_message(thread_id):
-    config = {'configurable': {'thread_id': thread_id}}
-    if 'messages' not in chatbot.get_state(config=config).values:
-        return truncate_label(str(thread_id))
-    return truncate_label(chatbot.get_state(config=config).values['messages'][0].content)
+def get_thread_labels(thread_ids):
+    # titles are stored when a thread's first message is written, so one
+    # batched lookup labels the whole sidebar without touching the messages
+    titles = fetch_thread_titles(thread_ids)
+    return {
+        thread_id: truncate_label(titles.get(str(thread_id)) or str(thread_id))
+        for thread_id in thread_ids
+    }
 
 # ----------- Session History ----------- #
 
@@ -69,9 +72,12 @@ if st.sidebar.button('New chat'):
 
 st.sidebar.header('Coversation History')
 
+thread_labels = get_thread_labels(st.session_state['chat_threads'])
+
 for i in range(len(st.session_state['chat_threads'])-1, -1, -1):
-    if st.sidebar.button(get_first_message(st.session_state['chat_threads'][i])):
-        thread_id = st.session_state['chat_threads'][i]
+    tid = st.session_state['chat_threads'][i]
+    if st.sidebar.button(thread_labels[tid], key=f"thread-btn-{tid}"):
+        thread_id = tid
         st.session_state['thread_id'] = thread_id
         messages = get_messages(thread_id)
         temp_messages = []
@@ -1,109 +1,18 @@
-import importlib
-import json
-import contextlib
 import streamlit as st
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 import uuid
-import psycopg
-from psycopg.rows import dict_row
-from psycopg_pool import ConnectionPool
 from dotenv import load_dotenv
-import os
-import queue
+from stream_bridge import ACTIVE_STREAM_KEY, StreamHandle, cancel_stale_stream, coalesced_text
 
 load_dotenv()
 
 # ------------------------------------------------------------------
-# IMPORTANT: patch LangGraph Postgres checkpointer to use our pool
+# The backend owns a long-lived, pool-backed checkpointer that retries
+# dropped connections itself, so it is imported once and never reloaded
+# (a reload rebuilt the LLM client and tools on every DB hiccup).
 # ------------------------------------------------------------------
-
-DB_URI = os.environ["DB_URL"]
-
-@st.cache_resource
-def get_pool():
-    # Pool persists across Streamlit reruns and provides fresh connections for each operation
-    return ConnectionPool(conninfo=DB_URI, min_size=1, max_size=10)
-
-pool = get_pool()
-
-# quick pool smoke test (safe in Streamlit because it's inside cache_resource)
-with pool.connection() as conn:
-    # newly added dated 04-12-2025
-    conn.autocommit = True
-    with conn.cursor() as cur:
-        cur.execute("SELECT 1")
-        _ = cur.fetchone()
-
-def patch_langgraph_postgres_checkpointer(pool: ConnectionPool):
-    """
-    Monkey-patch langgraph.checkpoint.postgres.PostgresCheckpointer._cursor
-    so it uses the provided ConnectionPool for short-lived connections.
-
-    Accepts arbitrary kwargs such as pipeline, binary, row_factory for compatibility.
-    """
-    try:
-        import langgraph.checkpoint.postgres as lg_pg
-    except Exception as e:
-        st.warning(f"Could not import langgraph.checkpoint.postgres to patch checkpointer: {e}")
-        return False
-
-    @contextlib.contextmanager
-    def _cursor(self, *args, **kwargs):
-        """
-        Replacement _cursor that accepts arbitrary kwargs and uses the pooled connection.
-
-        Known kwargs:
-        - row_factory: a row factory (e.g. dict_row)
-        - binary: bool
-        - pipeline: bool (ignored here but accepted for compatibility)
-        """
-        # extract known kwargs, keep defaults compatible with original behavior
-        row_factory = kwargs.pop('row_factory', dict_row)
-        binary = kwargs.pop('binary', False)
-        # pipeline flag may be passed by langgraph — accept and ignore (we don't need special behavior)
-        kwargs.pop('pipeline', None)
-
-        # Any remaining kwargs we don't explicitly handle are ignored.
-        with pool.connection() as conn:
-            # create cursor with requested options
-            # conn.cursor accepts binary and row_factory in psycopg_pool context
-            with conn.cursor(binary=binary, row_factory=row_factory) as cur:
-                yield cur
-
-    # Set the _cursor method on the class if it exists
-    if hasattr(lg_pg, "PostgresCheckpointer"):
-        lg_pg.PostgresCheckpointer._cursor = _cursor
-        #st.info("Patched langgraph.checkpoint.postgres.PostgresCheckpointer to use ConnectionPool.")
-        return True
-    else:
-        # fallback: try to patch any class that looks like a checkpointer
-        patched_any = False
-        for attr_name in dir(lg_pg):
-            try:
-                attr = getattr(lg_pg, attr_name)
-                if isinstance(attr, type):
-                    # heuristics: look for classes with 'Checkpointer' in the name or with an existing _cursor
-                    if "Checkpointer" in attr.__name__ or hasattr(attr, "_cursor"):
-                        attr._cursor = _cursor
-                        st.info(f"Patched {attr.__name__} in langgraph.checkpoint.postgres to use ConnectionPool.")
-                        patched_any = True
-            except Exception:
-                continue
-        if not patched_any:
-            st.warning("Could not find a Checkpointer class to patch in langgraph.checkpoint.postgres.")
-        return patched_any
-
-# apply patch early, before we import the backend that will create checkpointer instances
-patched = patch_langgraph_postgres_checkpointer(pool)
-
-# ------------------------------------------------------------------
-# import the module (we will also import the chatbot symbol for normal use)
-# reload it to ensure it picks up our patched checkpointer class
-# ------------------------------------------------------------------
-import langgraph_database_backend1 as lgdb
-lgdb = importlib.reload(lgdb)
-#from langgraph_database_backend1 import chatbot  # keep the original import for direct use
 from langgraph_database_backend1 import chatbot
+from langgraph_database_backend1 import fetch_threads_page, search_threads, fetch_message_window
 
 st.markdown(
     """
@@ -122,6 +31,7 @@ def get_thread_id():
 
 def reset_chat():
     st.session_state['message_history'] = []
+    st.session_state['history_before'] = None
     thread_id = get_thread_id()
     st.session_state['thread_id'] = thread_id
     # initialize a label for the new thread
@@ -145,59 +55,33 @@ def add_thread(thread_id, label: str | None = None):
     if thread_id not in st.session_state['thread_labels']:
         st.session_state['thread_labels'][thread_id] = truncate_label(label or str(thread_id))
 
-# Use the pool to fetch thread ids from the checkpoints table (initial load only)
-def fetch_all_threads():
-    values = []
-    try:
-        with pool.connection() as conn:
-            # updated on 04-12-2025
-            conn.autocommit = True
-            with conn.cursor(row_factory=dict_row) as cur:
-                cur.execute("SELECT DISTINCT(thread_id) FROM checkpoints")
-                results = cur.fetchall()
-                # results may be a list of dicts because of row_factory
-                values = [str(res['thread_id']) for res in results if res.get('thread_id') is not None]
-    except Exception as e:
-        msg = str(e).lower()
-        # If table not present, return empty list silently
-        if "does not exist" in msg or "relation" in msg or "undefined table" in msg:
-            values = []
-        else:
-            # re-raise unexpected errors so you see them in logs
-            raise
-    return values
-
-# Helper to try calling chatbot.get_state and recover from a closed DB connection
+def load_more_threads():
+    """
+    Add the next page of older threads from the backend's threads catalog.
+    Pages are newest first and the keyset cursor lives in session_state, so
+    a session starts with one page instead of every thread in the database.
+    """
+    page = fetch_threads_page(before=st.session_state['threads_cursor'])
+    older = []
+    for row in page.threads:
+        tid = str(row['thread_id'])
+        if tid not in st.session_state['chat_threads']:
+            older.append(tid)
+        st.session_state['thread_labels'].setdefault(tid, truncate_label(row['title'] or tid))
+    # chat_threads is oldest -> newest, older pages go in front
+    st.session_state['chat_threads'][:0] = older[::-1]
+    st.session_state['threads_cursor'] = page.next_cursor
+
+# Dropped DB connections are retried inside the backend's checkpointer,
+# so these are plain calls now (kept so the call sites stay unchanged)
 def safe_get_state(config):
-    global chatbot, lgdb
-    try:
-        return chatbot.get_state(config=config)
-    except psycopg.OperationalError as e:
-        # connection was closed inside langgraph checkpointer — try to reload module and retry once
-        st.warning("DB connection error when reading state — reloading backend and retrying.")
-        try:
-            # reload the module and rebind chatbot; patched checkpointer will still be used
-            lgdb = importlib.reload(lgdb)
-            chatbot = getattr(lgdb, "chatbot", chatbot)
-        except Exception as reload_err:
-            st.error(f"Failed to reload langgraph backend: {reload_err}")
-            raise
-        # retry once
-        return chatbot.get_state(config=config)
+    return chatbot.get_state(config=config)
 
 def safe_stream_call(request_payload, config, stream_mode='messages'):
     """
-    Calls chatbot.stream and if OperationalError occurs, reloads the backend and retries once.
-    Returns a generator (or raises).
+    Calls chatbot.stream. Returns a generator (or raises).
     """
-    global chatbot, lgdb
-    try:
-        return chatbot.stream(request_payload, config=config, stream_mode=stream_mode)
-    except psycopg.OperationalError:
-        st.warning("DB connection error during streaming — reloading backend and retrying.")
-        lgdb = importlib.reload(lgdb)
-        chatbot = getattr(lgdb, "chatbot", chatbot)
-        return chatbot.stream(request_payload, config=config, stream_mode=stream_mode)
+    return chatbot.stream(request_payload, config=config, stream_mode=stream_mode)
 
 def get_messages(thread_id: str):
     """
@@ -222,10 +106,56 @@ def get_first_message(thread_id: str):
         return truncate_label(str(thread_id))
     return truncate_label(state.values['messages'][0].content)
 
+def history_from_window(window):
+    """message_history entries for a window of indexed messages (already plain text)."""
+    # user questions and answers only: no tool results, no empty tool-call turns
+    return [
+        {'role': 'user' if m['role'] == 'human' else 'assistant', 'content': m['content']}
+        for m in window.messages
+        if m['role'] == 'human' or (m['role'] == 'ai' and m['content'])
+    ]
+
+def open_thread(thread_id):
+    """
+    Show the latest window of a thread (sidebar or search result click).
+    Messages come from the backend's message index, so opening a long thread
+    does not deserialize its whole checkpoint.
+    """
+    st.session_state['thread_id'] = thread_id
+    try:
+        window = fetch_message_window(thread_id)
+    except Exception as e:
+        st.error(f"Failed to load thread messages: {e}")
+        window = None
+
+    st.session_state['message_history'] = history_from_window(window) if window else []
+    st.session_state['history_before'] = window.before if window else None
+
+    # the window starts at the first message: refresh the label from it
+    if window and window.messages and window.before is None:
+        st.session_state['thread_labels'][thread_id] = truncate_label(window.messages[0]['content'])
+    else:
+        st.session_state['thread_labels'].setdefault(thread_id, truncate_label(thread_id))
+
+def load_earlier_messages():
+    window = fetch_message_window(st.session_state['thread_id'], before=st.session_state['history_before'])
+    st.session_state['message_history'][:0] = history_from_window(window)
+    st.session_state['history_before'] = window.before
+
 # ----------- Session History ----------- #
+# a rerun while an answer was streaming (Stop, thread switch, reload)
+# abandons it: cancel the generation instead of letting it run on
+cancel_stale_stream(st.session_state)
+
 if 'message_history' not in st.session_state:
     st.session_state['message_history'] = []
 
+# only the latest window is rendered; earlier messages load on request
+if st.session_state.get('history_before') is not None:
+    if st.button('Load earlier messages', key='history-load-earlier'):
+        load_earlier_messages()
+        st.rerun()
+
 for message in st.session_state['message_history']:
     with st.chat_message(message['role']):
         st.markdown(message['content'])
@@ -233,13 +163,12 @@ for message in st.session_state['message_history']:
 if 'thread_id' not in st.session_state:
     st.session_state['thread_id'] = get_thread_id()
 
-# On first load populate chat_threads and thread_labels from DB (lightweight)
+# On first load populate chat_threads and thread_labels with the most recent page
 if 'chat_threads' not in st.session_state:
-    initial_threads = fetch_all_threads()
     st.session_state['chat_threads'] = []
     st.session_state['thread_labels'] = {}
-    for tid in initial_threads:
-        add_thread(tid, label=None)
+    st.session_state['threads_cursor'] = None
+    load_more_threads()
 
 # Ensure the current thread is present
 add_thread(st.session_state['thread_id'])
@@ -249,6 +178,15 @@ st.sidebar.title('ChatArena')
 if st.sidebar.button('New chat'):
     reset_chat()
 
+# Full-text search over every message, served by the backend's message index
+search_query = st.sidebar.text_input('Search chats', key='thread-search')
+if search_query.strip():
+    for hit in search_threads(search_query):
+        hit_id = str(hit['thread_id'])
+        if st.sidebar.button(truncate_label(hit['title'] or hit_id), key=f"search-btn-{hit_id}"):
+            open_thread(hit_id)
+        st.sidebar.caption(hit['snippet'])
+
 st.sidebar.header('Conversation History')
 
 # Render sidebar with labels from session_state only (no DB calls during render)
@@ -257,35 +195,13 @@ for i in range(len(st.session_state['chat_threads']) - 1, -1, -1):
     label = st.session_state.get('thread_labels', {}).get(tid, truncate_label(tid))
     # st.sidebar.button returns True on click; do NOT call DB while rendering other widgets
     if st.sidebar.button(label, key=f"thread-btn-{tid}"):
-        # user clicked the thread: load messages (safe to hit DB now)
-        thread_id = tid
-        st.session_state['thread_id'] = thread_id
+        open_thread(tid)
 
-        # Attempt to load messages via chatbot.get_state (keeps your existing reconnection logic)
-        try:
-            messages = get_messages(thread_id)
-        except Exception as e:
-            st.error(f"Failed to load thread messages: {e}")
-            messages = []
-
-        temp_messages = []
-        for message in messages:
-            if isinstance(message, HumanMessage):
-                role = 'user'
-            else:
-                role = 'assistant'
-            # message.content may not exist for all objects, guard it
-            content = getattr(message, "content", str(message))
-            temp_messages.append({'role': role, 'content': content})
-        st.session_state['message_history'] = temp_messages
-
-        # update the label for this thread now that we loaded messages
-        if temp_messages:
-            first = temp_messages[0]['content']
-            st.session_state['thread_labels'][thread_id] = truncate_label(first)
-        else:
-            # leave existing label or set tid
-            st.session_state['thread_labels'].setdefault(thread_id, truncate_label(thread_id))
+# Older threads are fetched one page at a time, only when asked for
+if st.session_state['threads_cursor'] is not None:
+    if st.sidebar.button('Load older chats', key='threads-load-more'):
+        load_more_threads()
+        st.rerun()
 
 # ----------- User input ---------- #
 user_input = st.chat_input('Type here')
@@ -304,20 +220,22 @@ if user_input:
 
     with st.chat_message('assistant'):
         status_holder = {"box": None}
-        def ai_response():
-            #use safe_stream_call that will reload backend on OperationalError and retry
-            stream_gen = safe_stream_call({'messages': [HumanMessage(content=user_input)]}, config=config, stream_mode='messages')
-            for message_chunk, metadata in stream_gen:
-                if isinstance(message_chunk, ToolMessage):
-                    tool_name = getattr(message_chunk, "name", "tool")
-                    if status_holder['box'] is None:
-                        status_holder['box'] = st.status(f"🔨 Using {tool_name} ...", expanded=True)
-                    else:
-                        status_holder['box'].update(label=f"🔨 Using {tool_name} ...", state="running", expanded=True)
-                if isinstance(message_chunk, AIMessage):
-                    yield message_chunk.content
-
-        ai_message = st.write_stream(ai_response)
+        def show_tool(tool_name):
+            if status_holder['box'] is None:
+                status_holder['box'] = st.status(f"🔨 Using {tool_name} ...", expanded=True)
+            else:
+                status_holder['box'].update(label=f"🔨 Using {tool_name} ...", state="running", expanded=True)
+
+        # the sync stream runs in a worker thread; tokens reach the UI in batches
+        stream_gen = safe_stream_call({'messages': [HumanMessage(content=user_input)]}, config=config, stream_mode='messages')
+        # clicking Stop reruns the script; cancel_stale_stream() then stops this answer
+        stop_slot = st.empty()
+        stop_slot.button("⏹ Stop", key="stop-generation")
+        handle = StreamHandle()
+        st.session_state[ACTIVE_STREAM_KEY] = handle
+        ai_message = st.write_stream(coalesced_text(stream_gen, on_tool=show_tool, handle=handle))
+        stop_slot.empty()
+        st.session_state.pop(ACTIVE_STREAM_KEY, None)
         if status_holder['box'] is not None:
             status_holder['box'].update(label=f"🔨 Tool finished ...", state="complete", expanded=False)
         st.session_state['message_history'].append({'role': 'assistant', 'content': ai_message})
@@ -0,0 +1,51 @@
+"""
+batch_qa.py end to end on a tiny prompt file, against the database in DB_URL.
+
+The prompts are calculator questions, answered by the fast path without a
+model call, so a placeholder GOOGLE_API_KEY is enough.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.mark.skipif(not os.environ.get("DB_URL"), reason="the RAG backend connects to DB_URL on import")
+def test_batch_run_and_resume(tmp_path):
+    prompts = tmp_path / "prompts.jsonl"
+    prompts.write_text(
+        json.dumps({"id": "mul", "prompt": "what is 12 * 7"}) + "\n"
+        + json.dumps({"prompt": "add 3 and 9"}) + "\n",
+        encoding="utf-8",
+    )
+    output = tmp_path / "answers.jsonl"
+    env = {**os.environ, "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY") or "placeholder"}
+
+    def run() -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [sys.executable, "batch_qa.py", str(prompts), "--output", str(output), "--concurrency", "2"],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=180,
+        )
+
+    result = run()
+    assert result.returncode == 0, result.stderr[-2000:]
+    rows = {row["id"]: row for row in map(json.loads, output.read_text(encoding="utf-8").splitlines())}
+    assert set(rows) == {"mul", "line-2"}
+    assert rows["mul"]["status"] == "ok" and "84" in rows["mul"]["answer"]
+    assert rows["mul"]["tools"] == ["calculator"]
+    assert rows["line-2"]["thread_id"].startswith("batch:")
+
+    # answered ids are skipped on the next run
+    result = run()
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert "resuming: 2 prompts" in result.stdout
+    assert len(output.read_text(encoding="utf-8").splitlines()) == 2
@@ -0,0 +1,47 @@
+"""
+Import smoke test: every backend, the API server and the batch runner load.
+
+The backends build their graph and connect to the checkpoint database at
+import time, so a module-level mistake (a name used before it is defined)
+only shows up when the module is imported. Each module is imported in its
+own interpreter, against the database in DB_URL:
+
+    DB_URL=postgresql://... python -m pytest -q tests
+
+No model is called, so a placeholder GOOGLE_API_KEY is enough.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODULES = [
+    "langgraph_backend",
+    "langgraph_database_backend",
+    "langgraph_database_backend1",
+    "langgraph_mcp_backend1",
+    "langgraph_mcp_backend2",
+    "langgraph_rag_backend",
+    "api_server",
+    "batch_qa",
+]
+
+
+@pytest.mark.skipif(not os.environ.get("DB_URL"), reason="the backends connect to DB_URL on import")
+@pytest.mark.parametrize("module", MODULES)
+def test_module_imports(module):
+    env = {**os.environ, "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY") or "placeholder"}
+    # os._exit: the backends' loop threads and pools would otherwise hold the interpreter open
+    result = subprocess.run(
+        [sys.executable, "-c", f"import os, {module}; os._exit(0)"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=180,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
@@ -0,0 +1,489 @@
+"""
+Thread catalog maintained on checkpoint writes.
+
+Listing threads used to mean `SELECT DISTINCT thread_id FROM checkpoints`
+(or walking every checkpoint with alist(None)), a scan of the biggest table
+on every new session. CatalogCheckpointSaver upserts one row per thread into
+a small `threads` table each time a root checkpoint is written, so listing
+is an index-only query whose cost does not grow with message volume.
+"""
+import threading
+from datetime import datetime, timezone
+from typing import Any, Iterable, NamedTuple, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint
+
+from checkpointers import DelegatingCheckpointSaver, written_with_checkpoint
+
+TITLE_MAX_LEN = 200
+THREADS_PAGE_SIZE = 20
+
+
+class ThreadPage(NamedTuple):
+    """One page of threads, most recently active first.
+
+    `next_cursor` is the (updated_at, thread_id) of the last row, to pass as
+    `before` for the next page; None once there are no older threads.
+    """
+
+    threads: list[dict]
+    next_cursor: Optional[tuple]
+
+
+def _page(rows: list[dict], limit: int) -> ThreadPage:
+    # one extra row was fetched to know whether an older page exists
+    if limit <= 0:
+        return ThreadPage([], None)
+    threads = rows[:limit]
+    has_more = len(rows) > limit
+    cursor = (threads[-1]["updated_at"], threads[-1]["thread_id"]) if has_more else None
+    return ThreadPage(threads, cursor)
+
+
+def message_text(content: Any) -> str:
+    """Plain text of a message content (str or list of content blocks)."""
+    if isinstance(content, str):
+        return content
+    texts = []
+
+    def walk(node):
+        if isinstance(node, str):
+            texts.append(node)
+        elif isinstance(node, dict):
+            if node.get("type") == "text" and "text" in node:
+                texts.append(node["text"])
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(content)
+    return "".join(texts)
+
+
+def summarize_checkpoint(checkpoint: Checkpoint) -> Optional[dict]:
+    """Catalog fields derived from a checkpoint, None if it holds no messages yet."""
+    messages: list[BaseMessage] = checkpoint["channel_values"].get("messages") or []
+    if not messages:
+        return None
+    title = next(
+        (message_text(m.content) for m in messages if isinstance(m, HumanMessage)),
+        None,
+    )
+    return {
+        "title": title[:TITLE_MAX_LEN] if title else None,
+        "message_count": len(messages),
+    }
+
+
+# ----------- SQLite ----------- #
+SQLITE_SETUP = (
+    """CREATE TABLE IF NOT EXISTS threads (
+        thread_id TEXT PRIMARY KEY,
+        title TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        has_document INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS threads_updated_at_idx ON threads(updated_at, thread_id)",
+)
+
+SQLITE_UPSERT = """
+    INSERT INTO threads (thread_id, title, created_at, updated_at, message_count)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (thread_id) DO UPDATE SET
+        title = COALESCE(threads.title, excluded.title),
+        updated_at = excluded.updated_at,
+        message_count = excluded.message_count
+"""
+
+SQLITE_PAGE_COLUMNS = "SELECT thread_id, title, updated_at, message_count, has_document FROM threads"
+SQLITE_PAGE_FIRST = SQLITE_PAGE_COLUMNS + " ORDER BY updated_at DESC, thread_id DESC LIMIT ?"
+SQLITE_PAGE_BEFORE = (
+    SQLITE_PAGE_COLUMNS
+    + " WHERE (updated_at, thread_id) < (?, ?) ORDER BY updated_at DESC, thread_id DESC LIMIT ?"
+)
+
+SQLITE_MARK_DOCUMENT = """
+    INSERT INTO threads (thread_id, created_at, updated_at, has_document)
+    VALUES (?, ?, ?, 1)
+    ON CONFLICT (thread_id) DO UPDATE SET has_document = 1, updated_at = excluded.updated_at
+"""
+
+
+def _sqlite_time(moment: datetime) -> str:
+    # fixed width so lexical order == time order
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _sqlite_now() -> str:
+    return _sqlite_time(datetime.now(timezone.utc))
+
+
+class SqliteThreadCatalog:
+    """Catalog stored next to the checkpoints of a SqliteSaver / PooledSqliteSaver."""
+
+    def __init__(self, saver: BaseCheckpointSaver) -> None:
+        self.saver = saver
+
+    def setup(self) -> None:
+        with self.saver.cursor() as cur:
+            for statement in SQLITE_SETUP:
+                cur.execute(statement)
+            empty = cur.execute("SELECT 1 FROM threads LIMIT 1").fetchone() is None
+        if empty:
+            self._backfill()
+
+    def _checkpoint_time(self, thread_id: str, checkpoint_id: str) -> str:
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": checkpoint_id}}
+        saved = self.saver.get_tuple(config)
+        if saved is None or not saved.checkpoint.get("ts"):
+            return _sqlite_now()
+        return _sqlite_time(datetime.fromisoformat(saved.checkpoint["ts"]))
+
+    def _backfill(self) -> None:
+        # first run on an existing database: register the threads we already have,
+        # dated by their first and latest checkpoints (the blobs are serialized, so
+        # `ts` is read through the saver rather than in SQL)
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute(
+                "SELECT thread_id, min(checkpoint_id), max(checkpoint_id) FROM checkpoints "
+                "WHERE checkpoint_ns = '' GROUP BY thread_id"
+            )
+            bounds = cur.fetchall()
+        rows = [
+            (thread_id, self._checkpoint_time(thread_id, first), self._checkpoint_time(thread_id, latest))
+            for thread_id, first, latest in bounds
+        ]
+        with self.saver.cursor() as cur:
+            cur.executemany(
+                "INSERT OR IGNORE INTO threads (thread_id, created_at, updated_at) VALUES (?, ?, ?)", rows
+            )
+
+    def upsert_statement(self, thread_id: str, title: Optional[str], message_count: int) -> tuple[str, tuple]:
+        now = _sqlite_now()
+        return SQLITE_UPSERT, (str(thread_id), title, now, now, message_count)
+
+    def upsert(self, thread_id: str, title: Optional[str], message_count: int) -> None:
+        with self.saver.cursor() as cur:
+            cur.execute(*self.upsert_statement(thread_id, title, message_count))
+
+    def mark_document(self, thread_id: str) -> None:
+        now = _sqlite_now()
+        with self.saver.cursor() as cur:
+            cur.execute(SQLITE_MARK_DOCUMENT, (str(thread_id), now, now))
+
+    def delete(self, thread_id: str) -> None:
+        with self.saver.cursor() as cur:
+            cur.execute("DELETE FROM threads WHERE thread_id = ?", (str(thread_id),))
+
+    def list_thread_ids(self) -> list[str]:
+        """All thread ids, least recently active first."""
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute("SELECT thread_id FROM threads ORDER BY updated_at, thread_id")
+            return [row[0] for row in cur.fetchall()]
+
+    def list_threads_page(self, limit: int = THREADS_PAGE_SIZE, before: Optional[tuple] = None) -> ThreadPage:
+        """Threads older than `before`, newest first, walking the updated_at index."""
+        with self.saver.cursor(transaction=False) as cur:
+            if before is None:
+                cur.execute(SQLITE_PAGE_FIRST, (limit + 1,))
+            else:
+                cur.execute(SQLITE_PAGE_BEFORE, (*before, limit + 1))
+            columns = [c[0] for c in cur.description]
+            rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        for row in rows:
+            row["has_document"] = bool(row["has_document"])
+        return _page(rows, limit)
+
+    def get_thread_titles(self, thread_ids: Iterable[Any]) -> dict[str, Optional[str]]:
+        """Stored titles for `thread_ids` in one query; unknown ids are left out."""
+        ids = list({str(tid) for tid in thread_ids})
+        if not ids:
+            return {}
+        with self.saver.cursor(transaction=False) as cur:
+            # one bound parameter per id; sidebar-sized sets stay far below SQLite's limit
+            cur.execute(
+                f"SELECT thread_id, title FROM threads WHERE thread_id IN ({','.join('?' * len(ids))})",
+                ids,
+            )
+            return dict(cur.fetchall())
+
+
+# ----------- Postgres ----------- #
+POSTGRES_SETUP = (
+    """CREATE TABLE IF NOT EXISTS threads (
+        thread_id TEXT PRIMARY KEY,
+        title TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        message_count INTEGER NOT NULL DEFAULT 0,
+        has_document BOOLEAN NOT NULL DEFAULT false
+    )""",
+    "CREATE INDEX IF NOT EXISTS threads_updated_at_idx ON threads(updated_at, thread_id)",
+)
+
+POSTGRES_BACKFILL = """
+    INSERT INTO threads (thread_id, created_at, updated_at)
+    SELECT thread_id, min((checkpoint->>'ts')::timestamptz), max((checkpoint->>'ts')::timestamptz)
+    FROM checkpoints
+    WHERE checkpoint_ns = ''
+    GROUP BY thread_id
+    ON CONFLICT (thread_id) DO NOTHING
+"""
+
+POSTGRES_UPSERT = """
+    INSERT INTO threads (thread_id, title, message_count)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (thread_id) DO UPDATE SET
+        title = COALESCE(threads.title, EXCLUDED.title),
+        updated_at = clock_timestamp(),
+        message_count = EXCLUDED.message_count
+"""
+
+POSTGRES_MARK_DOCUMENT = """
+    INSERT INTO threads (thread_id, has_document)
+    VALUES (%s, true)
+    ON CONFLICT (thread_id) DO UPDATE SET has_document = true, updated_at = clock_timestamp()
+"""
+
+POSTGRES_LIST_IDS = "SELECT thread_id FROM threads ORDER BY updated_at, thread_id"
+
+POSTGRES_TITLES = "SELECT thread_id, title FROM threads WHERE thread_id = ANY(%s)"
+
+POSTGRES_PAGE_COLUMNS = "SELECT thread_id, title, updated_at, message_count, has_document FROM threads"
+POSTGRES_PAGE_FIRST = POSTGRES_PAGE_COLUMNS + " ORDER BY updated_at DESC, thread_id DESC LIMIT %s"
+POSTGRES_PAGE_BEFORE = (
+    POSTGRES_PAGE_COLUMNS
+    + " WHERE (updated_at, thread_id) < (%s, %s) ORDER BY updated_at DESC, thread_id DESC LIMIT %s"
+)
+
+
+def _postgres_page_query(limit: int, before: Optional[tuple]) -> tuple[str, tuple]:
+    if before is None:
+        return POSTGRES_PAGE_FIRST, (limit + 1,)
+    return POSTGRES_PAGE_BEFORE, (*before, limit + 1)
+
+
+class PostgresThreadCatalog:
+    """Catalog for a sync PostgresSaver; runs on the saver's own connections."""
+
+    def __init__(self, saver: BaseCheckpointSaver) -> None:
+        self.saver = saver
+
+    def setup(self) -> None:
+        with self.saver._cursor() as cur:
+            for statement in POSTGRES_SETUP:
+                cur.execute(statement)
+            if cur.execute("SELECT 1 FROM threads LIMIT 1").fetchone() is None:
+                cur.execute(POSTGRES_BACKFILL)
+
+    def upsert_statement(self, thread_id: str, title: Optional[str], message_count: int) -> tuple[str, tuple]:
+        return POSTGRES_UPSERT, (str(thread_id), title, message_count)
+
+    def upsert(self, thread_id: str, title: Optional[str], message_count: int) -> None:
+        with self.saver._cursor() as cur:
+            cur.execute(*self.upsert_statement(thread_id, title, message_count))
+
+    def mark_document(self, thread_id: str) -> None:
+        with self.saver._cursor() as cur:
+            cur.execute(POSTGRES_MARK_DOCUMENT, (str(thread_id),))
+
+    def delete(self, thread_id: str) -> None:
+        with self.saver._cursor() as cur:
+            cur.execute("DELETE FROM threads WHERE thread_id = %s", (str(thread_id),))
+
+    def list_thread_ids(self) -> list[str]:
+        with self.saver._cursor() as cur:
+            cur.execute(POSTGRES_LIST_IDS)
+            return [row["thread_id"] for row in cur.fetchall()]
+
+    def list_threads_page(self, limit: int = THREADS_PAGE_SIZE, before: Optional[tuple] = None) -> ThreadPage:
+        with self.saver._cursor() as cur:
+            cur.execute(*_postgres_page_query(limit, before))
+            return _page(cur.fetchall(), limit)
+
+    def get_thread_titles(self, thread_ids: Iterable[Any]) -> dict[str, Optional[str]]:
+        ids = list({str(tid) for tid in thread_ids})
+        if not ids:
+            return {}
+        with self.saver._cursor() as cur:
+            cur.execute(POSTGRES_TITLES, (ids,))
+            return {row["thread_id"]: row["title"] for row in cur.fetchall()}
+
+
+class AsyncPostgresThreadCatalog:
+    """Catalog for an AsyncPostgresSaver; runs on the saver's own connections."""
+
+    def __init__(self, saver: BaseCheckpointSaver) -> None:
+        self.saver = saver
+
+    async def asetup(self) -> None:
+        async with self.saver._cursor() as cur:
+            for statement in POSTGRES_SETUP:
+                await cur.execute(statement)
+            await cur.execute("SELECT 1 FROM threads LIMIT 1")
+            if await cur.fetchone() is None:
+                await cur.execute(POSTGRES_BACKFILL)
+
+    def upsert_statement(self, thread_id: str, title: Optional[str], message_count: int) -> tuple[str, tuple]:
+        return POSTGRES_UPSERT, (str(thread_id), title, message_count)
+
+    async def aupsert(self, thread_id: str, title: Optional[str], message_count: int) -> None:
+        async with self.saver._cursor() as cur:
+            await cur.execute(*self.upsert_statement(thread_id, title, message_count))
+
+    async def amark_document(self, thread_id: str) -> None:
+        async with self.saver._cursor() as cur:
+            await cur.execute(POSTGRES_MARK_DOCUMENT, (str(thread_id),))
+
+    async def adelete(self, thread_id: str) -> None:
+        async with self.saver._cursor() as cur:
+            await cur.execute("DELETE FROM threads WHERE thread_id = %s", (str(thread_id),))
+
+    async def alist_thread_ids(self) -> list[str]:
+        async with self.saver._cursor() as cur:
+            await cur.execute(POSTGRES_LIST_IDS)
+            return [row["thread_id"] for row in await cur.fetchall()]
+
+    async def alist_threads_page(
+        self, limit: int = THREADS_PAGE_SIZE, before: Optional[tuple] = None
+    ) -> ThreadPage:
+        async with self.saver._cursor() as cur:
+            await cur.execute(*_postgres_page_query(limit, before))
+            return _page(await cur.fetchall(), limit)
+
+    async def aget_thread_titles(self, thread_ids: Iterable[Any]) -> dict[str, Optional[str]]:
+        ids = list({str(tid) for tid in thread_ids})
+        if not ids:
+            return {}
+        async with self.saver._cursor() as cur:
+            await cur.execute(POSTGRES_TITLES, (ids,))
+            return {row["thread_id"]: row["title"] for row in await cur.fetchall()}
+
+
+# ----------- In memory ----------- #
+class InMemoryThreadCatalog:
+    """Catalog for an InMemorySaver: a dict that lives as long as the saver."""
+
+    def __init__(self) -> None:
+        self.threads: dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def setup(self) -> None:
+        pass
+
+    def _row(self, thread_id: str) -> dict:
+        now = _sqlite_now()
+        return self.threads.setdefault(str(thread_id), {
+            "thread_id": str(thread_id), "title": None, "created_at": now,
+            "updated_at": now, "message_count": 0, "has_document": False,
+        })
+
+    def upsert(self, thread_id: str, title: Optional[str], message_count: int) -> None:
+        with self.lock:
+            row = self._row(thread_id)
+            row["title"] = row["title"] or title
+            row["updated_at"] = _sqlite_now()
+            row["message_count"] = message_count
+
+    def mark_document(self, thread_id: str) -> None:
+        with self.lock:
+            row = self._row(thread_id)
+            row["has_document"] = True
+            row["updated_at"] = _sqlite_now()
+
+    def delete(self, thread_id: str) -> None:
+        with self.lock:
+            self.threads.pop(str(thread_id), None)
+
+    def _ordered(self) -> list[dict]:
+        with self.lock:
+            rows = [dict(row) for row in self.threads.values()]
+        return sorted(rows, key=lambda row: (row["updated_at"], row["thread_id"]))
+
+    def list_thread_ids(self) -> list[str]:
+        return [row["thread_id"] for row in self._ordered()]
+
+    def list_threads_page(self, limit: int = THREADS_PAGE_SIZE, before: Optional[tuple] = None) -> ThreadPage:
+        rows = self._ordered()[::-1]
+        if before is not None:
+            rows = [row for row in rows if (row["updated_at"], row["thread_id"]) < tuple(before)]
+        return _page(rows[: limit + 1], limit)
+
+    def get_thread_titles(self, thread_ids: Iterable[Any]) -> dict[str, Optional[str]]:
+        with self.lock:
+            return {
+                str(tid): self.threads[str(tid)]["title"]
+                for tid in thread_ids
+                if str(tid) in self.threads
+            }
+
+    # InMemorySaver also serves the async API
+    async def aupsert(self, thread_id: str, title: Optional[str], message_count: int) -> None:
+        self.upsert(thread_id, title, message_count)
+
+    async def adelete(self, thread_id: str) -> None:
+        self.delete(thread_id)
+
+
+# ----------- Checkpointer hook ----------- #
+class CatalogCheckpointSaver(DelegatingCheckpointSaver):
+    """
+    Upsert the thread's catalog row with every root checkpoint write.
+
+    With the repo's SQL savers the upsert runs on the checkpoint's own
+    cursor and commits with it (checkpointers.written_with_checkpoint): no
+    extra round trip, and no checkpoint without its catalog row. Other
+    savers (InMemorySaver, a plain AsyncPostgresSaver) get a separate upsert
+    right after the write.
+
+    Runs configured with `configurable.catalog = False` (batch_qa.py) keep
+    their checkpoints but stay out of the catalog and the sidebars.
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver, catalog: Any) -> None:
+        super().__init__(saver)
+        self.catalog = catalog
+
+    @staticmethod
+    def _catalog_fields(config: RunnableConfig, checkpoint: Checkpoint) -> Optional[dict]:
+        if config["configurable"].get("checkpoint_ns", ""):
+            return None  # subgraph checkpoints belong to the parent thread
+        if config["configurable"].get("catalog") is False:
+            return None
+        return summarize_checkpoint(checkpoint)
+
+    def _statements(self, thread_id: str, fields: Optional[dict]) -> list[tuple[str, tuple]]:
+        upsert_statement = getattr(self.catalog, "upsert_statement", None)
+        if not fields or upsert_statement is None:
+            return []
+        return [upsert_statement(thread_id, **fields)]
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        fields = self._catalog_fields(config, checkpoint)
+        with written_with_checkpoint(self._statements(thread_id, fields)) as pending:
+            next_config = self.saver.put(config, checkpoint, metadata, new_versions)
+        if fields and not pending.written:
+            self.catalog.upsert(thread_id, **fields)
+        return next_config
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        fields = self._catalog_fields(config, checkpoint)
+        with written_with_checkpoint(self._statements(thread_id, fields)) as pending:
+            next_config = await self.saver.aput(config, checkpoint, metadata, new_versions)
+        if fields and not pending.written:
+            await self.catalog.aupsert(thread_id, **fields)
+        return next_config
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.saver.delete_thread(thread_id)
+        self.catalog.delete(thread_id)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self.saver.adelete_thread(thread_id)
+        await self.catalog.adelete(thread_id)
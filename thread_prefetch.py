@@ -0,0 +1,107 @@
+"""
+Background prefetch of recently active threads.
+
+After a session starts, ThreadPrefetcher walks the K most recently active
+threads from the catalog on the backend event loop and loads their latest
+checkpoint through CachedCheckpointSaver. Opening one of them (its message
+window, then the next turn's aget_tuple) is then served from memory.
+
+A prefetch adds at most PREFETCH_MAX_ENTRIES checkpoints to the cache
+(threads already cached don't count); the cache's own LRU makes room for
+them. It stops early when the process RSS crosses PREFETCH_MAX_RSS_MB.
+With the cache off (CHECKPOINT_CACHE unset) there is nothing to warm and
+a prefetch returns at once.
+Each caller (a browser session) has at most one prefetch running: a new
+submit() cancels that caller's earlier one, never another session's.
+"""
+import asyncio
+import os
+from concurrent.futures import Future
+from typing import Hashable, Iterable, Optional
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+try:
+    import psutil
+except ImportError:  # optional dependency
+    psutil = None
+
+DEFAULT_PREFETCH_THREADS = 10
+DEFAULT_MAX_RSS_MB = 1024
+DEFAULT_MAX_ENTRIES = 32
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident memory of this process, None when it can't be measured."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ThreadPrefetcher:
+    """Warm the checkpoint cache of a CachedCheckpointSaver for recent threads."""
+
+    def __init__(
+        self,
+        checkpointer: BaseCheckpointSaver,
+        k: Optional[int] = None,
+        max_rss_mb: Optional[int] = None,
+        max_entries: Optional[int] = None,
+    ) -> None:
+        self.checkpointer = checkpointer
+        self.k = k or int(os.environ.get("PREFETCH_THREADS", DEFAULT_PREFETCH_THREADS))
+        self.max_rss_mb = max_rss_mb or int(os.environ.get("PREFETCH_MAX_RSS_MB", DEFAULT_MAX_RSS_MB))
+        self.max_entries = max_entries or int(os.environ.get("PREFETCH_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        self._futures: dict[Hashable, Future] = {}
+        self.warmed = 0
+
+    def _stop_reason(self, added: int) -> Optional[str]:
+        if added >= self.max_entries:
+            return f"added {added} checkpoints to the cache"
+        rss = rss_bytes()
+        if rss is not None and rss > self.max_rss_mb * 1024 * 1024:
+            return f"memory pressure (rss {rss // (1024 * 1024)} MiB)"
+        return None
+
+    async def aprefetch(self, thread_ids: Iterable[str]) -> int:
+        """Load the latest checkpoint of each thread; returns how many were added to the cache."""
+        warmed = 0
+        for thread_id in thread_ids:
+            if self.checkpointer.peek(str(thread_id)) is not None:
+                continue  # already warm, nothing to load
+            if reason := self._stop_reason(warmed):
+                print(f"[thread_prefetch] stopped after {warmed} threads: {reason}")
+                break
+            config = {"configurable": {"thread_id": str(thread_id), "checkpoint_ns": ""}}
+            if await self.checkpointer.aget_tuple(config) is not None:
+                warmed += 1
+            # one query at a time, so interactive requests on the loop go first
+            await asyncio.sleep(0)
+        self.warmed += warmed
+        return warmed
+
+    async def aprefetch_recent(self, k: Optional[int] = None) -> int:
+        if not getattr(self.checkpointer, "enabled", True):
+            return 0
+        page = await self.checkpointer.catalog.alist_threads_page(limit=k or self.k)
+        return await self.aprefetch(row["thread_id"] for row in page.threads)
+
+    def submit(self, loop: asyncio.AbstractEventLoop, k: Optional[int] = None, caller: Hashable = None) -> Future:
+        """Schedule aprefetch_recent() on `loop`, cancelling `caller`'s prefetch still running."""
+        self.cancel(caller)
+        future = self._futures[caller] = asyncio.run_coroutine_threadsafe(self.aprefetch_recent(k), loop)
+        future.add_done_callback(lambda done: self._forget(caller, done))
+        return future
+
+    def _forget(self, caller: Hashable, future: Future) -> None:
+        if self._futures.get(caller) is future:
+            del self._futures[caller]
+
+    def cancel(self, caller: Hashable = None) -> None:
+        future = self._futures.get(caller)
+        if future is not None and not future.done():
+            future.cancel()
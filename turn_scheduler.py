@@ -0,0 +1,190 @@
+"""
+One graph run at a time per thread.
+
+Two runs of `chatbot.astream` on the same thread_id both start from the same
+checkpoint, and the one that finishes last overwrites the other's messages.
+That happens when a message is sent while the previous answer is still
+streaming, or when the same chat is open in two tabs.
+
+TurnScheduler sits in front of the compiled graph. Runs on different threads
+still go concurrently. On one thread, a message sent while a turn runs is
+queued for the next turn, and every message that arrives before that turn
+starts is merged into it, so the model answers them all in one run instead of
+one run per message. Everyone who submitted a message to a turn receives that
+turn's stream.
+
+An optional `after_turn(config)` coroutine runs in its own task once a turn
+has finished streaming, for bookkeeping that must not race a run on the
+thread (context_window's rolling summary). It is skipped while messages are
+already waiting. The next turn does not wait for it: a turn that starts
+cancels the thread's after_turn task and runs as soon as it has stopped, and
+the summary is folded after a later turn instead.
+
+The scheduler is in-process and lives on the backend event loop. With several
+server processes, a thread's requests have to be routed to one of them.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from langgraph.graph.state import CompiledStateGraph
+
+DEFAULT_QUEUE_SIZE = 256
+BACKPRESSURE_POLL = 0.01  # seconds between retries while a listener's queue is full
+
+_DONE = object()
+
+
+class _Turn:
+    def __init__(self, config: dict) -> None:
+        self.config = config
+        self.messages: list = []
+        self.subscribers: list[asyncio.Queue] = []
+
+
+class _ThreadTurns:
+    def __init__(self) -> None:
+        self.pending: Optional[_Turn] = None
+        self.running: Optional[_Turn] = None
+        self.run_task: Optional[asyncio.Task] = None
+        self.worker: Optional[asyncio.Task] = None
+
+
+class TurnScheduler:
+    """Serialize graph runs per thread_id, merging queued messages into the next turn."""
+
+    def __init__(
+        self,
+        chatbot: CompiledStateGraph,
+        stream_mode: str = "messages",
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        after_turn: Optional[Callable[[dict], Awaitable[Any]]] = None,
+    ) -> None:
+        self.chatbot = chatbot
+        self.stream_mode = stream_mode
+        self.queue_size = queue_size
+        self.after_turn = after_turn
+        self._threads: dict[str, _ThreadTurns] = {}
+        self._after_turns: dict[str, asyncio.Task] = {}
+
+    def is_running(self, thread_id: str) -> bool:
+        state = self._threads.get(str(thread_id))
+        return state is not None and state.running is not None
+
+    def queue_depth(self, thread_id: str) -> int:
+        """Messages waiting for the next turn of a thread."""
+        state = self._threads.get(str(thread_id))
+        return len(state.pending.messages) if state is not None and state.pending is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "running_threads": sum(state.running is not None for state in self._threads.values()),
+            "queued_messages": sum(self.queue_depth(thread_id) for thread_id in self._threads),
+            "after_turn_tasks": len(self._after_turns),
+        }
+
+    async def astream(self, input: dict, config: dict, **_ignored: Any) -> AsyncIterator:
+        """
+        Drop-in for chatbot.astream(input, config, stream_mode=...): yields the
+        stream of the turn that answers `input["messages"]`. Closing the
+        iterator unsubscribes; a turn nobody listens to any more is cancelled,
+        or dropped if it had not started.
+        """
+        thread_id = str(config["configurable"]["thread_id"])
+        state = self._threads.setdefault(thread_id, _ThreadTurns())
+        if state.pending is None:
+            state.pending = _Turn(config)
+        turn = state.pending
+        turn.messages.extend(input["messages"])
+        events: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        turn.subscribers.append(events)
+        if state.worker is None:
+            state.worker = asyncio.create_task(self._work(thread_id, state))
+        elif state.running is not None:
+            print(f"[turn_scheduler] {thread_id}: {self.queue_depth(thread_id)} message(s) queued behind the running turn")
+        try:
+            while (item := await events.get()) is not _DONE:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self._unsubscribe(state, turn, events)
+
+    def _unsubscribe(self, state: _ThreadTurns, turn: _Turn, events: asyncio.Queue) -> None:
+        if events in turn.subscribers:
+            turn.subscribers.remove(events)
+        if turn.subscribers:
+            return
+        if turn is state.running and state.run_task is not None:
+            state.run_task.cancel()
+        elif turn is state.pending:
+            # nobody is waiting for the answer: don't spend a run on it
+            state.pending = None
+
+    async def _work(self, thread_id: str, state: _ThreadTurns) -> None:
+        try:
+            while state.pending is not None:
+                await self._cancel_after_turn(thread_id)
+                turn, state.pending = state.pending, None
+                state.running = turn
+                state.run_task = asyncio.create_task(self._run(turn))
+                try:
+                    await state.run_task
+                except asyncio.CancelledError:
+                    if not state.run_task.cancelled():
+                        raise  # the worker itself was cancelled
+                finally:
+                    state.running = state.run_task = None
+                if self.after_turn is not None and state.pending is None:
+                    self._start_after_turn(thread_id, turn.config)
+        finally:
+            state.worker = None
+            if state.pending is None:
+                self._threads.pop(thread_id, None)
+
+    def _start_after_turn(self, thread_id: str, config: dict) -> None:
+        async def after_turn() -> None:
+            try:
+                await self.after_turn(config)
+            except Exception as exc:
+                print(f"[turn_scheduler] {thread_id}: after_turn failed: {exc}")
+
+        task = self._after_turns[thread_id] = asyncio.create_task(after_turn())
+        task.add_done_callback(
+            lambda done: self._after_turns.pop(thread_id) if self._after_turns.get(thread_id) is done else None
+        )
+
+    async def _cancel_after_turn(self, thread_id: str) -> None:
+        # its writes must not land while the next run works on the thread
+        task = self._after_turns.get(thread_id)
+        if task is None or task.done():
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+
+    async def _run(self, turn: _Turn) -> None:
+        stream = self.chatbot.astream(
+            {"messages": turn.messages}, config=turn.config, stream_mode=self.stream_mode
+        )
+        try:
+            async for item in stream:
+                await _broadcast(turn, item)
+        except Exception as exc:
+            await _broadcast(turn, exc)
+        finally:
+            await stream.aclose()
+        await _broadcast(turn, _DONE)
+
+
+async def _broadcast(turn: _Turn, item: Any) -> None:
+    # the slowest listener paces the run; one that leaves stops holding it up
+    for events in list(turn.subscribers):
+        while events in turn.subscribers:
+            try:
+                events.put_nowait(item)
+                break
+            except asyncio.QueueFull:
+                await asyncio.sleep(BACKPRESSURE_POLL)